@@ -0,0 +1,375 @@
+"""
+Scaling benchmarks for the VSP and VHD strategies on every execution backend.
+
+Each configuration (strategy, backend, workers, qubits, ansatz reps, Hamiltonian terms)
+runs in a fresh subprocess, so that its peak RSS and cluster start-up are its own, and
+records:
+
+- wall_time_s: time of the whole strategy run, backend start-up excluded
+- evaluations / evaluations_per_s: objective calls summed over all optimizations
+- queue_latency_s: median round trip of a single one-row evaluation through the
+  backend, minus the same evaluation run directly
+- peak_rss_mb: peak resident memory of the benchmark process and of its largest
+  child process (process-pool, Dask and Redis worker processes)
+- speedup_vs_serial: wall time of the serial backend on the same problem divided
+  by this wall time
+
+The serial backend runs the same loop as VSPUsingForLoops.py / VHDUsingForLoops.py.
+Hamiltonians are random Pauli operators of the requested size. The Redis backend uses
+the Redis server from REDIS_URL / REDIS_HOST if one answers, or an in-process fakeredis
+stand-in with worker threads (``--redis in-process``, needs ``pip install "fakeredis[lua]"``).
+
+Results are written to <output>.json and <output>.csv.
+
+``--host-aware`` instead compares the evaluation throughput of process pools whose
+workers use a default ``AerSimulator()`` (every worker's OpenMP using all cores) with
+pools whose simulators are sized by ``VQECommon.host_resources``, for each worker count
+and for wider circuits; results go to <output>_host_aware.json.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from qiskit.circuit.library import EfficientSU2
+from qiskit_aer import AerSimulator
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.transpile_cache import transpile_ansatz
+from VQECommon.wire_format import random_pauli_op
+from VQECommon.lockstep_population import cost_func_batch
+from VQECommon.executors import make_executor, open_local_estimator, ProcessExecutor
+from VQECommon.host_resources import detect_host
+from VQECommon.strategies import run_separate_parameters, run_hamiltonian_distribution
+from VQECommon.redis_transport import get_redis
+from VQECommon.evaluation_service import serve_evaluations
+from VQECommon.worker_daemon import stop_workers
+from VQECommon.bulk_submission import measure_encoding
+
+import warnings
+warnings.filterwarnings("ignore", category=UserWarning, module="qiskit_ibm_runtime")
+
+STRATEGIES = ('vsp', 'vhd')
+BACKENDS = ('serial', 'thread', 'process', 'dask', 'redis')
+RESULT_PREFIX = 'RESULT '
+CSV_FIELDS = ['strategy', 'backend', 'workers', 'qubits', 'reps', 'terms', 'groups', 'population',
+              'wall_time_s', 'evaluations', 'evaluations_per_s', 'queue_latency_s', 'peak_rss_mb',
+              'speedup_vs_serial', 'best_energy', 'error']
+HOST_AWARE_QUBITS = (12, 16, 20)
+HOST_AWARE_EVALUATIONS = 64     # parameter vectors evaluated per measurement
+
+def build_problem(num_qubits, reps, num_terms, seed=0):
+    """
+    Transpile an EfficientSU2 ansatz and lay out a random Hamiltonian on it.
+
+    Returns:
+    - ansatz_isa (QuantumCircuit): Transpiled ansatz.
+    - hamiltonian_isa (SparsePauliOp): Random Hamiltonian with the ansatz layout applied.
+    """
+    ansatz = EfficientSU2(num_qubits, reps=reps)
+    ansatz_isa = transpile_ansatz(ansatz, AerSimulator(), optimization_level=3)
+    hamiltonian = random_pauli_op(num_qubits, num_terms, seed=seed).simplify()
+    return ansatz_isa, hamiltonian.apply_layout(layout=ansatz_isa.layout)
+
+def _redis_worker(worker_id, workers):
+    """Worker process of the Redis backend."""
+    estimator, session = open_local_estimator(workers_per_host=workers)
+    try:
+        serve_evaluations(get_redis(decode_responses=False), worker_id, estimator)
+    finally:
+        session.close()
+
+def _in_process_redis():
+    try:
+        import fakeredis
+    except ImportError:
+        raise RuntimeError("No Redis server answered and fakeredis is not installed "
+                           "(pip install \"fakeredis[lua]\") for the in-process stand-in") from None
+    server = fakeredis.FakeServer()
+    return lambda: fakeredis.FakeRedis(server=server, decode_responses=False)
+
+def _local_redis():
+    r = get_redis(decode_responses=False)
+    r.ping()
+    return lambda: get_redis(decode_responses=False)
+
+@contextmanager
+def open_backend(backend, workers, redis_mode='auto'):
+    """
+    Start the execution backend with ``workers`` workers and yield its executor.
+
+    For the Redis backend, ``workers`` evaluation workers are started as processes
+    against a real Redis server, or as threads against the in-process stand-in.
+    """
+    if backend == 'serial':
+        options = {}
+    elif backend in ('thread', 'process'):
+        options = {'max_workers': workers}
+    elif backend == 'dask':
+        options = {'n_workers': workers}
+    else:
+        make_client = None
+        if redis_mode in ('auto', 'local'):
+            try:
+                make_client = _local_redis()
+            except Exception:
+                if redis_mode == 'local':
+                    raise
+        in_process = make_client is None
+        if in_process:
+            make_client = _in_process_redis()
+
+        worker_ids = [f'benchmark-{os.getpid()}-{i}' for i in range(workers)]
+        if in_process:
+            runners = []
+            for worker_id in worker_ids:
+                estimator, _ = open_local_estimator(workers_per_host=workers)
+                runners.append(threading.Thread(target=serve_evaluations, args=(make_client(), worker_id, estimator),
+                                                daemon=True))
+        else:
+            context = multiprocessing.get_context('spawn')
+            runners = [context.Process(target=_redis_worker, args=(worker_id, workers)) for worker_id in worker_ids]
+        for runner in runners:
+            runner.start()
+        try:
+            with make_executor('redis', r=make_client()) as executor:
+                yield executor
+        finally:
+            stop_workers(make_client(), worker_ids)
+            for runner in runners:
+                runner.join(timeout=30)
+        return
+
+    with make_executor(backend, **options) as executor:
+        yield executor
+
+def measure_queue_latency(executor, problem, ansatz, hamiltonian, params, repeat=5):
+    """
+    Median round trip of a one-row evaluation through ``executor``, minus the direct one.
+    """
+    estimator, session = open_local_estimator()
+    try:
+        direct = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cost_func_batch(params[None, :], ansatz, hamiltonian, estimator)
+            direct.append(time.perf_counter() - start)
+    finally:
+        session.close()
+    round_trips = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        executor.evaluate(problem, params[None, :])
+        round_trips.append(time.perf_counter() - start)
+    return max(statistics.median(round_trips) - statistics.median(direct), 0.0)
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+def run_configuration(config):
+    """
+    Run one configuration in this process.
+
+    Parameters:
+    - config (dict): strategy, backend, workers, qubits, reps, terms, population,
+      maxiter, seed and redis.
+
+    Returns:
+    - dict: The configuration with its measurements.
+    """
+    ansatz_isa, hamiltonian_isa = build_problem(config['qubits'], config['reps'], config['terms'], config['seed'])
+    rng = np.random.default_rng(config['seed'])
+    x0 = 2 * np.pi * rng.random(ansatz_isa.num_parameters)
+    options = {'maxiter': config['maxiter']}
+    record = dict(config, terms=len(hamiltonian_isa))
+
+    with open_backend(config['backend'], config['workers'], config['redis']) as executor:
+        problem = executor.problem(ansatz_isa, hamiltonian_isa)
+        record['queue_latency_s'] = measure_queue_latency(executor, problem, ansatz_isa, hamiltonian_isa, x0)
+
+        start = time.perf_counter()
+        if config['strategy'] == 'vsp':
+            initial_population = [x0 + 0.1 * rng.standard_normal(len(x0)) for _ in range(config['population'])]
+            results = run_separate_parameters(executor, ansatz_isa, hamiltonian_isa, initial_population,
+                                              options=options)
+            record['best_energy'] = min(result['energy'] for result in results)
+        else:
+            results, total_energy = run_hamiltonian_distribution(executor, ansatz_isa, hamiltonian_isa, x0,
+                                                                 options=options)
+            record['groups'] = len(results)
+            record['best_energy'] = total_energy
+        record['wall_time_s'] = time.perf_counter() - start
+
+    record['evaluations'] = sum(result['nfev'] for result in results)
+    record['evaluations_per_s'] = record['evaluations'] / record['wall_time_s']
+    record['peak_rss_mb'] = _peak_rss_mb()
+    return record
+
+def run_isolated(config, timeout):
+    """Run one configuration in a fresh Python process and return its record."""
+    command = [sys.executable, os.path.abspath(__file__), '--run-one', json.dumps(config)]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return dict(config, error=f"timed out after {timeout} s")
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    return dict(config, error=(completed.stderr.strip().splitlines() or ['no result'])[-1])
+
+def configurations(args):
+    """
+    Expand the sweep arguments into configurations; the serial backend runs once per
+    problem, with one worker, as the baseline.
+    """
+    configs = []
+    for strategy, backend, qubits, reps, terms in itertools.product(
+            args.strategies, args.backends, args.qubits, args.reps, args.terms):
+        for workers in ([1] if backend == 'serial' else args.workers):
+            configs.append({'strategy': strategy, 'backend': backend, 'workers': workers, 'qubits': qubits,
+                            'reps': reps, 'terms': terms, 'population': args.population,
+                            'maxiter': args.maxiter, 'seed': args.seed, 'redis': args.redis})
+    return configs
+
+def add_speedups(records):
+    """Set speedup_vs_serial on every record whose problem also ran on the serial backend."""
+    def problem_key(record):
+        return record['strategy'], record['qubits'], record['reps'], record['terms']
+
+    serial = {problem_key(record): record['wall_time_s'] for record in records
+              if record['backend'] == 'serial' and 'wall_time_s' in record}
+    for record in records:
+        if problem_key(record) in serial and 'wall_time_s' in record:
+            record['speedup_vs_serial'] = serial[problem_key(record)] / record['wall_time_s']
+    return records
+
+def write_results(records, output):
+    """Write the records to ``output``.json and ``output``.csv."""
+    with open(f'{output}.json', 'w') as f:
+        json.dump(records, f, indent=4)
+    with open(f'{output}.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(records)
+    print(f"Results saved to '{output}.json' and '{output}.csv'")
+
+def print_record(record):
+    if 'error' in record:
+        print(f"{record['strategy']:>3} {record['backend']:>7} x{record['workers']:<2} "
+              f"{record['qubits']}q r{record['reps']} {record['terms']} terms: FAILED {record['error']}")
+        return
+    print(f"{record['strategy']:>3} {record['backend']:>7} x{record['workers']:<2} "
+          f"{record['qubits']}q r{record['reps']} {record['terms']:>5} terms: "
+          f"{record['wall_time_s']:8.2f} s, {record['evaluations_per_s']:8.1f} evals/s, "
+          f"latency {record['queue_latency_s'] * 1e3:7.2f} ms, peak {record['peak_rss_mb']:7.1f} MB, "
+          f"speedup {record.get('speedup_vs_serial', float('nan')):5.2f}x")
+
+def run_submission_benchmark(num_qubits, term_counts, chunk_sizes=(1, 100)):
+    """Encode rate and peak memory of ``bulk_submission`` for large operators."""
+    for num_terms in term_counts:
+        operator = random_pauli_op(num_qubits, num_terms)
+        for chunk_size in chunk_sizes:
+            report = measure_encoding(operator, chunk_size)
+            print(f"{num_terms} terms, {chunk_size} per task: {report['tasks']} tasks, "
+                  f"{report['bytes'] / 1e6:.1f} MB in {report['seconds']:.2f} s "
+                  f"({report['tasks_per_s']:.0f} tasks/s, {report['mb_per_s']:.1f} MB/s), "
+                  f"peak {report['peak_bytes'] / 1e6:.1f} MB")
+
+def measure_throughput(executor, ansatz, hamiltonian, params_batch):
+    """Evaluations per second of ``params_batch`` through ``executor``, after one warm-up batch."""
+    problem = executor.problem(ansatz, hamiltonian)
+    executor.evaluate(problem, params_batch)
+    start = time.perf_counter()
+    executor.evaluate(problem, params_batch)
+    return len(params_batch) / (time.perf_counter() - start)
+
+def run_host_aware_benchmark(worker_counts, qubit_counts, num_terms, output, seed=0):
+    """
+    Evaluation throughput of process pools with default and with host-sized simulators.
+
+    Returns:
+    - list of dict: workers, qubits, the default and host-aware evaluations_per_s, and their ratio.
+    """
+    host = detect_host()
+    print(f"Host {host['host']}: {host['cores']} cores, {host['memory'] / 2 ** 30:.1f} GiB available")
+    records = []
+    for qubits in qubit_counts:
+        ansatz_isa, hamiltonian_isa = build_problem(qubits, 1, num_terms, seed)
+        params_batch = 2 * np.pi * np.random.default_rng(seed).random((HOST_AWARE_EVALUATIONS,
+                                                                        ansatz_isa.num_parameters))
+        for workers in worker_counts:
+            record = {'workers': workers, 'qubits': qubits, 'terms': len(hamiltonian_isa)}
+            for mode, backend_factory in (('default', AerSimulator), ('host_aware', None)):
+                with ProcessExecutor(max_workers=workers, backend_factory=backend_factory) as executor:
+                    record[f'{mode}_evaluations_per_s'] = measure_throughput(executor, ansatz_isa, hamiltonian_isa,
+                                                                            params_batch)
+            record['gain'] = record['host_aware_evaluations_per_s'] / record['default_evaluations_per_s']
+            print(f"{qubits:>2}q x{workers:<2}: default {record['default_evaluations_per_s']:8.1f} evals/s, "
+                  f"host-aware {record['host_aware_evaluations_per_s']:8.1f} evals/s, gain {record['gain']:5.2f}x")
+            records.append(record)
+            with open(f'{output}_host_aware.json', 'w') as f:
+                json.dump({'host': host, 'records': records}, f, indent=4)
+    print(f"Results saved to '{output}_host_aware.json'")
+    return records
+
+def main(args):
+    if args.run_one:
+        print(RESULT_PREFIX + json.dumps(run_configuration(json.loads(args.run_one))), flush=True)
+        return
+    if args.submission:
+        run_submission_benchmark(50, [10000, 100000, 200000])
+        return
+    if args.host_aware:
+        run_host_aware_benchmark(args.workers, HOST_AWARE_QUBITS, args.terms[0], args.output, args.seed)
+        return
+
+    records = []
+    configs = configurations(args)
+    # Serial baselines first, so speedups can be printed as the sweep goes.
+    configs.sort(key=lambda config: config['backend'] != 'serial')
+    for i, config in enumerate(configs):
+        print(f"[{i + 1}/{len(configs)}] {config['strategy']} on {config['backend']} with "
+              f"{config['workers']} worker(s), {config['qubits']} qubits, reps {config['reps']}, "
+              f"{config['terms']} terms")
+        records.append(run_isolated(config, args.timeout))
+        add_speedups(records)
+        print_record(records[-1])
+        write_results(records, args.output)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling benchmarks of the VSP and VHD strategies")
+    parser.add_argument("--strategies", nargs='+', choices=STRATEGIES, default=list(STRATEGIES))
+    parser.add_argument("--backends", nargs='+', choices=BACKENDS, default=['serial', 'process', 'dask', 'redis'])
+    parser.add_argument("--workers", nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument("--qubits", nargs='+', type=int, default=[2, 4, 6])
+    parser.add_argument("--reps", nargs='+', type=int, default=[1])
+    parser.add_argument("--terms", nargs='+', type=int, default=[4, 16, 64],
+                        help="terms of the random Hamiltonians (fewer if duplicates merge)")
+    parser.add_argument("--population", type=int, default=8, help="VSP starting points")
+    parser.add_argument("--maxiter", type=int, default=100, help="COBYLA iterations per optimization")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--redis", choices=['auto', 'local', 'in-process'], default='auto',
+                        help="Redis server from REDIS_URL, the in-process stand-in, or the server "
+                             "if one answers and the stand-in otherwise")
+    parser.add_argument("--timeout", type=float, default=1800, help="seconds per configuration")
+    parser.add_argument("--output", default='scaling_results')
+    parser.add_argument("--submission", action="store_true",
+                        help="measure the bulk task encoding rate and memory instead")
+    parser.add_argument("--host-aware", action="store_true",
+                        help="compare process pools with default and host-sized simulators instead")
+    parser.add_argument("--run-one", default=None, help=argparse.SUPPRESS)
+    main(parser.parse_args())
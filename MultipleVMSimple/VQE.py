@@ -8,6 +8,8 @@ August 2024
 
 # General imports
 import numpy as np
+import os
+import sys
 
 # Pre-defined ansatz circuit and operator class for Hamiltonian
 from qiskit.circuit.library import EfficientSU2
@@ -23,15 +25,14 @@ import matplotlib.pyplot as plt
 from qiskit_ibm_runtime import QiskitRuntimeService, Session
 from qiskit_ibm_runtime import EstimatorV2 as Estimator
 
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
-
 from qiskit_aer import AerSimulator
 
-cost_history_dict = {
-    "prev_vector": None,
-    "iters": 0,
-    "cost_history": [],
-}
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.transpile_cache import transpile_ansatz
+from VQECommon.exact_estimator import ExactEstimator
+from VQECommon.cost_history import CostHistory
+
+cost_history = CostHistory()
 
 def cost_func(params, ansatz, hamiltonian, estimator):
     """Return estimate of energy from estimator
@@ -41,7 +42,6 @@ def cost_func(params, ansatz, hamiltonian, estimator):
         ansatz (QuantumCircuit): Parameterized ansatz circuit
         hamiltonian (SparsePauliOp): Operator representation of Hamiltonian
         estimator (EstimatorV2): Estimator primitive instance
-        cost_history_dict: Dictionary for storing intermediate results
 
     Returns:
         float: Energy estimate
@@ -50,10 +50,8 @@ def cost_func(params, ansatz, hamiltonian, estimator):
     result = estimator.run(pubs=[pub]).result()
     energy = result[0].data.evs[0]
 
-    cost_history_dict["iters"] += 1
-    cost_history_dict["prev_vector"] = params
-    cost_history_dict["cost_history"].append(energy)
-    # print(f"Iters. done: {cost_history_dict['iters']} [Current cost: {energy}]")
+    cost_history.record(energy)
+    # print(f"Iters. done: {len(cost_history)} [Current cost: {energy}]")
 
     return energy
 
@@ -73,9 +71,7 @@ def main():
     
 
     aer_sim = AerSimulator()
-    pm = generate_preset_pass_manager(backend=aer_sim, optimization_level=3)
-
-    ansatz_isa = pm.run(ansatz)
+    ansatz_isa = transpile_ansatz(ansatz, aer_sim, optimization_level=3)
     ansatz_isa.draw(output="mpl", idle_wires=False, style="iqp")
     
     hamiltonian_isa = hamiltonian.apply_layout(layout=ansatz_isa.layout)
@@ -84,7 +80,7 @@ def main():
     print("Initial parameters", x0)
     
     with Session(backend=aer_sim) as session:
-        estimator = Estimator(session=session)
+        estimator = ExactEstimator(Estimator(session=session))
         estimator.options.default_shots = 10000
 
         res = minimize(
@@ -97,12 +93,11 @@ def main():
         
     print("Final parameters", res)
     
-    all(cost_history_dict["prev_vector"] == res.x)
-    
-    cost_history_dict["iters"] == res.nfev
+    len(cost_history) == res.nfev
     
+    iterations, energies = cost_history.arrays()
     fig, ax = plt.subplots()
-    ax.plot(range(cost_history_dict["iters"]), cost_history_dict["cost_history"])
+    ax.plot(iterations, energies)
     ax.set_xlabel("Iterations")
     ax.set_ylabel("Cost")
     plt.draw()
@@ -0,0 +1,6 @@
+"""
+Shared building blocks for the VQE experiments (MultipleVMSimple, Dask, VSP and VHD).
+
+The experiment scripts are run from their own directories, so each of them appends
+the project root to ``sys.path`` before importing from this package.
+"""
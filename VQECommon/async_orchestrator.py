@@ -0,0 +1,142 @@
+"""
+asyncio core for orchestrators that dispatch many tasks and wait for their results.
+
+``AsyncResultRouter`` owns the orchestrator's side of a result stream. One background
+task reads the stream with a blocking XREADGROUP (so it wakes as soon as any worker
+publishes), acknowledges the entries in a pipeline and hands every result to the
+``Job`` it belongs to. Results are routed by the ``job`` and ``id`` fields that the
+workers copy from the task, so any number of jobs can be in flight in one event loop,
+each awaited on its own:
+
+    async with AsyncResultRouter(r, RESULT_STREAM, GROUP) as router:
+        job = router.expect(range(len(messages)))
+        await dispatch(...)               # tasks carry job=job.id and their id
+        async for result in job.as_completed(timeout=300):
+            ...
+"""
+
+import asyncio
+import uuid
+
+from .redis_transport import open_async_transport
+from .tracing import span
+from .wire_format import decode_optimize_result
+
+
+class Job:
+    """
+    Futures for the results of one batch of tasks.
+
+    Parameters:
+    - task_ids (iterable): Ids of the tasks whose results are expected.
+    - job_id (str): Identifier sent with the tasks; a random one is generated if omitted.
+    """
+
+    def __init__(self, task_ids, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        self.futures = {task_id: loop.create_future() for task_id in task_ids}
+
+    def resolve(self, task_id, result):
+        """Set the result of ``task_id``; returns False for unknown ids and duplicates."""
+        future = self.futures.get(task_id)
+        if future is None or future.done():
+            return False
+        future.set_result(result)
+        return True
+
+    @property
+    def results(self):
+        """Results received so far, by task id."""
+        return {task_id: future.result() for task_id, future in self.futures.items() if future.done()}
+
+    def missing(self):
+        """Ids of the tasks without a result yet."""
+        return [task_id for task_id, future in self.futures.items() if not future.done()]
+
+    async def as_completed(self, timeout=None):
+        """Yield results in arrival order; stops early (leaving ``missing()``) on timeout."""
+        try:
+            for next_result in asyncio.as_completed(list(self.futures.values()), timeout=timeout):
+                yield await next_result
+        except asyncio.TimeoutError:
+            return
+
+    async def wait(self, timeout=None):
+        """Wait for all results or the timeout; returns ``results``."""
+        pending = [future for future in self.futures.values() if not future.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+        return self.results
+
+
+class AsyncResultRouter:
+    """
+    Reads a result stream in the background and resolves the matching ``Job`` futures.
+
+    Parameters:
+    - r (redis.asyncio.Redis): Client created with decode_responses=False.
+    - stream (str): Result stream.
+    - group (str): Consumer group of the orchestrator(s) reading ``stream``.
+    - consumer (str): Consumer name of this orchestrator.
+    - decode (callable): Turns a payload into a result dictionary with 'job' and 'id'.
+    - count (int): Maximum entries per XREADGROUP.
+    - block (float): Seconds one XREADGROUP waits before it is issued again.
+    """
+
+    def __init__(self, r, stream, group, consumer='orchestrator', decode=decode_optimize_result,
+                 count=1000, block=1.0):
+        self.r = r
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.decode = decode
+        self.count = count
+        self.block = block
+        self.jobs = {}
+        self.stats = {'received': 0, 'duplicates': 0, 'unrouted': 0, 'invalid': 0}
+        self.transport = None
+        self._reader = None
+
+    async def __aenter__(self):
+        self.transport = await open_async_transport(self.stream, self.group, self.r)
+        self._reader = asyncio.create_task(self._collect())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._reader.cancel()
+        try:
+            await self._reader
+        except asyncio.CancelledError:
+            pass
+
+    def expect(self, task_ids, job_id=None):
+        """Register a job whose results this router should route; returns the ``Job``."""
+        job = Job(task_ids, job_id)
+        self.jobs[job.id] = job
+        return job
+
+    def forget(self, job):
+        """Stop routing results of ``job`` (late results are then counted as unrouted)."""
+        self.jobs.pop(job.id, None)
+
+    async def _collect(self):
+        while True:
+            entries = await self.transport.read(self.consumer, count=self.count, timeout=self.block)
+            if not entries:
+                continue
+            with span('route results', results=len(entries)):
+                for _, payload in entries:
+                    try:
+                        result = self.decode(payload)
+                    except ValueError as exc:
+                        print(f"Dropping undecodable result: {exc}")
+                        self.stats['invalid'] += 1
+                        continue
+                    self.stats['received'] += 1
+                    job = self.jobs.get(result.get('job'))
+                    if job is None:
+                        self.stats['unrouted'] += 1
+                    elif not job.resolve(result.get('id'), result):
+                        self.stats['duplicates'] += 1
+            await self.transport.ack(entry_id for entry_id, _ in entries)
@@ -0,0 +1,116 @@
+"""
+Bulk submission of Hamiltonians with very many terms as queue tasks.
+
+``term_chunk_messages`` cuts the operator's symplectic arrays (``paulis.x``,
+``paulis.z`` and ``coeffs``) into slices of ``chunk_size`` terms and encodes every slice
+directly with ``wire_format.encode_symplectic``; no SparsePauliOp is built per term and
+nothing is printed per term. It is a generator, and ``submit_messages`` drains it in
+batches of ``batch_size`` messages, each sent as a single RPUSH. Only the batch being
+sent and the one being built are held in memory, so the orchestrator's memory is
+bounded by the batch size and does not grow with the number of terms.
+``measure_encoding`` reports the encode rate and peak memory for an operator (see
+``Benchmarks/ScalingBenchmark.py --submission``).
+"""
+
+import time
+import tracemalloc
+from itertools import islice
+
+from .tracing import span
+from .wire_format import encode_symplectic
+
+DEFAULT_CHUNK_SIZE = 1      # terms per task
+DEFAULT_BATCH_SIZE = 1000   # messages per round trip
+
+
+def num_chunks(num_terms, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Number of tasks ``term_chunk_messages`` yields for ``num_terms`` terms."""
+    return -(-num_terms // chunk_size)
+
+
+def term_chunk_messages(hamiltonian, chunk_size=DEFAULT_CHUNK_SIZE, **fields):
+    """
+    Yield one encoded task per slice of ``chunk_size`` consecutive terms.
+
+    Parameters:
+    - hamiltonian (SparsePauliOp): Operator to split.
+    - chunk_size (int): Terms per task.
+    - fields: Scalar fields added to every message (e.g. the job id); each message also
+      gets its task ``id``, counting from 0.
+
+    Returns:
+    - generator of bytes: Messages decodable with ``decode_pauli_op``.
+    """
+    paulis = hamiltonian.paulis
+    x, z, coeffs = paulis.x, paulis.z, hamiltonian.coeffs
+    for task_id, start in enumerate(range(0, len(hamiltonian), chunk_size)):
+        stop = start + chunk_size
+        yield encode_symplectic(x[start:stop], z[start:stop], coeffs[start:stop], id=task_id, **fields)
+
+
+def _batches(messages, batch_size):
+    messages = iter(messages)
+    while batch := list(islice(messages, batch_size)):
+        yield batch
+
+
+def _report(tasks, size, seconds, batches):
+    seconds = max(seconds, 1e-9)
+    return {'tasks': tasks, 'bytes': size, 'batches': batches, 'seconds': seconds,
+            'tasks_per_s': tasks / seconds, 'mb_per_s': size / seconds / 1e6}
+
+
+async def submit_messages(r, key, messages, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Append ``messages`` to the list ``key`` in batches, one RPUSH round trip per batch.
+
+    Parameters:
+    - r (redis.asyncio.Redis): Client created with decode_responses=False.
+    - key (str): Destination list, e.g. a ``LeaseQueue``'s ``pending_key``.
+    - messages (iterable of bytes): Consumed lazily, ``batch_size`` at a time.
+    - batch_size (int): Messages per round trip.
+
+    Returns:
+    - dict: Tasks, bytes, batches and seconds sent, and the rates tasks_per_s and mb_per_s.
+    """
+    tasks = size = batches = 0
+    start = time.perf_counter()
+    messages = iter(messages)
+    while True:
+        with span('encode batch', batch=batches):
+            batch = list(islice(messages, batch_size))
+        if not batch:
+            break
+        with span('rpush', batch=batches, tasks=len(batch)):
+            await r.rpush(key, *batch)
+        tasks += len(batch)
+        size += sum(map(len, batch))
+        batches += 1
+    return _report(tasks, size, time.perf_counter() - start, batches)
+
+
+def _encode_all(hamiltonian, chunk_size, batch_size):
+    tasks = size = batches = 0
+    start = time.perf_counter()
+    for batch in _batches(term_chunk_messages(hamiltonian, chunk_size), batch_size):
+        tasks += len(batch)
+        size += sum(map(len, batch))
+        batches += 1
+    return _report(tasks, size, time.perf_counter() - start, batches)
+
+
+def measure_encoding(hamiltonian, chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Encode ``hamiltonian`` batch by batch without sending it.
+
+    Returns:
+    - dict: As ``submit_messages``, plus the peak memory traced during a second pass
+      (tracing slows encoding down, so it is not timed).
+    """
+    report = _encode_all(hamiltonian, chunk_size, batch_size)
+    tracemalloc.start()
+    _encode_all(hamiltonian, chunk_size, batch_size)
+    _, report['peak_bytes'] = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return report
+
@@ -0,0 +1,220 @@
+"""
+Checkpoints of running minimizations, so a task taken over by another worker resumes
+where the previous worker stopped.
+
+``Checkpointer.minimize`` wraps the objective of a SciPy minimization and, every
+``every`` evaluations or ``interval`` seconds, saves the last evaluated parameters, the
+best parameters and energy so far, the number of evaluations and the state of NumPy's
+global random generator. The checkpoint is keyed by the task (its job and task id), so
+when a worker dies and the task is requeued or reclaimed, whichever worker takes it
+next finds the checkpoint and restarts the optimizer from the best point so far with the
+remaining evaluation budget, instead of from the task's starting point. The checkpoint
+is removed with ``clear`` once the result has been published.
+
+SciPy does not expose the internal state of its optimizers (e.g. COBYLA's simplex), so a
+resumed minimization is a warm restart from the checkpoint, not a bit-exact
+continuation.
+
+Checkpoints are small ``wire_format`` messages stored in Redis (``RedisCheckpointStore``)
+or in a local directory (``DiskCheckpointStore``).
+"""
+
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+from scipy.optimize import minimize
+
+from .wire_format import encode_message, decode_message
+
+CHECKPOINT_KEY_PREFIX = 'checkpoint:'
+CHECKPOINT_TTL = 7 * 24 * 3600  # seconds
+DEFAULT_CHECKPOINT_EVERY = 50   # evaluations
+DEFAULT_CHECKPOINT_INTERVAL = 30.0  # seconds
+
+
+class RedisCheckpointStore:
+    """
+    Checkpoints in Redis, visible to workers on every host.
+
+    Parameters:
+    - r (redis.Redis): Client created with decode_responses=False.
+    - ttl (float): Seconds a checkpoint of an abandoned task is kept.
+    """
+
+    def __init__(self, r, ttl=CHECKPOINT_TTL):
+        self.r = r
+        self.ttl = ttl
+
+    def save(self, key, data):
+        self.r.set(CHECKPOINT_KEY_PREFIX + key, data, ex=int(self.ttl))
+
+    def load(self, key):
+        return self.r.get(CHECKPOINT_KEY_PREFIX + key)
+
+    def delete(self, key):
+        self.r.delete(CHECKPOINT_KEY_PREFIX + key)
+
+
+class DiskCheckpointStore:
+    """
+    Checkpoints in a local directory, for workers that restart on the same host.
+
+    Parameters:
+    - directory (str): Directory of the checkpoint files, created if needed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, re.sub(r'[^\w.-]', '_', key) + '.ckpt')
+
+    def save(self, key, data):
+        # Write to a temporary file first so a crash never leaves a partial checkpoint.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+    def load(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def open_checkpoint_store(r=None, directory=None):
+    """A ``DiskCheckpointStore`` in ``directory`` if given, else a ``RedisCheckpointStore`` on ``r``."""
+    if directory is not None:
+        return DiskCheckpointStore(directory)
+    return RedisCheckpointStore(r)
+
+
+def encode_checkpoint(state):
+    """Encode a checkpoint dictionary (see ``Checkpointer.state``)."""
+    name, keys, pos, has_gauss, cached_gaussian = state['rng_state']
+    return encode_message('checkpoint', {
+        'best_energy': state['best_energy'],
+        'nfev': state['nfev'],
+        'saved_at': state['saved_at'],
+        'rng': [name, int(pos), int(has_gauss), float(cached_gaussian)],
+    }, {
+        'params': state['params'],
+        'best_params': state['best_params'],
+        'rng_keys': keys,
+    })
+
+
+def decode_checkpoint(data):
+    """Decode a message produced by ``encode_checkpoint``."""
+    fields, arrays = decode_message(data, 'checkpoint')
+    name, pos, has_gauss, cached_gaussian = fields['rng']
+    return {
+        'params': arrays['params'].copy(),
+        'best_params': arrays['best_params'].copy(),
+        'best_energy': fields['best_energy'],
+        'nfev': fields['nfev'],
+        'saved_at': fields['saved_at'],
+        'rng_state': (name, arrays['rng_keys'].copy(), pos, has_gauss, cached_gaussian),
+    }
+
+
+class Checkpointer:
+    """
+    Saves the progress of one minimization periodically and resumes it from there.
+
+    Parameters:
+    - store (RedisCheckpointStore or DiskCheckpointStore): Where checkpoints are kept.
+    - key (str): Identifies the task; every worker that takes the task uses the same key.
+    - every (int): Evaluations between checkpoints.
+    - interval (float): Seconds between checkpoints, whichever comes first.
+    """
+
+    def __init__(self, store, key, every=DEFAULT_CHECKPOINT_EVERY, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.store = store
+        self.key = key
+        self.every = every
+        self.interval = interval
+        self.state = None
+        self.resumed_from = None
+        self._saved_nfev = 0
+        self._saved_time = time.monotonic()
+
+    def load(self):
+        """The saved checkpoint of this task, or None."""
+        data = self.store.load(self.key)
+        return decode_checkpoint(data) if data is not None else None
+
+    def save(self):
+        self.state['saved_at'] = time.time()
+        self.state['rng_state'] = np.random.get_state()
+        self.store.save(self.key, encode_checkpoint(self.state))
+        self._saved_nfev = self.state['nfev']
+        self._saved_time = time.monotonic()
+
+    def clear(self):
+        """Remove the checkpoint, once the task's result is safely published."""
+        self.store.delete(self.key)
+
+    def _record(self, params, energy):
+        state = self.state
+        state['params'] = np.array(params, dtype=float)
+        state['nfev'] += 1
+        if energy < state['best_energy']:
+            state['best_energy'] = float(energy)
+            state['best_params'] = state['params']
+        if (state['nfev'] - self._saved_nfev >= self.every
+                or time.monotonic() - self._saved_time >= self.interval):
+            self.save()
+
+    def minimize(self, fun, x0, args=(), method='cobyla', options=None):
+        """
+        ``scipy.optimize.minimize`` with checkpoints, resuming from a saved one if present.
+
+        When resuming, the optimizer restarts from the best parameters of the checkpoint,
+        the random generator state is restored, and ``options['maxiter']`` (if given) is
+        reduced by the evaluations already done. The result's ``nfev`` counts them too,
+        and ``resumed_from`` holds their number (None for a fresh start).
+
+        Returns:
+        - scipy.optimize.OptimizeResult: Result of the whole minimization.
+        """
+        checkpoint = self.load()
+        if checkpoint is not None:
+            self.state = checkpoint
+            self.resumed_from = checkpoint['nfev']
+            self._saved_nfev = checkpoint['nfev']
+            np.random.set_state(checkpoint['rng_state'])
+            x0 = checkpoint['best_params']
+            if options and 'maxiter' in options:
+                options = dict(options, maxiter=max(1, options['maxiter'] - checkpoint['nfev']))
+        else:
+            x0 = np.asarray(x0, dtype=float)
+            self.state = {'params': x0.copy(), 'best_params': x0.copy(), 'best_energy': np.inf, 'nfev': 0}
+        self._saved_time = time.monotonic()
+
+        def objective_function(params, *args):
+            energy = fun(params, *args)
+            self._record(params, energy)
+            return energy
+
+        result = minimize(objective_function, x0, args=args, method=method, options=options)
+        if self.resumed_from is not None:
+            result.nfev += self.resumed_from
+            if self.state['best_energy'] < result.fun:
+                result.x = self.state['best_params']
+                result.fun = self.state['best_energy']
+        result.resumed_from = self.resumed_from
+        self.save()
+        return result
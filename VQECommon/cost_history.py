@@ -0,0 +1,138 @@
+"""
+Bounded, array-backed record of the energies an optimization evaluates.
+
+``CostHistory`` keeps the iteration number and energy of the latest ``capacity``
+evaluations in two preallocated NumPy ring buffers, so recording an energy allocates
+nothing and memory does not grow with the length of the run. Older entries are
+dropped, or, with ``spill_path``, appended a full buffer at a time to a file that
+``spilled`` maps back with ``numpy.memmap``. A million evaluations take 16 MB on disk
+and ``16 * capacity`` bytes (1 MB by default) in memory.
+
+A worker streams its history to the orchestrator by passing a ``sink``: every
+``sink_every`` new entries are handed to it as a pair of arrays, which the other side
+appends to its own ``CostHistory`` with ``extend`` (see
+``EvaluationClient.submit_optimizations``).
+"""
+
+import numpy as np
+
+DEFAULT_CAPACITY = 65536
+DEFAULT_SINK_EVERY = 1024
+ENTRY_DTYPE = np.dtype([('iteration', '<i8'), ('energy', '<f8')])
+
+
+class CostHistory:
+    """
+    Ring buffers of (iteration, energy) pairs, with optional spilling and streaming.
+
+    Parameters:
+    - capacity (int): Entries kept in memory.
+    - spill_path (str): File older entries are appended to; they are dropped if omitted.
+    - sink (callable): Called as ``sink(iterations, energies)`` with every entry once.
+    - sink_every (int): Entries per ``sink`` call; at most ``capacity``. ``flush``
+      sends the rest.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, spill_path=None, sink=None, sink_every=DEFAULT_SINK_EVERY):
+        if sink is not None and not 0 < sink_every <= capacity:
+            raise ValueError(f"sink_every must be between 1 and the capacity ({capacity}), got {sink_every}")
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.sink = sink
+        self.sink_every = sink_every
+        self._iterations = np.empty(capacity, dtype=np.int64)
+        self._energies = np.empty(capacity, dtype=np.float64)
+        self.count = 0
+        self.spilled_count = 0
+        self.sent_count = 0
+        self.best_energy = np.inf
+        self.best_iteration = -1
+        if spill_path is not None:
+            open(spill_path, 'wb').close()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def first_retained(self):
+        """Index (in recording order) of the oldest entry still in memory."""
+        return max(self.spilled_count, self.count - self.capacity)
+
+    def record(self, energy, iteration=None):
+        """Append one energy; ``iteration`` defaults to the number of entries so far."""
+        if self.spill_path is not None and self.count - self.spilled_count == self.capacity:
+            self._spill()
+        position = self.count % self.capacity
+        self._iterations[position] = self.count if iteration is None else iteration
+        self._energies[position] = energy
+        if energy < self.best_energy:
+            self.best_energy = float(energy)
+            self.best_iteration = int(self._iterations[position])
+        self.count += 1
+        if self.sink is not None and self.count - self.sent_count >= self.sink_every:
+            self.flush()
+
+    def extend(self, iterations, energies):
+        """Append arrays of entries, e.g. a chunk streamed from a worker."""
+        iterations = np.asarray(iterations, dtype=np.int64)
+        energies = np.asarray(energies, dtype=np.float64)
+        start = 0
+        while start < len(energies):
+            if self.spill_path is not None and self.count - self.spilled_count == self.capacity:
+                self._spill()
+            position = self.count % self.capacity
+            size = min(len(energies) - start, self.capacity - position)
+            if self.sink is not None:
+                size = min(size, self.sent_count + self.sink_every - self.count)
+            stop = start + size
+            self._iterations[position:position + size] = iterations[start:stop]
+            self._energies[position:position + size] = energies[start:stop]
+            best = int(np.argmin(energies[start:stop]))
+            if energies[start + best] < self.best_energy:
+                self.best_energy = float(energies[start + best])
+                self.best_iteration = int(iterations[start + best])
+            self.count += size
+            start = stop
+            if self.sink is not None and self.count - self.sent_count >= self.sink_every:
+                self.flush()
+
+    def _window(self, start, stop):
+        positions = np.arange(start, stop) % self.capacity
+        return self._iterations[positions], self._energies[positions]
+
+    def _spill(self):
+        # Spills happen whenever the buffer fills, so it holds its entries in order.
+        entries = np.empty(self.capacity, dtype=ENTRY_DTYPE)
+        entries['iteration'] = self._iterations
+        entries['energy'] = self._energies
+        with open(self.spill_path, 'ab') as f:
+            entries.tofile(f)
+        self.spilled_count = self.count
+
+    def flush(self):
+        """Hand the entries not yet sent to the sink."""
+        if self.sink is not None and self.count > self.sent_count:
+            iterations, energies = self._window(self.sent_count, self.count)
+            self.sent_count = self.count
+            self.sink(iterations, energies)
+
+    def retained(self):
+        """(iterations, energies) arrays of the entries in memory, oldest first."""
+        return self._window(self.first_retained, self.count)
+
+    def spilled(self):
+        """Read-only memory map of the spilled entries (fields 'iteration' and 'energy')."""
+        if self.spill_path is None or not self.spilled_count:
+            return np.empty(0, dtype=ENTRY_DTYPE)
+        return np.memmap(self.spill_path, dtype=ENTRY_DTYPE, mode='r', shape=(self.spilled_count,))
+
+    def arrays(self):
+        """(iterations, energies) of every entry still available: spilled, then in memory."""
+        spilled = self.spilled()
+        iterations, energies = self.retained()
+        return (np.concatenate([spilled['iteration'], iterations]),
+                np.concatenate([spilled['energy'], energies]))
+
+    def nbytes(self):
+        """Bytes held in memory by the ring buffers."""
+        return self._iterations.nbytes + self._energies.nbytes
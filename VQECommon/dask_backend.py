@@ -0,0 +1,177 @@
+"""
+Persistent Dask backend for VQE energy evaluations and whole optimizations.
+
+``DaskBackend`` connects once to an existing scheduler, or starts a long-lived
+``LocalCluster``, and keeps the connection for all the work of a run:
+
+- ``scatter_problem`` sends the ISA ansatz and Hamiltonian to the workers once; tasks
+  refer to them by future instead of pickling them into every call.
+- Every Dask worker builds its own estimator when it starts (``EstimatorPlugin``), also
+  workers added later by adaptive scaling, so no estimator or runtime session is
+  pickled into tasks. Its simulator gets the worker's share of the host's cores and
+  memory, counting every thread of every worker on the busiest host.
+- ``submit_evaluations`` splits an (N, P) parameter batch into chunks, one broadcast
+  estimator job per future. ``DaskEvaluator`` wraps this for ``GradientService``.
+- ``submit_optimizations`` runs one whole ``minimize`` per future. The result includes
+  the start's cost history as arrays (bounded by ``CostHistory``), so it reaches the
+  driver instead of being lost in a worker's globals.
+"""
+
+import numpy as np
+from dask.distributed import Client, LocalCluster, WorkerPlugin, get_worker
+
+from .executors import optimize_start, open_local_estimator
+from .lockstep_population import cost_func_batch
+
+ESTIMATOR_PLUGIN = 'vqe-estimator'
+DEFAULT_CHUNK_SIZE = 8
+
+
+class EstimatorPlugin(WorkerPlugin):
+    """
+    Opens a runtime session on every Dask worker and keeps one estimator bound to it.
+
+    Parameters:
+    - backend_factory (callable): Builds the backend on the worker; an AerSimulator
+      sized for one of ``workers_per_host`` concurrent tasks by default.
+    - workers_per_host (int): Tasks simulating at the same time on one host.
+    """
+
+    name = ESTIMATOR_PLUGIN
+
+    def __init__(self, backend_factory=None, workers_per_host=1):
+        self.backend_factory = backend_factory
+        self.workers_per_host = workers_per_host
+        self.session = None
+        self.estimator = None
+
+    def setup(self, worker):
+        self.estimator, self.session = open_local_estimator(self.backend_factory, self.workers_per_host)
+
+    def teardown(self, worker):
+        if self.session is not None:
+            self.session.close()
+
+
+def worker_estimator():
+    """Estimator of the Dask worker running the current task."""
+    return get_worker().plugins[ESTIMATOR_PLUGIN].estimator
+
+
+def evaluate_chunk(params_batch, ansatz, hamiltonian):
+    """Energies of an (N, P) parameter batch, in one estimator job on this worker."""
+    return cost_func_batch(params_batch, ansatz, hamiltonian, worker_estimator())
+
+
+def minimize_start(initial_param, ansatz, hamiltonian, method='cobyla', options=None):
+    """Run ``executors.optimize_start`` with this worker's estimator."""
+    return optimize_start(initial_param, ansatz, hamiltonian, worker_estimator(), method, options)
+
+
+class DaskBackend:
+    """
+    Long-lived Dask client with a per-worker estimator.
+
+    Parameters:
+    - address (str): Scheduler to connect to; a LocalCluster is started if omitted.
+    - n_workers (int): Workers of the LocalCluster; Dask's default if omitted.
+    - threads_per_worker (int): Threads of each LocalCluster worker. SciPy's COBYLA
+      runs one minimization per process at a time, so 1 is the default.
+    - adaptive (tuple of int): (minimum, maximum) workers for adaptive scaling of the
+      LocalCluster, or None for a fixed size.
+    - backend_factory (callable): Passed to ``EstimatorPlugin``.
+    """
+
+    def __init__(self, address=None, n_workers=None, threads_per_worker=1, adaptive=None,
+                 backend_factory=None):
+        if address is None:
+            self.cluster = LocalCluster(n_workers=n_workers, threads_per_worker=threads_per_worker)
+            self.client = Client(self.cluster)
+        else:
+            self.cluster = None
+            self.client = Client(address)
+        workers_per_host = self.threads_per_host()
+        if adaptive is not None:
+            workers_per_host = max(workers_per_host, adaptive[1] * threads_per_worker)
+        self.client.register_plugin(EstimatorPlugin(backend_factory, workers_per_host))
+        if adaptive is not None:
+            self.adapt(*adaptive)
+
+    def adapt(self, minimum, maximum):
+        """Let the LocalCluster grow and shrink between ``minimum`` and ``maximum`` workers."""
+        if self.cluster is None:
+            raise ValueError("Adaptive scaling needs a LocalCluster; scale an external cluster "
+                             "through its own cluster manager")
+        self.cluster.adapt(minimum=minimum, maximum=maximum)
+
+    @property
+    def num_workers(self):
+        return len(self.client.scheduler_info()['workers'])
+
+    def threads_per_host(self):
+        """Worker threads of the host with the most, i.e. tasks that may simulate there at once."""
+        threads = {}
+        for info in self.client.scheduler_info()['workers'].values():
+            threads[info['host']] = threads.get(info['host'], 0) + info['nthreads']
+        return max(threads.values(), default=1)
+
+    def scatter_problem(self, ansatz, hamiltonian):
+        """
+        Send the circuit and Hamiltonian to the workers once.
+
+        Returns:
+        - tuple: (ansatz, hamiltonian) futures to pass to the submit methods.
+        """
+        ansatz_future, hamiltonian_future = self.client.scatter([ansatz, hamiltonian], broadcast=True, hash=False)
+        return ansatz_future, hamiltonian_future
+
+    def submit_evaluations(self, problem, params_batch, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Submit one evaluation future per chunk of ``chunk_size`` rows of ``params_batch``."""
+        params_batch = np.asarray(params_batch, dtype=float)
+        return [self.client.submit(evaluate_chunk, params_batch[start:start + chunk_size], *problem, pure=False)
+                for start in range(0, len(params_batch), chunk_size)]
+
+    def evaluate(self, problem, params_batch, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Energies of every row of ``params_batch``, evaluated on the workers."""
+        futures = self.submit_evaluations(problem, params_batch, chunk_size)
+        return np.concatenate(self.client.gather(futures))
+
+    def submit_optimizations(self, problem, initial_population, method='cobyla', options=None):
+        """Submit one ``minimize_start`` future per starting point."""
+        return [self.client.submit(minimize_start, initial_param, *problem, method, options, pure=False)
+                for initial_param in initial_population]
+
+    def close(self):
+        self.client.close()
+        if self.cluster is not None:
+            self.cluster.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DaskEvaluator:
+    """
+    Evaluate a parameter batch on a ``DaskBackend``, for ``GradientService``.
+
+    Parameters:
+    - backend (DaskBackend): Backend to submit to.
+    - ansatz (QuantumCircuit): ISA ansatz circuit, scattered once.
+    - hamiltonian (SparsePauliOp): Hamiltonian with the ansatz layout applied, scattered once.
+    - chunk_size (int): Parameter vectors per evaluation future.
+    """
+
+    def __init__(self, backend, ansatz, hamiltonian, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.backend = backend
+        self.problem = backend.scatter_problem(ansatz, hamiltonian)
+        self.chunk_size = chunk_size
+
+    def __call__(self, params_batch):
+        return self.backend.evaluate(self.problem, params_batch, self.chunk_size)
+
+    def close(self):
+        for future in self.problem:
+            future.release()
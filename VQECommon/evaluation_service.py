@@ -0,0 +1,346 @@
+"""
+Energy evaluations farmed out to Redis workers.
+
+A client stores each problem, an ISA ansatz (as QPY) and a Hamiltonian (see
+``wire_format``), once in Redis under ``evaluation:problem:<sha256>``. It then publishes
+evaluation chunks to the ``evaluation:tasks`` stream. A chunk names a problem and
+carries a small (N, P) parameter matrix. Any worker running ``serve_evaluations``
+takes the chunk from the stream's consumer group, loads the problem on first use,
+evaluates all N energies in one broadcast estimator job and replies to the client's own
+reply stream. Chunks held by a worker that dies are reclaimed by the others; a worker
+re-claims the entry it is running every third of ``reclaim_after``, so a long task
+(a whole minimization) is never taken over while its worker is alive.
+
+``EvaluationClient.evaluate`` submits any mix of (problem, parameters) chunks at once
+and waits for all of them, so independent evaluations (the shifted circuits of a
+gradient, the term groups of a Hamiltonian) run on all workers in parallel.
+``submit_optimizations`` sends whole minimizations the same way, one task per starting
+point, and can have the workers stream each start's cost history back while it runs.
+``submit`` and ``gather`` separate sending from waiting, so several requests can be in
+flight at once.
+"""
+
+import hashlib
+import io
+import time
+import uuid
+
+import numpy as np
+from qiskit import qpy
+
+from .cost_history import CostHistory, DEFAULT_CAPACITY
+from .lockstep_population import cost_func_batch
+from .executors import optimize_start
+from .redis_transport import PAYLOAD_FIELD, open_transport
+from .tracing import span, flow_start, flow_end, trace_fields, queue_wait, task_key
+from .wire_format import encode_message, decode_message, message_kind, encode_pauli_op, decode_pauli_op
+from .worker_daemon import run_daemon, DEFAULT_HEARTBEAT_INTERVAL
+
+EVALUATION_TASK_STREAM = 'evaluation:tasks'
+EVALUATION_WORKER_GROUP = 'evaluation-workers'
+PROBLEM_KEY_PREFIX = 'evaluation:problem:'
+PROBLEM_TTL = 24 * 3600  # seconds
+DEFAULT_RECLAIM_AFTER = 60.0  # seconds an entry of a dead worker stays idle before it is reclaimed
+
+
+def store_problem(r, ansatz, hamiltonian):
+    """
+    Publish the circuit and Hamiltonian for evaluation workers, once per distinct problem.
+
+    Returns:
+    - str: Problem id, referenced by every chunk message.
+    """
+    buffer = io.BytesIO()
+    qpy.dump(ansatz, buffer)
+    circuit_data = buffer.getvalue()
+    hamiltonian_data = encode_pauli_op(hamiltonian)
+    problem_id = hashlib.sha256(circuit_data + hamiltonian_data).hexdigest()
+    key = PROBLEM_KEY_PREFIX + problem_id
+    if not r.expire(key, PROBLEM_TTL):
+        pipe = r.pipeline()
+        pipe.hset(key, mapping={'circuit': circuit_data, 'hamiltonian': hamiltonian_data})
+        pipe.expire(key, PROBLEM_TTL)
+        pipe.execute()
+    return problem_id
+
+
+def load_problem(r, problem_id):
+    """Load the (ansatz, hamiltonian) stored by ``store_problem``; ``r`` must return bytes."""
+    data = r.hgetall(PROBLEM_KEY_PREFIX + problem_id)
+    if not data:
+        raise KeyError(f"Unknown evaluation problem {problem_id}")
+    ansatz = qpy.load(io.BytesIO(data[b'circuit']))[0]
+    hamiltonian, _ = decode_pauli_op(data[b'hamiltonian'])
+    return ansatz, hamiltonian
+
+
+class EvaluationClient:
+    """
+    Submits evaluation chunks and gathers the energies from this client's reply stream.
+
+    Parameters:
+    - r (redis.Redis): Client created with decode_responses=False.
+    - timeout (float): Seconds to wait for all chunks of one ``evaluate`` or ``gather`` call.
+    """
+
+    def __init__(self, r, timeout=300.0):
+        self.r = r
+        self.timeout = timeout
+        self.reply_stream = f'evaluation:results:{uuid.uuid4().hex}'
+        self.tasks = open_transport(EVALUATION_TASK_STREAM, EVALUATION_WORKER_GROUP, r)
+        self.replies = open_transport(self.reply_stream, 'client', r)
+        self.pending = set()
+        self.received = {}
+        self.histories = {}
+        self.history_options = {}
+        self.history_ends = {}
+
+    def _publish(self, kind, fields, arrays):
+        request_id = uuid.uuid4().hex
+        handles = [(request_id, i) for i in range(len(arrays))]
+        with span('publish', kind=kind, tasks=len(handles)):
+            for handle in handles:
+                flow_start('task', task_key(*handle))
+            self.tasks.publish(
+                encode_message(kind, dict(message_fields, request=request_id, chunk=i, reply_to=self.reply_stream,
+                                          **trace_fields()),
+                               message_arrays)
+                for i, (message_fields, message_arrays) in enumerate(zip(fields, arrays))
+            )
+        self.pending.update(handles)
+        return handles
+
+    def submit(self, chunks):
+        """
+        Publish evaluation chunks without waiting for them.
+
+        Parameters:
+        - chunks (list of (str, numpy.ndarray)): (problem id, (N, P) parameter matrix) pairs.
+
+        Returns:
+        - list: One handle per chunk, for ``gather``.
+        """
+        return self._publish('evaluation_chunk', [{'problem': problem_id} for problem_id, _ in chunks],
+                             [{'params': np.asarray(params, dtype=float)} for _, params in chunks])
+
+    def submit_optimizations(self, problem_id, initial_population, method='cobyla', options=None,
+                             stream_every=None, history_options=None):
+        """
+        Publish one minimization of problem ``problem_id`` per starting point.
+
+        Parameters:
+        - stream_every (int): If given, every worker sends its cost history in chunks of
+          this many evaluations while it runs, into ``history(handle)``.
+        - history_options (dict): Keyword arguments of the ``CostHistory`` receiving
+          each start's stream (e.g. ``capacity`` and ``spill_path``).
+
+        Returns:
+        - list: One handle per starting point; ``gather`` returns the ``optimize_start``
+          result dictionaries, with the streamed ``CostHistory`` as 'history'.
+        """
+        handles = self._publish('optimization_task',
+                                [{'problem': problem_id, 'method': method, 'options': options,
+                                  'stream_every': stream_every}] * len(initial_population),
+                                [{'x0': np.asarray(initial_param, dtype=float)} for initial_param in initial_population])
+        if stream_every:
+            for handle in handles:
+                self.history_options[handle] = history_options or {}
+                self.histories[handle] = CostHistory(**self.history_options[handle])
+        return handles
+
+    def history(self, handle):
+        """Cost history streamed so far by the optimization ``handle``; see ``poll``."""
+        return self.histories[handle]
+
+    def poll(self, count=100, timeout=None):
+        """
+        Receive the replies and history chunks that have arrived.
+
+        Parameters:
+        - count (int): Maximum messages to read.
+        - timeout (float): Seconds to wait for at least one; None returns at once.
+
+        Returns:
+        - int: Number of messages received.
+        """
+        entries = self.replies.read('client', count=count, timeout=timeout)
+        for _, message in entries:
+            kind = message_kind(message)
+            fields, arrays = decode_message(message, kind)
+            handle = (fields['request'], fields['chunk'])
+            if kind == 'history_chunk':
+                if handle in self.histories and handle not in self.received and len(arrays['iterations']):
+                    if arrays['iterations'][0] <= self.history_ends.get(handle, -1):
+                        # The task was reclaimed from a worker that died and started over.
+                        self.histories[handle] = CostHistory(**self.history_options[handle])
+                    self.histories[handle].extend(arrays['iterations'], arrays['energies'])
+                    self.history_ends[handle] = arrays['iterations'][-1]
+            # Replies to tasks already gathered (e.g. a reclaimed chunk evaluated twice) are dropped.
+            elif handle in self.pending and handle not in self.received:
+                with span('result', task=task_key(*handle)):
+                    flow_end('result', task_key(*handle))
+                    self.received[handle] = _reply_value(kind, fields, arrays)
+        self.replies.ack(entry_id for entry_id, _ in entries)
+        return len(entries)
+
+    def gather(self, handles):
+        """Wait for the replies to ``handles`` and return them in order."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = sum(handle not in self.received for handle in handles)
+            if not remaining:
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{remaining} of {len(handles)} evaluation tasks not finished in time")
+            self.poll(count=max(remaining, 100), timeout=1)
+        self.pending.difference_update(handles)
+        results = [self.received.pop(handle) for handle in handles]
+        for handle, result in zip(handles, results):
+            if handle in self.histories:
+                result['history'] = self.histories.pop(handle)
+                self.history_options.pop(handle)
+                self.history_ends.pop(handle, None)
+        return results
+
+    def evaluate(self, chunks):
+        """
+        Evaluate every chunk on the workers and wait for all results.
+
+        Parameters:
+        - chunks (list of (str, numpy.ndarray)): (problem id, (N, P) parameter matrix) pairs.
+
+        Returns:
+        - list of numpy.ndarray: The N energies of each chunk, in order.
+        """
+        return self.gather(self.submit(chunks))
+
+    def close(self):
+        self.r.delete(self.reply_stream)
+
+
+def _reply_value(kind, fields, arrays):
+    if kind == 'evaluation_result':
+        return arrays['energies']
+    result = {key: value for key, value in fields.items() if key not in ('request', 'chunk')}
+    result['params'] = arrays['params'].tolist()
+    result['cost_iterations'] = arrays['cost_iterations'].copy()
+    result['cost_history'] = arrays['cost_history'].copy()
+    return result
+
+
+def _history_sink(r, reply_to, reply_fields):
+    """Sink sending cost history chunks to the client, ahead of the optimization's result."""
+    def send(iterations, energies):
+        r.xadd(reply_to, {PAYLOAD_FIELD: encode_message('history_chunk', reply_fields,
+                                                         {'iterations': iterations, 'energies': energies})})
+    return send
+
+
+def serve_evaluation_chunk(r, message, estimator, problems):
+    """
+    Evaluate one chunk (or run one minimization) published by ``EvaluationClient`` and
+    send the result back.
+
+    Parameters:
+    - r (redis.Redis): Client created with decode_responses=False.
+    - message (bytes): Chunk or optimization message.
+    - estimator (Estimator): Estimator of this worker.
+    - problems (dict): Problem id -> (ansatz, hamiltonian), filled as problems are seen.
+    """
+    kind = message_kind(message)
+    if kind not in ('evaluation_chunk', 'optimization_task'):
+        raise ValueError(f"Unexpected {kind!r} message on {EVALUATION_TASK_STREAM}")
+    fields, arrays = decode_message(message, kind)
+    key = task_key(fields['request'], fields['chunk'])
+    with span(kind, task=key):
+        flow_end('task', key)
+        queue_wait(fields, key)
+        if fields['problem'] not in problems:
+            with span('load problem'):
+                problems[fields['problem']] = load_problem(r, fields['problem'])
+        ansatz, hamiltonian = problems[fields['problem']]
+        reply_fields = {'request': fields['request'], 'chunk': fields['chunk']}
+        if kind == 'evaluation_chunk':
+            energies = cost_func_batch(arrays['params'], ansatz, hamiltonian, estimator)
+            reply = encode_message('evaluation_result', reply_fields, {'energies': energies})
+        else:
+            history = None
+            if fields.get('stream_every'):
+                history = CostHistory(sink=_history_sink(r, fields['reply_to'], reply_fields),
+                                      sink_every=min(fields['stream_every'], DEFAULT_CAPACITY))
+            result = optimize_start(arrays['x0'], ansatz, hamiltonian, estimator, fields['method'], fields['options'],
+                                    history)
+            reply = encode_message('optimization_result',
+                                   dict(reply_fields, energy=result['energy'], success=result['success'],
+                                        message=result['message'], nfev=result['nfev']),
+                                   {'params': np.asarray(result['params']),
+                                    'cost_iterations': result['cost_iterations'],
+                                    'cost_history': result['cost_history']})
+        flow_start('result', key)
+        with span('reply', task=key):
+            pipe = r.pipeline(transaction=False)
+            pipe.xadd(fields['reply_to'], {PAYLOAD_FIELD: reply})
+            # Replies to a client that has already gone away expire with the problem.
+            pipe.expire(fields['reply_to'], PROBLEM_TTL)
+            pipe.execute()
+
+
+def serve_evaluations(r, worker_id, estimator, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL,
+                      reclaim_after=DEFAULT_RECLAIM_AFTER):
+    """
+    Run a daemon worker loop that evaluates chunks until a stop message arrives.
+
+    Chunks idle for ``reclaim_after`` seconds are taken over from workers that died; the
+    entry being served is re-claimed every ``reclaim_after / 3`` seconds meanwhile.
+
+    Returns:
+    - int: Number of chunks processed.
+    """
+    chunk_stream = open_transport(EVALUATION_TASK_STREAM, EVALUATION_WORKER_GROUP, r)
+    problems = {}
+
+    def next_task(timeout):
+        entries = chunk_stream.reclaim(worker_id, reclaim_after, count=1) \
+            or chunk_stream.read(worker_id, count=1, timeout=timeout)
+        return entries[0] if entries else None
+
+    def handle_task(entry):
+        entry_id, message = entry
+        with chunk_stream.keep_claimed(worker_id, [entry_id], reclaim_after / 3):
+            serve_evaluation_chunk(r, message, estimator, problems)
+        chunk_stream.ack([entry_id])
+
+    return run_daemon(r, worker_id, next_task, handle_task, heartbeat_interval=heartbeat_interval)
+
+
+class DistributedEnergy:
+    """
+    Energy of a grouped Hamiltonian, with every group evaluated by the workers in parallel.
+
+    Each group (e.g. a qubit-wise-commuting clique from ``pauli_grouping``) becomes its own
+    problem. A call broadcasts the parameter vector as one chunk per group and returns the
+    sum of the partial expectations, i.e. the full energy at shared parameters.
+
+    Parameters:
+    - client (EvaluationClient): Submits the chunks.
+    - ansatz (QuantumCircuit): ISA ansatz circuit.
+    - groups (list of SparsePauliOp): Hamiltonian groups with the ansatz layout applied.
+    """
+
+    def __init__(self, client, ansatz, groups):
+        self.client = client
+        self.problem_ids = [store_problem(client.r, ansatz, group) for group in groups]
+        self.stats = {'steps': 0, 'seconds': 0.0}
+
+    def partial_energies(self, params):
+        """Expectation value of every group at ``params``."""
+        params = np.asarray(params, dtype=float)[None, :]
+        energies = self.client.evaluate([(problem_id, params) for problem_id in self.problem_ids])
+        return np.array([energy[0] for energy in energies])
+
+    def __call__(self, params):
+        start = time.perf_counter()
+        energy = float(np.sum(self.partial_energies(params)))
+        self.stats['steps'] += 1
+        self.stats['seconds'] += time.perf_counter() - start
+        return energy
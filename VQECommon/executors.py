@@ -0,0 +1,358 @@
+"""
+One execution API for VQE work, with serial, thread, process, Dask and Redis backends.
+
+Every backend implements the same three calls:
+
+- ``submit_evaluations(problem, params_batch)`` splits an (N, P) parameter batch into
+  chunks, each evaluated as one broadcast estimator job, and returns a handle per chunk.
+- ``submit_optimizations(problem, initial_population, method, options)`` runs one
+  whole ``minimize`` per starting point (``optimize_start``) and returns a handle per
+  start.
+- ``gather(handles)`` waits for the handles and returns their results in order:
+  an array of energies per evaluation chunk, a result dictionary per optimization.
+
+``problem(ansatz, hamiltonian)`` turns a circuit and observable into whatever the backend
+sends with its tasks: the objects themselves locally, scattered futures for Dask, a
+stored problem id for Redis. ``make_executor`` picks a backend by name at run time, so
+the strategies in ``strategies`` run unchanged on a laptop, a many-core host or a cluster.
+
+Without a ``backend_factory`` the local backends size their simulators with
+``host_resources.HostResources``, splitting the host's cores and memory over the
+threads or processes that simulate at the same time.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from qiskit_ibm_runtime import Session, EstimatorV2 as Estimator
+from scipy.optimize import minimize
+
+from .cost_history import CostHistory
+from .exact_estimator import ExactEstimator
+from .host_resources import HostResources
+from .lockstep_population import cost_func_batch
+from .redis_transport import get_redis
+
+DEFAULT_REDIS_CHUNK_SIZE = 8
+
+
+def optimize_start(initial_param, ansatz, hamiltonian, estimator, method='cobyla', options=None, history=None):
+    """
+    Minimize the energy from one starting point.
+
+    Parameters:
+    - history (CostHistory): Records every objective call; a new one with the default
+      capacity if omitted. It is flushed to its sink before returning.
+
+    Returns:
+    - dict: 'energy', 'params', 'success', 'message', 'nfev', and the 'cost_iterations'
+      and 'cost_history' arrays of the objective calls still in the history's memory.
+    """
+    history = history if history is not None else CostHistory()
+
+    def objective_function(params):
+        energy = float(cost_func_batch(np.asarray(params, dtype=float)[None, :], ansatz, hamiltonian, estimator)[0])
+        history.record(energy)
+        return energy
+
+    result = minimize(objective_function, initial_param, method=method, options=options)
+    history.flush()
+    cost_iterations, cost_history = history.retained()
+    return {
+        'energy': float(result.fun),  # Convert to native Python float
+        'params': result.x.tolist(),  # Convert NumPy array to list
+        'success': bool(result.success),  # Convert NumPy bool to Python bool
+        'message': str(result.message),  # Ensure message is a string
+        'nfev': int(result.nfev),
+        'cost_iterations': cost_iterations,
+        'cost_history': cost_history,
+    }
+
+
+def open_local_estimator(backend_factory=None, workers_per_host=1):
+    """
+    Open a session on a new backend; returns (estimator, session).
+
+    Parameters:
+    - backend_factory (callable): Builds the backend. If omitted, an AerSimulator sized
+      for one of ``workers_per_host`` simulations running at once on this host.
+    - workers_per_host (int): Estimators simulating concurrently on this host.
+    """
+    if backend_factory is not None:
+        session = Session(backend=backend_factory())
+        return ExactEstimator(Estimator(session=session)), session
+    resources = HostResources(workers_per_host)
+    session = Session(backend=resources.simulator())
+    return ExactEstimator(Estimator(session=session), **resources.exact_options()), session
+
+
+class Executor:
+    """
+    Base class of the execution backends.
+
+    Parameters:
+    - chunk_size (int): Parameter vectors per evaluation task; the backend's default if omitted.
+    """
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size
+
+    def problem(self, ansatz, hamiltonian):
+        """Prepare a circuit and observable for the submit methods."""
+        return ansatz, hamiltonian
+
+    def _chunks(self, params_batch):
+        params_batch = np.asarray(params_batch, dtype=float)
+        chunk_size = self.chunk_size or self._default_chunk_size(len(params_batch))
+        return [params_batch[start:start + chunk_size] for start in range(0, len(params_batch), chunk_size)]
+
+    def _default_chunk_size(self, batch_size):
+        return max(batch_size, 1)
+
+    def submit_evaluations(self, problem, params_batch):
+        raise NotImplementedError
+
+    def submit_optimizations(self, problem, initial_population, method='cobyla', options=None):
+        raise NotImplementedError
+
+    def gather(self, handles):
+        raise NotImplementedError
+
+    def evaluate(self, problem, params_batch):
+        """Energies of every row of ``params_batch``."""
+        return np.concatenate(self.gather(self.submit_evaluations(problem, params_batch)))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _ImmediatePool:
+    """Runs every submitted call at once, in the caller's thread."""
+
+    def submit(self, function, *args):
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    def shutdown(self):
+        pass
+
+
+class _PoolExecutor(Executor):
+    """Executor backed by a ``concurrent.futures`` pool sharing one estimator."""
+
+    def __init__(self, pool, estimator=None, backend_factory=None, chunk_size=None, workers_per_host=1):
+        super().__init__(chunk_size)
+        self.pool = pool
+        self.session = None
+        if estimator is None:
+            estimator, self.session = open_local_estimator(backend_factory, workers_per_host)
+        self.estimator = estimator
+
+    def submit_evaluations(self, problem, params_batch):
+        return [self.pool.submit(cost_func_batch, chunk, *problem, self.estimator)
+                for chunk in self._chunks(params_batch)]
+
+    def submit_optimizations(self, problem, initial_population, method='cobyla', options=None):
+        return [self.pool.submit(optimize_start, initial_param, *problem, self.estimator, method, options)
+                for initial_param in initial_population]
+
+    def gather(self, handles):
+        return [handle.result() for handle in handles]
+
+    def close(self):
+        self.pool.shutdown()
+        if self.session is not None:
+            self.session.close()
+
+
+class SerialExecutor(_PoolExecutor):
+    """
+    Runs every task immediately in the calling thread; the reference backend.
+
+    Parameters:
+    - estimator (Estimator): Estimator to use; a session on ``backend_factory()`` is opened if omitted.
+    - backend_factory (callable): Builds the backend when no estimator is given; a
+      host-sized AerSimulator if omitted.
+    - chunk_size (int): Parameter vectors per evaluation task; the whole batch by default.
+    """
+
+    def __init__(self, estimator=None, backend_factory=None, chunk_size=None):
+        super().__init__(_ImmediatePool(), estimator, backend_factory, chunk_size)
+
+
+class ThreadExecutor(_PoolExecutor):
+    """
+    Runs tasks on a thread pool sharing one estimator.
+
+    Aer releases the GIL while it simulates, so evaluation chunks run concurrently.
+    SciPy's COBYLA runs one minimization per process at a time, so COBYLA optimizations
+    are better sent to ``ProcessExecutor``.
+
+    Parameters:
+    - max_workers (int): Pool size; defaults to ThreadPoolExecutor's choice.
+    - estimator, backend_factory: As for ``SerialExecutor``; the host-sized simulator
+      splits the host over the pool's threads.
+    - chunk_size (int): Parameter vectors per evaluation task; by default the batch is
+      split evenly over the pool.
+    """
+
+    def __init__(self, max_workers=None, estimator=None, backend_factory=None, chunk_size=None):
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_workers = pool._max_workers
+        super().__init__(pool, estimator, backend_factory, chunk_size, self.max_workers)
+
+    def _default_chunk_size(self, batch_size):
+        return max(-(-batch_size // self.max_workers), 1)
+
+
+_process_estimator = None
+
+
+def _open_process_estimator(backend_factory, workers_per_host):
+    global _process_estimator
+    _process_estimator, _ = open_local_estimator(backend_factory, workers_per_host)
+
+
+def _evaluate_in_process(params_batch, ansatz, hamiltonian):
+    return cost_func_batch(params_batch, ansatz, hamiltonian, _process_estimator)
+
+
+def _optimize_in_process(initial_param, ansatz, hamiltonian, method, options):
+    return optimize_start(initial_param, ansatz, hamiltonian, _process_estimator, method, options)
+
+
+class ProcessExecutor(Executor):
+    """
+    Runs tasks on a pool of processes, each with its own estimator.
+
+    Processes are spawned, not forked, so the simulator's threads are never copied
+    mid-run; scripts using this backend need an ``if __name__ == "__main__"`` guard.
+
+    Parameters:
+    - max_workers (int): Number of processes; the number of CPUs by default.
+    - backend_factory (callable): Builds each process's backend; must be picklable. If
+      omitted, every process gets an AerSimulator sized for its share of the host.
+    - chunk_size (int): Parameter vectors per evaluation task; by default the batch is
+      split evenly over the processes.
+    """
+
+    def __init__(self, max_workers=None, backend_factory=None, chunk_size=None):
+        super().__init__(chunk_size)
+        self.pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_open_process_estimator,
+                                        initargs=(backend_factory, max_workers or os.cpu_count() or 1))
+        self.max_workers = self.pool._max_workers
+
+    def _default_chunk_size(self, batch_size):
+        return max(-(-batch_size // self.max_workers), 1)
+
+    def submit_evaluations(self, problem, params_batch):
+        return [self.pool.submit(_evaluate_in_process, chunk, *problem) for chunk in self._chunks(params_batch)]
+
+    def submit_optimizations(self, problem, initial_population, method='cobyla', options=None):
+        return [self.pool.submit(_optimize_in_process, initial_param, *problem, method, options)
+                for initial_param in initial_population]
+
+    def gather(self, handles):
+        return [handle.result() for handle in handles]
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class DaskExecutor(Executor):
+    """
+    Runs tasks on a ``dask_backend.DaskBackend``.
+
+    Parameters:
+    - backend (DaskBackend): Backend to use; one is created from ``backend_options`` if omitted.
+    - chunk_size (int): Parameter vectors per evaluation future.
+    - backend_options: Passed to ``DaskBackend`` (address, n_workers, adaptive, ...).
+    """
+
+    def __init__(self, backend=None, chunk_size=None, **backend_options):
+        from .dask_backend import DaskBackend, DEFAULT_CHUNK_SIZE
+        super().__init__(chunk_size or DEFAULT_CHUNK_SIZE)
+        self.owns_backend = backend is None
+        self.backend = backend if backend is not None else DaskBackend(**backend_options)
+
+    def problem(self, ansatz, hamiltonian):
+        return self.backend.scatter_problem(ansatz, hamiltonian)
+
+    def submit_evaluations(self, problem, params_batch):
+        return self.backend.submit_evaluations(problem, params_batch, self.chunk_size)
+
+    def submit_optimizations(self, problem, initial_population, method='cobyla', options=None):
+        return self.backend.submit_optimizations(problem, initial_population, method, options)
+
+    def gather(self, handles):
+        return self.backend.client.gather(handles)
+
+    def close(self):
+        if self.owns_backend:
+            self.backend.close()
+
+
+class RedisExecutor(Executor):
+    """
+    Runs tasks on the Redis evaluation workers (``VSPWorker.py <id> --evaluate`` or
+    ``VHDWorker.py <id> --evaluate``).
+
+    Parameters:
+    - r (redis.Redis): Client created with decode_responses=False; ``get_redis`` by default.
+    - timeout (float): Seconds ``gather`` waits for its handles.
+    - chunk_size (int): Parameter vectors per worker task.
+    """
+
+    def __init__(self, r=None, timeout=300.0, chunk_size=DEFAULT_REDIS_CHUNK_SIZE):
+        from .evaluation_service import EvaluationClient
+        super().__init__(chunk_size)
+        self.client = EvaluationClient(r if r is not None else get_redis(decode_responses=False), timeout)
+
+    def problem(self, ansatz, hamiltonian):
+        from .evaluation_service import store_problem
+        return store_problem(self.client.r, ansatz, hamiltonian)
+
+    def submit_evaluations(self, problem, params_batch):
+        return self.client.submit([(problem, chunk) for chunk in self._chunks(params_batch)])
+
+    def submit_optimizations(self, problem, initial_population, method='cobyla', options=None):
+        return self.client.submit_optimizations(problem, initial_population, method, options)
+
+    def gather(self, handles):
+        return self.client.gather(handles)
+
+    def close(self):
+        self.client.close()
+
+
+EXECUTORS = {
+    'serial': SerialExecutor,
+    'thread': ThreadExecutor,
+    'process': ProcessExecutor,
+    'dask': DaskExecutor,
+    'redis': RedisExecutor,
+}
+
+
+def make_executor(name, **options):
+    """
+    Create the backend called ``name`` (a key of ``EXECUTORS``) with its keyword options.
+    """
+    try:
+        executor_class = EXECUTORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown executor {name!r}; choose one of {sorted(EXECUTORS)}") from None
+    return executor_class(**options)
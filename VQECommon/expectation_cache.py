@@ -0,0 +1,300 @@
+"""
+Memoized expectation values, so an energy already computed is never computed again.
+
+``MemoizedEstimator`` wraps the estimator passed to ``cost_func(params, ansatz,
+hamiltonian, estimator)`` (usually an ``ExactEstimator``) and looks up every parameter
+vector of a pub in an ``ExpectationCache`` before running it. Entries are keyed by a
+fingerprint of the circuit, a fingerprint of the observable, the parameter vector
+quantized to ``tolerance`` and the number of shots, so optimizers that revisit a point
+(COBYLA's simplex, line searches, parameter-shift gradients, restarts from a
+checkpoint) and workers that evaluate the same point for different tasks share the
+result. Only the vectors that miss are sent to the wrapped estimator, in one job.
+
+Exact statevector results are deterministic and always cached. Shot-based results
+carry sampling noise, so they are only cached and reused with ``allow_shot_results``.
+
+The cache keeps recent entries in process (an LRU of ``maxsize`` entries) and,
+with a Redis client, in Redis as well, where every worker finds them.
+"""
+
+import hashlib
+import json
+import struct
+from collections import OrderedDict
+
+import numpy as np
+from qiskit.primitives.containers import DataBin, PrimitiveResult, PubResult
+from qiskit.quantum_info import SparsePauliOp
+
+from .exact_estimator import _DoneJob
+from .tracing import span
+from .transpile_cache import circuit_fingerprint
+
+REDIS_KEY_PREFIX = 'expectation:'
+DEFAULT_MAXSIZE = 100000        # entries kept in process, about 100 bytes each
+DEFAULT_TOLERANCE = 1e-9        # parameter quantization step
+DEFAULT_TTL = 24 * 3600         # seconds an entry is kept in Redis
+_ENTRY = struct.Struct('<dd')   # (expectation value, standard error)
+
+
+def fingerprint_circuit(circuit):
+    """Digest of a circuit's instructions and of the order of its parameters."""
+    spec = {
+        'num_qubits': circuit.num_qubits,
+        'parameters': [parameter.name for parameter in circuit.parameters],
+        'instructions': circuit_fingerprint(circuit),
+    }
+    return hashlib.sha256(json.dumps(spec).encode()).digest()
+
+
+def fingerprint_operator(operator):
+    """Digest of the Pauli strings and coefficients of an observable."""
+    operator = SparsePauliOp(operator)
+    digest = hashlib.sha256()
+    digest.update(struct.pack('<q', operator.num_qubits))
+    digest.update(np.packbits(operator.paulis.x, axis=1).tobytes())
+    digest.update(np.packbits(operator.paulis.z, axis=1).tobytes())
+    digest.update(np.asarray(operator.paulis.phase, dtype=np.int8).tobytes())
+    digest.update(np.asarray(operator.coeffs, dtype=complex).tobytes())
+    return digest.digest()
+
+
+class ExpectationCache:
+    """
+    LRU of expectation values in process, optionally backed by Redis.
+
+    Parameters:
+    - maxsize (int): Entries kept in process.
+    - redis_client (redis.Redis): Shared tier, created with decode_responses=False; none if omitted.
+    - ttl (float): Seconds an entry is kept in Redis.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, redis_client=None, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.stats = {'hits': 0, 'redis_hits': 0, 'misses': 0, 'stored': 0, 'uncached': 0, 'evictions': 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def hit_rate(self):
+        """Fraction of lookups answered by either tier."""
+        hits = self.stats['hits'] + self.stats['redis_hits']
+        lookups = hits + self.stats['misses']
+        return hits / lookups if lookups else 0.0
+
+    def summary(self):
+        """One-line description of the hit rate and counters, for worker logs."""
+        stats = self.stats
+        return (f"{self.hit_rate():.1%} hit rate: {stats['hits']} in process, {stats['redis_hits']} from Redis, "
+                f"{stats['misses']} misses, {stats['stored']} stored, {stats['uncached']} pubs not cacheable")
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def get_many(self, keys):
+        """
+        Look up several keys, querying Redis once for those not held in process.
+
+        Returns:
+        - list: (expectation value, standard error) of every key, or None where it is missing.
+        """
+        values = [None] * len(keys)
+        remote = []
+        for i, key in enumerate(keys):
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                values[i] = value
+                self.stats['hits'] += 1
+            else:
+                remote.append(i)
+
+        if remote and self.redis_client is not None:
+            encoded = self.redis_client.mget([REDIS_KEY_PREFIX + keys[i].hex() for i in remote])
+            still_missing = []
+            for i, data in zip(remote, encoded):
+                if data is None:
+                    still_missing.append(i)
+                    continue
+                values[i] = _ENTRY.unpack(data)
+                self._remember(keys[i], values[i])
+                self.stats['redis_hits'] += 1
+            remote = still_missing
+        self.stats['misses'] += len(remote)
+        return values
+
+    def put_many(self, items):
+        """Store (key, (expectation value, standard error)) pairs in every tier."""
+        items = list(items)
+        for key, value in items:
+            self._remember(key, value)
+        if items and self.redis_client is not None:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, value in items:
+                pipe.set(REDIS_KEY_PREFIX + key.hex(), _ENTRY.pack(*value), ex=int(self.ttl))
+            pipe.execute()
+        self.stats['stored'] += len(items)
+
+
+def open_expectation_cache(mode, r=None, maxsize=DEFAULT_MAXSIZE):
+    """
+    Cache selected by a worker's ``--memo`` option.
+
+    Parameters:
+    - mode (str): None for no cache, 'local' for an in-process cache, 'redis' to share it through ``r``.
+    - r (redis.Redis): Client created with decode_responses=False, used with 'redis'.
+
+    Returns:
+    - ExpectationCache or None.
+    """
+    if mode is None:
+        return None
+    if mode not in ('local', 'redis'):
+        raise ValueError(f"Unknown expectation cache mode {mode!r}, expected 'local' or 'redis'")
+    return ExpectationCache(maxsize, redis_client=r if mode == 'redis' else None)
+
+
+class MemoizedEstimator:
+    """
+    EstimatorV2-compatible wrapper that answers repeated evaluations from an ``ExpectationCache``.
+
+    Pubs with a single observable and a parameter array (the form used by every
+    ``cost_func`` in this project) are memoized per parameter vector; other pubs are
+    forwarded unchanged.
+
+    Parameters:
+    - estimator (EstimatorV2): Estimator evaluating the misses, e.g. an ``ExactEstimator``.
+    - cache (ExpectationCache): Where results are kept; a private in-process one if omitted.
+    - tolerance (float): Parameter vectors that agree after rounding to multiples of
+      ``tolerance`` share an entry.
+    - allow_shot_results (bool): Also cache and reuse results of the shot-based estimator.
+    """
+
+    def __init__(self, estimator, cache=None, tolerance=DEFAULT_TOLERANCE, allow_shot_results=False):
+        self.estimator = estimator
+        self.cache = cache if cache is not None else ExpectationCache()
+        self.tolerance = tolerance
+        self.allow_shot_results = allow_shot_results
+        self._fingerprints = {}
+
+    @property
+    def options(self):
+        """Options of the wrapped estimator (e.g. ``default_shots``)."""
+        return self.estimator.options
+
+    @property
+    def stats(self):
+        return self.cache.stats
+
+    def _fingerprint(self, obj, function):
+        # Call sites pass the same circuit and observable objects on every evaluation,
+        # so their fingerprints are computed once and reused.
+        key = id(obj)
+        cached = self._fingerprints.get(key)
+        if cached is None or cached[0] is not obj:
+            if len(self._fingerprints) >= 128:
+                self._fingerprints.clear()
+            cached = (obj, function(obj))
+            self._fingerprints[key] = cached
+        return cached[1]
+
+    def _result_tag(self, circuit, precision):
+        """What besides the inputs determines a result: 'exact', or the shots and precision."""
+        use_exact = getattr(self.estimator, 'use_exact', None)
+        if use_exact is not None and use_exact(circuit):
+            return b'exact'
+        if not self.allow_shot_results:
+            return None
+        shots = getattr(self.options, 'default_shots', None)
+        return f'shots={shots};precision={precision}'.encode()
+
+    def _plan(self, pub, precision):
+        """Keys of the parameter vectors of a memoizable pub, or None to forward it."""
+        if len(pub) != 3:
+            return None
+        circuit, observables, parameter_values = pub
+        if isinstance(observables, (list, tuple)):
+            if len(observables) != 1 or isinstance(observables[0], (list, tuple)):
+                return None
+            observable, observables_shape = observables[0], (1,)
+        else:
+            observable, observables_shape = observables, ()
+        if not isinstance(observable, SparsePauliOp) or not circuit.num_parameters:
+            return None
+        tag = self._result_tag(circuit, precision)
+        if tag is None:
+            return None
+
+        parameter_values = np.asarray(parameter_values, dtype=float)
+        flat_params = parameter_values.reshape(-1, circuit.num_parameters)
+        shape = np.broadcast_shapes(observables_shape, parameter_values.shape[:-1])
+        prefix = (self._fingerprint(circuit, fingerprint_circuit)
+                  + self._fingerprint(observable, fingerprint_operator) + tag)
+        quantized = np.rint(flat_params / self.tolerance).astype(np.int64)
+        keys = [hashlib.sha256(prefix + row.tobytes()).digest() for row in quantized]
+        return keys, flat_params, shape, tag == b'exact'
+
+    def run(self, pubs, *, precision=None):
+        """
+        Estimate expectation values, running only the parameter vectors not cached yet.
+
+        Parameters:
+        - pubs (list of tuple): ``(circuit, observables[, parameter_values[, precision]])``.
+        - precision (float): Forwarded to the wrapped estimator.
+
+        Returns:
+        - job: Object whose ``result()`` is a PrimitiveResult with one PubResult per pub.
+        """
+        pubs = list(pubs)
+        pub_results = [None] * len(pubs)
+        forwarded = []      # indices of pubs forwarded unchanged
+        plans = {}          # pub index -> (keys, values, missing rows, shape, exact)
+        run_pubs = []
+        with span('memo lookup', pubs=len(pubs)):
+            for i, pub in enumerate(pubs):
+                plan = self._plan(pub, precision)
+                if plan is None:
+                    forwarded.append(i)
+                    run_pubs.append(pub)
+                    continue
+                keys, flat_params, shape, exact = plan
+                values = self.cache.get_many(keys)
+                missing = [row for row, value in enumerate(values) if value is None]
+                plans[i] = (keys, values, missing, shape, exact)
+                if missing:
+                    run_pubs.append((pub[0], pub[1], flat_params[missing]))
+        self.cache.stats['uncached'] += len(forwarded)
+
+        run_results = iter(self.estimator.run(run_pubs, precision=precision).result() if run_pubs else [])
+        for i in range(len(pubs)):
+            if i not in plans:
+                pub_results[i] = next(run_results)
+                continue
+            keys, values, missing, shape, exact = plans[i]
+            metadata = {'memoized': len(keys) - len(missing)}
+            if missing:
+                run_result = next(run_results)
+                evs = np.asarray(run_result.data.evs, dtype=float).reshape(-1)
+                stds = np.asarray(run_result.data.stds, dtype=float).reshape(-1)
+                computed = [(float(ev), float(std)) for ev, std in zip(evs, stds)]
+                for row, value in zip(missing, computed):
+                    values[row] = value
+                # The tag only promises an exact result; a pub the wrapped estimator
+                # sampled after all is not stored unless shot results are allowed.
+                if run_result.metadata.get('exact') or self.allow_shot_results:
+                    self.cache.put_many((keys[row], value) for row, value in zip(missing, computed))
+                metadata = dict(run_result.metadata, **metadata)
+            elif exact:
+                metadata.update(target_precision=0.0, exact=True)
+            evs = np.array([value[0] for value in values]).reshape(shape)
+            stds = np.array([value[1] for value in values]).reshape(shape)
+            pub_results[i] = PubResult(DataBin(evs=evs, stds=stds, shape=shape), metadata=metadata)
+
+        return _DoneJob(PrimitiveResult(pub_results, metadata={'version': 2}))
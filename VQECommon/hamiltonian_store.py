@@ -0,0 +1,306 @@
+"""
+On-disk store of large Hamiltonians, memory-mapped by orchestrators and workers.
+
+``write_hamiltonian_store`` streams a Hamiltonian from a text file into a store
+directory, ``STORE_CHUNK_TERMS`` terms at a time, so its memory does not grow with the
+term count. Two file formats are read:
+
+- text: one ``label coeff`` pair per line, the label in Qiskit order (qubit 0 last),
+  e.g. ``YZ 0.398``;
+- OpenFermion: the form printed by ``str(QubitOperator)``, e.g. ``0.398 [Y0 Z1] +``.
+
+Lines that are empty or start with ``#`` are skipped; coefficients may be complex.
+
+A store holds the X and Z bit matrices packed 8 qubits per byte, as in
+``wire_format``, and the complex128 coefficients, in three flat files next to a JSON
+header::
+
+    header.json | x.bin (terms, row_bytes) | z.bin (terms, row_bytes) | coeffs.bin (terms,)
+
+``HamiltonianStore`` maps the files with ``numpy.memmap``. Slicing a term range returns
+views into the mapping without reading the file, so a process only pages in the terms
+it actually converts. With ``--chunk-size``, ``VHDOrchestrator.py --hamiltonian``
+sends each worker a ``term_range`` task naming the store and a range of terms instead
+of the terms themselves, and the worker maps the store and reads only that range. The
+store must then be on a filesystem every worker sees under the same path.
+"""
+
+import json
+import os
+import re
+from itertools import islice
+
+import numpy as np
+from qiskit.quantum_info import PauliList, SparsePauliOp
+
+from .tracing import span
+from .wire_format import encode_message, decode_message, decode_pauli_op, message_kind
+
+STORE_VERSION = 1
+HEADER_FILE = 'header.json'
+STORE_SUFFIX = '.store'
+STORE_CHUNK_TERMS = 65536   # terms parsed and written at a time
+
+_OPENFERMION_TERM = re.compile(r'^\s*(\S+)\s*\[([^\]]*)\]\s*\+?\s*$')
+_OPENFERMION_FACTOR = re.compile(r'([XYZ])(\d+)')
+_LABEL_CODES = np.frombuffer(b'IXYZ', dtype=np.uint8)
+
+
+def _term_lines(path):
+    """Non-empty, non-comment lines of a Hamiltonian file, with their line numbers."""
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield number, line
+
+
+def detect_format(path):
+    """'openfermion' if the first term of a file has the ``coeff [X0 Y1]`` form, else 'text'."""
+    for _, line in _term_lines(path):
+        return 'openfermion' if '[' in line else 'text'
+    return 'text'
+
+
+def _parse_text(lines, num_qubits):
+    """X and Z bit matrices and coefficients of a chunk of ``label coeff`` lines."""
+    labels = []
+    coeffs = np.empty(len(lines), dtype=np.complex128)
+    for i, (number, line) in enumerate(lines):
+        try:
+            label, coeff = line.split()
+            coeffs[i] = complex(coeff)
+        except ValueError:
+            raise ValueError(f"Line {number}: expected 'label coeff', got {line!r}") from None
+        if len(label) != num_qubits:
+            raise ValueError(f"Line {number}: label {label!r} does not have {num_qubits} qubits")
+        labels.append(label)
+
+    # Qiskit labels put qubit 0 last, so reverse the characters to index columns by qubit.
+    chars = np.frombuffer(''.join(labels).encode(), dtype=np.uint8).reshape(len(lines), num_qubits)[:, ::-1]
+    invalid = ~np.isin(chars, _LABEL_CODES).all(axis=1)
+    if invalid.any():
+        number, line = lines[int(np.argmax(invalid))]
+        raise ValueError(f"Line {number}: label {line.split()[0]!r} has characters other than I, X, Y and Z")
+    x = (chars == ord('X')) | (chars == ord('Y'))
+    z = (chars == ord('Z')) | (chars == ord('Y'))
+    return x, z, coeffs
+
+
+def _parse_openfermion(lines, num_qubits):
+    """X and Z bit matrices and coefficients of a chunk of ``coeff [X0 Y1]`` lines."""
+    x = np.zeros((len(lines), num_qubits), dtype=bool)
+    z = np.zeros((len(lines), num_qubits), dtype=bool)
+    coeffs = np.empty(len(lines), dtype=np.complex128)
+    for i, (number, line) in enumerate(lines):
+        match = _OPENFERMION_TERM.match(line)
+        try:
+            coeffs[i] = complex(match.group(1))
+        except (AttributeError, ValueError):
+            raise ValueError(f"Line {number}: expected 'coeff [X0 Y1 ...]', got {line!r}") from None
+        for pauli, qubit in _OPENFERMION_FACTOR.findall(match.group(2)):
+            qubit = int(qubit)
+            if qubit >= num_qubits:
+                raise ValueError(f"Line {number}: qubit {qubit} is outside a {num_qubits}-qubit register")
+            x[i, qubit] = pauli != 'Z'
+            z[i, qubit] = pauli != 'X'
+    return x, z, coeffs
+
+
+def _openfermion_num_qubits(path):
+    """Register width of an OpenFermion file: one more than the highest qubit index in it."""
+    highest = -1
+    for _, line in _term_lines(path):
+        for qubit in re.findall(r'[XYZ](\d+)', line):
+            highest = max(highest, int(qubit))
+    return highest + 1
+
+
+def _text_num_qubits(path):
+    for _, line in _term_lines(path):
+        return len(line.split()[0])
+    return 0
+
+
+class _StoreWriter:
+    """Appends packed terms to the files of a new store; the header is written last."""
+
+    def __init__(self, path, num_qubits):
+        os.makedirs(path, exist_ok=True)
+        header = os.path.join(path, HEADER_FILE)
+        if os.path.exists(header):
+            # A store without a header cannot be opened, so a half-written one is never read.
+            os.remove(header)
+        self.path = path
+        self.num_qubits = num_qubits
+        self.num_terms = 0
+        self.files = {name: open(os.path.join(path, f'{name}.bin'), 'wb') for name in ('x', 'z', 'coeffs')}
+
+    def append(self, x, z, coeffs):
+        self.files['x'].write(np.packbits(x, axis=1, bitorder='little').tobytes())
+        self.files['z'].write(np.packbits(z, axis=1, bitorder='little').tobytes())
+        self.files['coeffs'].write(np.asarray(coeffs, dtype=np.complex128).tobytes())
+        self.num_terms += len(coeffs)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        header = {'version': STORE_VERSION, 'num_qubits': self.num_qubits, 'num_terms': self.num_terms,
+                  'row_bytes': -(-self.num_qubits // 8)}
+        temporary = os.path.join(self.path, HEADER_FILE + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(header, f)
+        os.replace(temporary, os.path.join(self.path, HEADER_FILE))
+
+
+def write_hamiltonian_store(source, path, format='auto', num_qubits=None, chunk_terms=STORE_CHUNK_TERMS):
+    """
+    Stream a Hamiltonian file (or a SparsePauliOp) into a store.
+
+    Parameters:
+    - source (str or SparsePauliOp): Text or OpenFermion file, or an operator.
+    - path (str): Store directory, created if needed and overwritten if it holds a store.
+    - format (str): 'text', 'openfermion' or 'auto' to tell them apart by the first term.
+    - num_qubits (int): Register width. If omitted it is the label length of a text
+      file, or found by a first pass over an OpenFermion file.
+    - chunk_terms (int): Terms parsed and written at a time.
+
+    Returns:
+    - HamiltonianStore: The new store.
+    """
+    if isinstance(source, SparsePauliOp):
+        writer = _StoreWriter(path, source.num_qubits)
+        paulis = source.paulis
+        for start in range(0, len(source), chunk_terms):
+            stop = start + chunk_terms
+            writer.append(paulis.x[start:stop], paulis.z[start:stop], source.coeffs[start:stop])
+        writer.close()
+        return HamiltonianStore(path)
+
+    if format == 'auto':
+        format = detect_format(source)
+    if format == 'text':
+        parse, width = _parse_text, _text_num_qubits
+    elif format == 'openfermion':
+        parse, width = _parse_openfermion, _openfermion_num_qubits
+    else:
+        raise ValueError(f"Unknown Hamiltonian format {format!r}, expected 'text', 'openfermion' or 'auto'")
+    if num_qubits is None:
+        num_qubits = width(source)
+
+    with span('write hamiltonian store', source=str(source)):
+        writer = _StoreWriter(path, num_qubits)
+        lines = _term_lines(source)
+        while chunk := list(islice(lines, chunk_terms)):
+            writer.append(*parse(chunk, num_qubits))
+        writer.close()
+    return HamiltonianStore(path)
+
+
+class HamiltonianStore:
+    """
+    Read-only, memory-mapped view of a store written by ``write_hamiltonian_store``.
+
+    Parameters:
+    - path (str): Store directory.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(os.path.join(self.path, HEADER_FILE)) as f:
+            header = json.load(f)
+        if header['version'] != STORE_VERSION:
+            raise ValueError(f"Unsupported Hamiltonian store version {header['version']} (expected {STORE_VERSION})")
+        self.num_qubits = header['num_qubits']
+        self.num_terms = header['num_terms']
+        row_bytes = header['row_bytes']
+        self.x = self._map('x', np.uint8, (self.num_terms, row_bytes))
+        self.z = self._map('z', np.uint8, (self.num_terms, row_bytes))
+        self.coeffs = self._map('coeffs', np.complex128, (self.num_terms,))
+
+    def _map(self, name, dtype, shape):
+        if not self.num_terms:
+            # An empty file cannot be mapped.
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, f'{name}.bin'), dtype=dtype, mode='r', shape=shape)
+
+    def __len__(self):
+        return self.num_terms
+
+    def packed(self, start=0, stop=None):
+        """Packed X and Z rows and coefficients of a term range, as views into the mapping."""
+        return self.x[start:stop], self.z[start:stop], self.coeffs[start:stop]
+
+    def symplectic(self, start=0, stop=None):
+        """X and Z bool matrices and coefficients of a term range; only this range is read."""
+        x, z, coeffs = self.packed(start, stop)
+        return (np.unpackbits(x, axis=1, count=self.num_qubits, bitorder='little').astype(bool),
+                np.unpackbits(z, axis=1, count=self.num_qubits, bitorder='little').astype(bool),
+                np.array(coeffs))
+
+    def slice(self, start=0, stop=None):
+        """The terms ``start:stop`` as a SparsePauliOp."""
+        x, z, coeffs = self.symplectic(start, stop)
+        return SparsePauliOp(PauliList.from_symplectic(z, x), coeffs)
+
+    def to_operator(self):
+        """Every term as one SparsePauliOp."""
+        return self.slice()
+
+
+def open_hamiltonian_store(path, format='auto'):
+    """
+    Store for a ``--hamiltonian`` argument.
+
+    A store directory is opened as is. A Hamiltonian file is converted into the store
+    ``path + STORE_SUFFIX`` first, unless that store is newer than the file.
+
+    Returns:
+    - HamiltonianStore.
+    """
+    if os.path.isdir(path):
+        return HamiltonianStore(path)
+    store_path = path + STORE_SUFFIX
+    header = os.path.join(store_path, HEADER_FILE)
+    if os.path.exists(header) and os.path.getmtime(header) >= os.path.getmtime(path):
+        return HamiltonianStore(store_path)
+    return write_hamiltonian_store(path, store_path, format)
+
+
+def encode_term_range(store, start, stop, **fields):
+    """Encode a task naming a range of terms of a store (and scalar fields such as the task id)."""
+    return encode_message('term_range', dict(fields, store=store.path, start=start, stop=stop))
+
+
+def term_range_messages(store, chunk_size, **fields):
+    """
+    Yield one ``term_range`` task per slice of ``chunk_size`` consecutive terms of a store.
+
+    Like ``bulk_submission.term_chunk_messages``, but each message only names its range,
+    so it is a few hundred bytes whatever the chunk size and no term is read to encode it.
+    """
+    for task_id, start in enumerate(range(0, len(store), chunk_size)):
+        yield encode_term_range(store, start, min(start + chunk_size, len(store)), id=task_id, **fields)
+
+
+def decode_hamiltonian_task(message, stores):
+    """
+    Decode a task carrying terms, either inline (``pauli_op``) or as a ``term_range``.
+
+    Parameters:
+    - message (bytes): The task.
+    - stores (dict): Path -> HamiltonianStore already opened by this process; stores
+      named by a task are opened and added to it.
+
+    Returns:
+    - SparsePauliOp: The task's terms.
+    - dict: The scalar fields sent with it.
+    """
+    if message_kind(message) != 'term_range':
+        return decode_pauli_op(message)
+    fields, _ = decode_message(message, 'term_range')
+    path = fields.pop('store')
+    store = stores.get(path)
+    if store is None:
+        store = stores[path] = HamiltonianStore(path)
+    return store.slice(fields.pop('start'), fields.pop('stop')), fields
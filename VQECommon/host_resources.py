@@ -0,0 +1,233 @@
+"""
+Host-aware Aer simulator configuration for workers sharing a machine.
+
+A default ``AerSimulator()`` lets OpenMP use every core of the host, so N worker
+processes on one machine run N times as many threads as there are cores and thrash.
+``HostResources`` sizes the simulators of one worker process instead:
+
+- it detects the cores and memory available to the process (CPU affinity and cgroup
+  limits included, so containers get their own share, not the host's);
+- it divides them by the number of workers on the host. The number is given
+  explicitly, or counted through Redis: every worker registers under its host name
+  and counts the live registrations;
+- it sets ``max_parallel_threads`` to the worker's cores, ``max_parallel_experiments``
+  to the same number (narrow circuits are simulated side by side rather than one at a
+  time, Aer keeps wide ones to as many as fit in ``max_memory_mb``) and
+  ``max_memory_mb`` to the worker's share of the memory;
+- given the qubit count, it picks the method: a double-precision statevector if it
+  fits in the memory share, a single-precision one if only that fits, and a matrix
+  product state otherwise.
+
+Simulators created or configured through a ``HostResources`` are reconfigured by
+``refresh`` when the number of workers on the host changes.
+"""
+
+import os
+import socket
+import time
+
+from qiskit_aer import AerSimulator
+
+from .exact_estimator import DEFAULT_MEMORY_BUDGET
+
+SLOT_KEY_PREFIX = 'host:'
+DEFAULT_SLOT_TTL = 600              # seconds a worker's registration outlives its last refresh
+DEFAULT_MEMORY_FRACTION = 0.8       # share of the available memory given to the workers
+WORKERS_PER_HOST_ENV = 'VQE_WORKERS_PER_HOST'
+_MB = 1024 ** 2
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_cores():
+    """CPU quota of the process's cgroup in cores, or None if it has none."""
+    quota = _read('/sys/fs/cgroup/cpu.max')                                 # cgroup v2: "quota period"
+    if quota is not None:
+        limit, period = quota.split()
+        return None if limit == 'max' else int(limit) / int(period)
+    limit, period = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us'), _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if limit is not None and period is not None and int(limit) > 0:
+        return int(limit) / int(period)
+    return None
+
+
+def _cgroup_memory():
+    """Memory limit of the process's cgroup in bytes, or None if it has none."""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        limit = _read(path)
+        # cgroup v1 reports "no limit" as a huge number rather than 'max'.
+        if limit is not None and limit != 'max' and int(limit) < 2 ** 60:
+            return int(limit)
+    return None
+
+
+def _available_memory():
+    meminfo = _read('/proc/meminfo')
+    if meminfo is not None:
+        for line in meminfo.splitlines():
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) * 1024
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+
+
+def detect_host():
+    """
+    Cores and memory available to this process.
+
+    Returns:
+    - dict: 'host' (host name), 'cores' (int) and 'memory' (bytes).
+    """
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    quota = _cgroup_cores()
+    if quota is not None:
+        cores = min(cores, max(1, int(quota)))
+    memory = _available_memory()
+    limit = _cgroup_memory()
+    if limit is not None:
+        memory = min(memory, limit)
+    return {'host': socket.gethostname(), 'cores': cores, 'memory': memory}
+
+
+def plan_simulator(host, workers=1, num_qubits=None, exact=False, memory_fraction=DEFAULT_MEMORY_FRACTION):
+    """
+    AerSimulator options for one of ``workers`` workers on ``host``.
+
+    Parameters:
+    - host (dict): As returned by ``detect_host``.
+    - workers (int): Workers sharing the host.
+    - num_qubits (int): Width of the circuits; the method is left to Aer if omitted.
+    - exact (bool): Plan for exact statevectors: always a double-precision statevector.
+    - memory_fraction (float): Share of the host's memory given to all its workers.
+
+    Returns:
+    - dict: Options for ``AerSimulator(**options)`` or ``set_options``.
+    """
+    workers = max(1, workers)
+    threads = max(1, host['cores'] // workers)
+    budget = host['memory'] * memory_fraction / workers
+    options = {
+        'max_parallel_threads': threads,
+        'max_parallel_experiments': threads,
+        'max_memory_mb': max(1, int(budget // _MB)),
+    }
+    if exact:
+        options.update(method='statevector', precision='double')
+    elif num_qubits is not None:
+        if 16 * 2 ** num_qubits <= budget:
+            options.update(method='statevector', precision='double')
+        elif 8 * 2 ** num_qubits <= budget:
+            options.update(method='statevector', precision='single')
+        else:
+            options.update(method='matrix_product_state', precision='double')
+    return options
+
+
+class HostResources:
+    """
+    Simulator sizing for one worker process among the workers of its host.
+
+    Parameters:
+    - workers (int): Workers sharing the host. If omitted, ``VQE_WORKERS_PER_HOST``
+      is used if set, else the workers registered through ``r``, else 1.
+    - r (redis.Redis): Registers this process under its host name so that the workers
+      of a host count each other.
+    - memory_fraction (float): Share of the host's memory given to all its workers.
+    - ttl (float): Seconds a registration is counted after its last refresh.
+    """
+
+    def __init__(self, workers=None, r=None, memory_fraction=DEFAULT_MEMORY_FRACTION, ttl=DEFAULT_SLOT_TTL):
+        self.host = detect_host()
+        if workers is None and os.environ.get(WORKERS_PER_HOST_ENV):
+            workers = int(os.environ[WORKERS_PER_HOST_ENV])
+        self.fixed_workers = workers
+        self.r = r if workers is None else None
+        self.memory_fraction = memory_fraction
+        self.ttl = ttl
+        self.key = SLOT_KEY_PREFIX + self.host['host']
+        self.member = f"{os.getpid()}:{id(self)}"
+        self._simulators = []       # (simulator, num_qubits, exact)
+        self.workers = self.count_workers()
+
+    def count_workers(self):
+        """Workers on this host, refreshing this process's registration."""
+        if self.fixed_workers is not None:
+            return self.fixed_workers
+        if self.r is None:
+            return 1
+        now = time.time()
+        pipe = self.r.pipeline(transaction=False)
+        pipe.zadd(self.key, {self.member: now + self.ttl})
+        pipe.zremrangebyscore(self.key, '-inf', now)
+        pipe.zcard(self.key)
+        pipe.expire(self.key, int(self.ttl))
+        return max(1, pipe.execute()[2])
+
+    def options(self, num_qubits=None, exact=False):
+        """Simulator options for this worker's share of the host, see ``plan_simulator``."""
+        return plan_simulator(self.host, self.workers, num_qubits, exact, self.memory_fraction)
+
+    def configure(self, simulator, num_qubits=None, exact=False):
+        """Apply this worker's options to ``simulator`` and keep it up to date on ``refresh``."""
+        simulator.set_options(**self.options(num_qubits, exact))
+        self._simulators = [entry for entry in self._simulators if entry[0] is not simulator]
+        self._simulators.append((simulator, num_qubits, exact))
+        return simulator
+
+    def simulator(self, num_qubits=None, exact=False):
+        """A new AerSimulator sized for this worker."""
+        return self.configure(AerSimulator(), num_qubits, exact)
+
+    def memory_budget(self):
+        """Bytes of this worker's share of the memory."""
+        return self.options()['max_memory_mb'] * _MB
+
+    def exact_options(self):
+        """Keyword arguments giving an ``ExactEstimator`` this worker's simulator and memory, at most its default."""
+        return {'simulator': self.simulator(exact=True),
+                'memory_budget': min(self.memory_budget(), DEFAULT_MEMORY_BUDGET)}
+
+    def refresh(self):
+        """
+        Count the workers on the host again and resize the simulators if it changed.
+
+        Returns:
+        - int: Workers on the host.
+        """
+        workers = self.count_workers()
+        if workers != self.workers:
+            self.workers = workers
+            for simulator, num_qubits, exact in self._simulators:
+                simulator.set_options(**self.options(num_qubits, exact))
+        return workers
+
+    def summary(self):
+        """One-line description of the host and of this worker's share, for worker logs."""
+        options = self.options()
+        return (f"host {self.host['host']}: {self.host['cores']} cores, {self.host['memory'] / 2 ** 30:.1f} GiB "
+                f"shared by {self.workers} worker(s); {options['max_parallel_threads']} thread(s) and "
+                f"{options['max_memory_mb']} MB per worker")
+
+    def close(self):
+        """Remove this process's registration."""
+        if self.r is not None:
+            self.r.zrem(self.key, self.member)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_host_resources(workers=None, r=None):
+    """``HostResources`` for a worker, with its summary printed."""
+    resources = HostResources(workers, r)
+    print(f"Simulator resources: {resources.summary()}")
+    return resources
+
@@ -0,0 +1,229 @@
+"""
+Asynchronous island-model optimization for the VSP experiments.
+
+Every island (one VSP task, run by whichever worker takes it) evolves its own
+population with a separable CMA-ES (``SeparableCMAES``, Ros and Hansen, "A Simple
+Modification in CMA-ES Achieving Linear Time and Space Complexity", 2008). It adapts a
+diagonal covariance, so a generation costs O(n) for an ansatz with n parameters. Each
+generation is evaluated in one estimator job with ``cost_func_batch``.
+
+Islands share their elites through an ``EliteBoard``, a Redis sorted set ranked by
+energy. Every ``migrate_every`` generations an island publishes its best parameters and
+reads the best entries of the other islands. It injects those that beat its own best into
+its next selection, with the step length clipped as proposed by Hansen ("Injecting
+External Solutions Into CMA-ES", 2011). Publishing and reading are single round trips
+that never wait for another island, so a slow worker never blocks a fast one and
+islands can start, finish or die at any time.
+"""
+
+import time
+
+import numpy as np
+
+from .cost_history import CostHistory
+from .lockstep_population import cost_func_batch
+from .tracing import span
+from .wire_format import encode_parameters, decode_parameters
+
+BOARD_KEY_PREFIX = 'islands:'
+BOARD_TTL = 24 * 3600           # seconds a board outlives its last update
+DEFAULT_BOARD_SIZE = 64         # elites kept on a board
+DEFAULT_SIGMA0 = 0.5            # initial step size (radians)
+DEFAULT_MIGRATE_EVERY = 5       # generations between migrations
+DEFAULT_MIGRANTS = 2            # migrants injected per migration at most
+DEFAULT_ISLAND_BUDGET = 2000    # evaluations of one island
+DEFAULT_MIN_SIGMA = 1e-4        # step size at which an island has converged
+
+
+class EliteBoard:
+    """
+    Best parameters published by the islands of one run, in a Redis sorted set.
+
+    Parameters:
+    - r (redis.Redis): Client created with decode_responses=False.
+    - board_id (str): Identifies the run; all its islands use the same board.
+    - size (int): Elites kept; worse entries are dropped.
+    """
+
+    def __init__(self, r, board_id, size=DEFAULT_BOARD_SIZE):
+        self.r = r
+        self.key = BOARD_KEY_PREFIX + board_id
+        self.size = size
+
+    def publish(self, island, params, energy):
+        """Add an island's best point and drop the entries beyond ``size``."""
+        member = encode_parameters(params, island=island, energy=float(energy), published_at=time.time())
+        pipe = self.r.pipeline(transaction=False)
+        pipe.zadd(self.key, {member: float(energy)})
+        pipe.zremrangebyrank(self.key, self.size, -1)
+        pipe.expire(self.key, BOARD_TTL)
+        pipe.execute()
+
+    def best(self, count, exclude=None):
+        """
+        The best entries of the board.
+
+        Parameters:
+        - count (int): Entries returned at most.
+        - exclude (str): Island whose own entries are skipped.
+
+        Returns:
+        - list of (numpy.ndarray, float, str): Parameters, energy and island, best first.
+        """
+        elites = []
+        for member in self.r.zrange(self.key, 0, self.size - 1):
+            params, fields = decode_parameters(member)
+            if fields['island'] != exclude:
+                elites.append((np.array(params), fields['energy'], fields['island']))
+                if len(elites) == count:
+                    break
+        return elites
+
+    def clear(self):
+        self.r.delete(self.key)
+
+
+class SeparableCMAES:
+    """
+    CMA-ES with a diagonal covariance matrix, driven through ``ask`` and ``tell``.
+
+    Parameters:
+    - x0 (numpy.ndarray): Initial mean.
+    - sigma0 (float): Initial step size.
+    - popsize (int): Candidates per generation; 4 + 3 ln(n) if omitted.
+    - rng (numpy.random.Generator): Source of the samples.
+    """
+
+    def __init__(self, x0, sigma0=DEFAULT_SIGMA0, popsize=None, rng=None):
+        self.mean = np.array(x0, dtype=float)
+        n = self.mean.size
+        self.n = n
+        self.sigma = sigma0
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.popsize = popsize or 4 + int(3 * np.log(n))
+        self.mu = self.popsize // 2
+        weights = np.log(self.mu + 0.5) - np.log(np.arange(1, self.mu + 1))
+        self.weights = weights / weights.sum()
+        self.mueff = 1 / np.sum(self.weights ** 2)
+
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.ds = 1 + 2 * max(0.0, np.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        # The diagonal model has n instead of n^2/2 parameters to learn, so it learns faster.
+        c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        cmu = min(1 - c1, 2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2) ** 2 + self.mueff))
+        self.c1 = min(1.0, c1 * (n + 2) / 3)
+        self.cmu = min(1 - self.c1, cmu * (n + 2) / 3)
+        self.chi_n = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+        # Longest normalized step an injected solution may take.
+        self.max_step = np.sqrt(n) + 2 * n / (n + 2)
+
+        self.variances = np.ones(n)
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.generation = 0
+        self.best_x = self.mean.copy()
+        self.best_f = np.inf
+
+    def ask(self, count=None):
+        """Sample ``count`` (default ``popsize``) candidates around the mean."""
+        z = self.rng.standard_normal((count if count is not None else self.popsize, self.n))
+        return self.mean + self.sigma * np.sqrt(self.variances) * z
+
+    def tell(self, candidates, energies):
+        """
+        Update the distribution from evaluated candidates.
+
+        Candidates may include points that were not sampled by ``ask`` (migrants); their
+        steps are clipped to the length a sampled step could have.
+        """
+        candidates = np.asarray(candidates, dtype=float)
+        energies = np.asarray(energies, dtype=float)
+        best = int(np.argmin(energies))
+        if energies[best] < self.best_f:
+            self.best_f = float(energies[best])
+            self.best_x = candidates[best].copy()
+
+        steps = (candidates - self.mean) / self.sigma
+        lengths = np.linalg.norm(steps / np.sqrt(self.variances), axis=1)
+        steps *= np.minimum(1.0, self.max_step / np.maximum(lengths, 1e-300))[:, None]
+
+        selected = steps[np.argsort(energies, kind='stable')[:self.mu]]
+        step = self.weights @ selected
+        self.mean = self.mean + self.sigma * step
+
+        self.ps = (1 - self.cs) * self.ps + np.sqrt(self.cs * (2 - self.cs) * self.mueff) * step / np.sqrt(self.variances)
+        self.generation += 1
+        ps_norm = np.linalg.norm(self.ps)
+        hsig = ps_norm / np.sqrt(1 - (1 - self.cs) ** (2 * self.generation)) < (1.4 + 2 / (self.n + 1)) * self.chi_n
+        self.pc = (1 - self.cc) * self.pc + hsig * np.sqrt(self.cc * (2 - self.cc) * self.mueff) * step
+        self.variances = ((1 - self.c1 - self.cmu) * self.variances
+                          + self.c1 * (self.pc ** 2 + (1 - hsig) * self.cc * (2 - self.cc) * self.variances)
+                          + self.cmu * (self.weights @ selected ** 2))
+        self.sigma *= np.exp(min(1.0, (self.cs / self.ds) * (ps_norm / self.chi_n - 1)))
+
+
+def run_island(ansatz, hamiltonian, estimator, x0, board, island, maxiter=DEFAULT_ISLAND_BUDGET,
+               sigma0=DEFAULT_SIGMA0, popsize=None, migrate_every=DEFAULT_MIGRATE_EVERY,
+               migrants=DEFAULT_MIGRANTS, min_sigma=DEFAULT_MIN_SIGMA, seed=None):
+    """
+    Evolve one island until its evaluation budget is spent or its step size collapses.
+
+    Parameters:
+    - ansatz (QuantumCircuit): The quantum circuit ansatz.
+    - hamiltonian (SparsePauliOp): The Hamiltonian operator.
+    - estimator (Estimator): Estimator evaluating every generation in one job.
+    - x0 (numpy.ndarray): Initial mean of the island.
+    - board (EliteBoard): Board shared with the other islands; None for an isolated island.
+    - island (str): Name of this island on the board.
+    - maxiter (int): Energy evaluations of the island.
+    - sigma0 (float): Initial step size.
+    - popsize (int): Candidates per generation, see ``SeparableCMAES``.
+    - migrate_every (int): Generations between exchanges with the board.
+    - migrants (int): Elites of other islands injected per exchange at most.
+    - min_sigma (float): Step size below which the island stops.
+    - seed (int): Seed of the island's samples.
+
+    Returns:
+    - dict: 'energy', 'params', 'success', 'message' and 'nfev' like a minimization
+      result, plus 'generations', 'immigrants' (elites injected) and the
+      'cost_iterations' and 'cost_history' arrays of the evaluated candidates.
+    """
+    es = SeparableCMAES(x0, sigma0, popsize, np.random.default_rng(seed))
+    history = CostHistory()
+    nfev = 0
+    immigrants = 0
+    incoming = []
+    while nfev + es.popsize - len(incoming) <= maxiter and es.sigma > min_sigma:
+        candidates = es.ask(es.popsize - len(incoming))
+        energies = cost_func_batch(candidates, ansatz, hamiltonian, estimator)
+        history.extend(np.arange(nfev, nfev + len(candidates)), energies)
+        nfev += len(candidates)
+        if incoming:
+            candidates = np.vstack([candidates] + [params for params, _ in incoming])
+            energies = np.concatenate([energies, [energy for _, energy in incoming]])
+            immigrants += len(incoming)
+            incoming = []
+        es.tell(candidates, energies)
+
+        if board is not None and es.generation % migrate_every == 0:
+            with span('migrate', island=island):
+                board.publish(island, es.best_x, es.best_f)
+                incoming = [(params, energy) for params, energy, _ in board.best(migrants, exclude=island)
+                            if energy < es.best_f]
+    if board is not None:
+        board.publish(island, es.best_x, es.best_f)
+
+    converged = es.sigma <= min_sigma
+    cost_iterations, cost_history = history.retained()
+    return {
+        'energy': es.best_f,
+        'params': es.best_x.tolist(),
+        'success': bool(converged),
+        'message': 'Step size below min_sigma' if converged else 'Evaluation budget exhausted',
+        'nfev': nfev,
+        'generations': es.generation,
+        'immigrants': immigrants,
+        'cost_iterations': cost_iterations,
+        'cost_history': cost_history,
+    }
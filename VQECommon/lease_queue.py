@@ -0,0 +1,259 @@
+"""
+Shared work queue with leases, so any worker can take any task and none is lost.
+
+Tasks wait in ``{name}:pending``. A worker reserves one by atomically moving it into its
+own ``{name}:processing:{worker}`` list and recording a lease deadline in the
+``{name}:leases`` sorted set. While it works on the task it renews the lease; when it is
+done it acknowledges the task, which removes it and (optionally) appends the result to
+a Redis Stream (see ``redis_transport``) in the same atomic step. Leases that run past their visibility timeout, e.g. because the
+worker crashed, are moved back to the front of the pending list by ``requeue_expired``,
+and a worker whose handler fails hands its task back at once with ``release``.
+
+Deliveries are counted in ``{name}:attempts``. A task that was delivered
+``max_deliveries`` times without being acknowledged is moved to ``{name}:dead``
+instead of the pending list, so a message that always fails (or kills its worker)
+stops circulating.
+
+All state changes are Lua scripts, so a task is always in exactly one place, and every
+key a script touches is passed in KEYS. Deadlines use the Redis server clock, so
+workers on different hosts agree on them.
+"""
+
+import inspect
+import threading
+
+from .redis_transport import PAYLOAD_FIELD
+
+DEFAULT_VISIBILITY_TIMEOUT = 60.0
+DEFAULT_MAX_DELIVERIES = 3      # deliveries of a task before it is dead-lettered
+
+_RESERVE = """
+local message = redis.call('LMOVE', KEYS[1], KEYS[2], 'LEFT', 'RIGHT')
+if message then
+    local now = redis.call('TIME')
+    redis.call('ZADD', KEYS[3], now[1] + now[2] / 1e6 + tonumber(ARGV[1]), message)
+    redis.call('HSET', KEYS[4], message, ARGV[2])
+    redis.call('HINCRBY', KEYS[5], message, 1)
+end
+return message
+"""
+
+_RENEW = """
+if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+local now = redis.call('TIME')
+redis.call('ZADD', KEYS[1], 'XX', now[1] + now[2] / 1e6 + tonumber(ARGV[3]), ARGV[1])
+return 1
+"""
+
+_ACK = """
+if redis.call('HGET', KEYS[3], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('LREM', KEYS[1], 1, ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+if ARGV[3] ~= '' then
+    redis.call('XADD', ARGV[3], '*', ARGV[5], ARGV[4])
+end
+return 1
+"""
+
+_EXPIRED = """
+local now = redis.call('TIME')
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now[1] + now[2] / 1e6)
+local found = {}
+for _, message in ipairs(expired) do
+    table.insert(found, message)
+    table.insert(found, redis.call('HGET', KEYS[2], message) or '')
+end
+return found
+"""
+
+# The owner's processing list is passed in KEYS, so every key a script touches is
+# declared (as Redis Cluster requires). For expired leases (ARGV[4] = '1') the lease is
+# checked again since it may have been renewed or acknowledged after _EXPIRED listed it.
+# Returns 1 if the task went back to the pending list, 2 if it was dead-lettered.
+_REQUEUE = """
+if (redis.call('HGET', KEYS[4], ARGV[1]) or '') ~= ARGV[2] then
+    return 0
+end
+if ARGV[4] == '1' then
+    local deadline = redis.call('ZSCORE', KEYS[3], ARGV[1])
+    local now = redis.call('TIME')
+    if not deadline or tonumber(deadline) > now[1] + now[2] / 1e6 then
+        return 0
+    end
+end
+redis.call('LREM', KEYS[2], 1, ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+if tonumber(redis.call('HGET', KEYS[5], ARGV[1]) or '0') >= tonumber(ARGV[3]) then
+    redis.call('HDEL', KEYS[5], ARGV[1])
+    redis.call('RPUSH', KEYS[6], ARGV[1])
+    return 2
+end
+redis.call('LPUSH', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+def _pairs(flat):
+    return zip(flat[::2], flat[1::2])
+
+
+class LeaseQueue:
+    """
+    Reliable shared queue backed by Redis lists, a lease sorted set and an owner hash.
+
+    Task messages must be unique (e.g. JSON containing the task id), since they are
+    also used as lease identifiers.
+
+    With a ``redis.asyncio`` client, ``requeue_expired``, ``pending_count`` and
+    ``leased_count`` return awaitables, which is all an asyncio orchestrator needs.
+
+    Parameters:
+    - r (redis.Redis): Redis connection.
+    - name (str): Key prefix of the queue.
+    - visibility_timeout (float): Seconds a reservation stays valid without renewal.
+    - max_deliveries (int): Deliveries of a task before it is moved to ``dead_key``.
+    """
+
+    def __init__(self, r, name, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, max_deliveries=DEFAULT_MAX_DELIVERIES):
+        self.r = r
+        self.name = name
+        self.visibility_timeout = visibility_timeout
+        self.max_deliveries = max_deliveries
+        self.pending_key = f'{name}:pending'
+        self.leases_key = f'{name}:leases'
+        self.owners_key = f'{name}:owners'
+        self.attempts_key = f'{name}:attempts'
+        self.dead_key = f'{name}:dead'
+        self._reserve = r.register_script(_RESERVE)
+        self._renew = r.register_script(_RENEW)
+        self._ack = r.register_script(_ACK)
+        self._expired = r.register_script(_EXPIRED)
+        self._requeue = r.register_script(_REQUEUE)
+
+    def processing_key(self, worker_id):
+        return f'{self.name}:processing:{worker_id}'
+
+    def push(self, messages):
+        """Append task messages to the pending list in one round trip."""
+        messages = list(messages)
+        if messages:
+            self.r.rpush(self.pending_key, *messages)
+
+    def reserve(self, worker_id, timeout=0):
+        """
+        Take the oldest pending task and lease it to ``worker_id``.
+
+        Parameters:
+        - worker_id (str): Worker taking the task.
+        - timeout (float): Seconds to wait for a task; 0 returns immediately.
+
+        Returns:
+        - str or None: The task message, or None if none arrived in time.
+        """
+        self.requeue_expired()
+        keys = [self.pending_key, self.processing_key(worker_id), self.leases_key, self.owners_key,
+                self.attempts_key]
+        message = self._reserve(keys=keys, args=[self.visibility_timeout, worker_id])
+        if message is None and timeout:
+            # Block until the pending list is non-empty without consuming from it
+            # (moving the head onto itself), then try to reserve again.
+            if self.r.blmove(self.pending_key, self.pending_key, timeout, 'LEFT', 'LEFT') is not None:
+                message = self._reserve(keys=keys, args=[self.visibility_timeout, worker_id])
+        return message
+
+    def renew(self, worker_id, message):
+        """Extend the lease of ``message``; returns False if the worker no longer owns it."""
+        return bool(self._renew(keys=[self.leases_key, self.owners_key],
+                                args=[message, worker_id, self.visibility_timeout]))
+
+    def ack(self, worker_id, message, result_stream=None, result=None):
+        """
+        Mark ``message`` as done and optionally add its result to ``result_stream`` atomically.
+
+        Returns:
+        - bool: False if the lease had expired and the task was handed to another worker,
+          in which case the result is dropped.
+        """
+        return bool(self._ack(
+            keys=[self.processing_key(worker_id), self.leases_key, self.owners_key, self.attempts_key],
+            args=[message, worker_id, result_stream or '', result or '', PAYLOAD_FIELD],
+        ))
+
+    def release(self, worker_id, message):
+        """
+        Hand a task the worker failed on back to the pending list, or dead-letter it.
+
+        Returns:
+        - bool: False if the worker no longer owned the task.
+        """
+        return bool(self._requeue_one(message, worker_id, expired_only=False))
+
+    def requeue_expired(self):
+        """
+        Return tasks whose lease ran out to the front of the pending list, or dead-letter
+        those delivered ``max_deliveries`` times.
+
+        Returns:
+        - int: Tasks taken from expired leases.
+        """
+        expired = self._expired(keys=[self.leases_key, self.owners_key])
+        if inspect.isawaitable(expired):
+            return self._requeue_expired_async(expired)
+        return sum(bool(self._requeue_one(message, owner)) for message, owner in _pairs(expired))
+
+    async def _requeue_expired_async(self, expired):
+        requeued = 0
+        for message, owner in _pairs(await expired):
+            requeued += bool(await self._requeue_one(message, owner))
+        return requeued
+
+    def _requeue_one(self, message, owner, expired_only=True):
+        owner = owner.decode() if isinstance(owner, bytes) else owner
+        keys = [self.pending_key, self.processing_key(owner), self.leases_key, self.owners_key,
+                self.attempts_key, self.dead_key]
+        return self._requeue(keys=keys, args=[message, owner, self.max_deliveries, '1' if expired_only else '0'])
+
+    def pending_count(self):
+        return self.r.llen(self.pending_key)
+
+    def leased_count(self):
+        return self.r.zcard(self.leases_key)
+
+    def dead_count(self):
+        return self.r.llen(self.dead_key)
+
+    def keep_leased(self, worker_id, message):
+        """Context manager that renews the lease of ``message`` in the background."""
+        return LeaseRenewer(self, worker_id, message)
+
+
+class LeaseRenewer:
+    """Renews a lease every third of the visibility timeout until the block exits."""
+
+    def __init__(self, queue, worker_id, message):
+        self.queue = queue
+        self.worker_id = worker_id
+        self.message = message
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.queue.visibility_timeout / 3):
+            if not self.queue.renew(self.worker_id, self.message):
+                print(f"Worker {self.worker_id} lost the lease on its current task")
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
@@ -0,0 +1,166 @@
+"""
+Lockstep population minimization for the VQE separate-parameter (VSP) experiments.
+
+Every starting point runs its own SciPy optimizer, but instead of each objective call
+sending its own estimator job, the current parameter vector of every active start is
+stacked into one (N, P) array and sent as a single broadcast EstimatorV2 pub. The
+energies are then split back to the optimizers that asked for them. One estimator job
+is issued per round, however many starts are in the population.
+
+SciPy runs at most one COBYLA per process (``_minimize_cobyla`` holds a module lock),
+so each start's optimizer lives in a small child process that only does the classical
+update and asks this process for energies over a pipe. At most ``max_processes`` (by
+default ``DEFAULT_MAX_PROCESSES``) of these run at once; the other starts wait and are
+launched as running ones finish, so a population of hundreds costs at most that many
+processes, and a round batches the starts running at the time rather than all of them.
+"""
+
+import multiprocessing
+from multiprocessing.connection import wait
+
+import numpy as np
+from scipy.optimize import minimize
+
+from .cost_history import CostHistory
+from .tracing import span
+
+DEFAULT_MAX_PROCESSES = 64  # optimizer processes running at once
+
+
+def cost_func_batch(params_batch, ansatz, hamiltonian, estimator):
+    """
+    Calculates the energy for a whole batch of parameter vectors in one estimator job.
+
+    Parameters:
+    - params_batch (numpy.ndarray): Array of shape (N, P), one parameter vector per row.
+    - ansatz (QuantumCircuit): The quantum circuit ansatz.
+    - hamiltonian (SparsePauliOp): The Hamiltonian operator.
+    - estimator (Estimator): IBM Quantum Runtime estimator.
+
+    Returns:
+    - numpy.ndarray: Array of N energies, in the order of the rows of params_batch.
+    """
+    with span('cost_func', rows=len(params_batch)):
+        pub = (ansatz, [hamiltonian], params_batch)
+        result = estimator.run(pubs=[pub]).result()
+        return np.asarray(result[0].data.evs, dtype=float).reshape(-1)
+
+
+def _minimize_start(conn, initial_param, method, options):
+    """Child process: run one optimizer, asking the parent for every energy."""
+    def objective_function(params):
+        conn.send(('evaluate', np.asarray(params, dtype=float)))
+        return conn.recv()
+
+    try:
+        result = minimize(objective_function, initial_param, method=method, options=options)
+        conn.send(('done', {
+            'energy': float(result.fun),  # Convert to native Python float
+            'params': result.x.tolist(),  # Convert NumPy array to list
+            'success': bool(result.success),  # Convert NumPy bool to Python bool
+            'message': str(result.message),  # Ensure message is a string
+            'nfev': int(result.nfev),
+        }))
+    except Exception as exc:
+        conn.send(('error', repr(exc)))
+    finally:
+        conn.close()
+
+
+def minimize_population_lockstep(ansatz, hamiltonian, estimator, initial_population,
+                                 method='cobyla', options=None, max_processes=DEFAULT_MAX_PROCESSES):
+    """
+    Minimizes the energy from every starting point, batching all objective calls per round.
+
+    A round is evaluated once every start that is still running has asked for its next
+    energy, so with no more starts than ``max_processes`` the number of estimator jobs
+    equals the largest number of function evaluations of any single start, not the sum
+    over the population. Larger populations run ``max_processes`` starts at a time.
+
+    Parameters:
+    - ansatz (QuantumCircuit): The quantum circuit ansatz.
+    - hamiltonian (SparsePauliOp): The Hamiltonian operator.
+    - estimator (Estimator): IBM Quantum Runtime estimator shared by the whole population.
+    - initial_population (list of numpy.ndarray): List of initial parameter sets.
+    - method (str): SciPy minimization method used by every start.
+    - options (dict or list of dict): Options forwarded to scipy.optimize.minimize, or
+      one such dictionary per start.
+    - max_processes (int): Optimizer processes running at once.
+
+    Returns:
+    - results (list of dict): One dictionary per start, in the order of initial_population,
+      containing 'energy', 'params', 'success', 'message' and 'nfev' of the minimization result,
+      and the 'cost_iterations' and 'cost_history' arrays of its evaluations (see ``CostHistory``).
+    - stats (dict): 'population_size', 'rounds' (estimator jobs) and 'evaluations'.
+    """
+    context = multiprocessing.get_context()
+    active = {}
+    processes = {}
+    waiting_starts = iter(enumerate(initial_population))
+
+    def launch_next():
+        for i, initial_param in waiting_starts:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_minimize_start,
+                args=(child_conn, np.asarray(initial_param, dtype=float), method,
+                      options[i] if isinstance(options, list) else options),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            active[parent_conn] = i
+            processes[parent_conn] = process
+            return
+
+    results = [None] * len(initial_population)
+    histories = [CostHistory() for _ in initial_population]
+    pending = {}
+    rounds = 0
+    evaluations = 0
+    try:
+        for _ in range(max(1, max_processes)):
+            launch_next()
+        while active:
+            waiting = [conn for conn in active if conn not in pending]
+            for conn in wait(waiting):
+                try:
+                    kind, payload = conn.recv()
+                except EOFError:
+                    raise RuntimeError(f"Optimizer for start {active[conn]} exited unexpectedly")
+                if kind == 'evaluate':
+                    pending[conn] = payload
+                elif kind == 'done':
+                    start = active.pop(conn)
+                    payload['cost_iterations'], payload['cost_history'] = histories[start].retained()
+                    results[start] = payload
+                    conn.close()
+                    processes.pop(conn).join()
+                    launch_next()
+                else:
+                    raise RuntimeError(f"Optimizer for start {active[conn]} failed: {payload}")
+
+            if pending and len(pending) == len(active):
+                conns = list(pending)
+                energies = cost_func_batch(np.stack([pending[conn] for conn in conns]),
+                                           ansatz, hamiltonian, estimator)
+                for conn, energy in zip(conns, energies):
+                    histories[active[conn]].record(energy)
+                    conn.send(float(energy))
+                rounds += 1
+                evaluations += len(conns)
+                pending = {}
+    finally:
+        for conn in active:
+            conn.close()
+        for process in processes.values():
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+    stats = {
+        'population_size': len(initial_population),
+        'rounds': rounds,
+        'evaluations': evaluations,
+    }
+    return results, stats
@@ -0,0 +1,206 @@
+"""
+Parameter-shift gradients evaluated in parallel, for gradient-based VQE optimizers.
+
+For a circuit in which every parameter drives exactly one Pauli rotation (RY, RZ, ...,
+as in a transpiled ``EfficientSU2``), the exact derivative of the energy is
+
+    dE/dθ_i = (E(θ + π/2 e_i) - E(θ - π/2 e_i)) / 2
+
+so a gradient costs 2·P independent energy evaluations. ``GradientService`` builds those
+shifted parameter vectors (plus θ itself, so value and gradient come from one fan-out),
+hands them to an evaluator and reduces the energies into the gradient:
+
+- ``LocalEvaluator`` splits the batch over a thread pool, each chunk one broadcast
+  estimator job.
+- ``RedisEvaluator`` sends the chunks to the Redis evaluation workers
+  (``VSPWorker.py <id> --evaluate``) through ``evaluation_service``.
+- ``dask_backend.DaskEvaluator`` submits the chunks as Dask futures.
+
+``value_and_gradient`` plugs into ``scipy.optimize.minimize(..., jac=True)`` for
+L-BFGS-B, BFGS, ... and into ``adam``, a SciPy-compatible Adam implementation.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from qiskit.circuit import Parameter
+from scipy.optimize import OptimizeResult
+
+from .evaluation_service import EvaluationClient, store_problem
+from .lockstep_population import cost_func_batch
+
+SHIFT = np.pi / 2
+# Gates exp(-iθG/2) whose generator G has eigenvalues ±1.
+SHIFT_RULE_GATES = frozenset({'rx', 'ry', 'rz', 'p', 'u1', 'rxx', 'ryy', 'rzz', 'rzx'})
+DEFAULT_CHUNK_SIZE = 8
+
+
+def check_parameter_shift(circuit):
+    """
+    Raise ValueError unless the two-term shift rule is exact for every parameter of ``circuit``.
+
+    Each parameter must appear exactly once, unscaled, as the angle of a gate in
+    ``SHIFT_RULE_GATES``.
+    """
+    uses = {parameter: 0 for parameter in circuit.parameters}
+    for instruction in circuit.data:
+        for value in instruction.operation.params:
+            parameters = getattr(value, 'parameters', ())
+            if not parameters:
+                continue
+            if instruction.operation.name not in SHIFT_RULE_GATES or not isinstance(value, Parameter):
+                raise ValueError(f"Parameter-shift rule does not apply to {instruction.operation.name}({value})")
+            uses[value] += 1
+    shared = [str(parameter) for parameter, count in uses.items() if count != 1]
+    if shared:
+        raise ValueError(f"Parameters used more than once: {shared}")
+
+
+def shifted_parameters(params):
+    """
+    Stack θ and the 2·P shifted parameter vectors of the parameter-shift rule.
+
+    Returns:
+    - numpy.ndarray: Shape (2P + 1, P); row 0 is θ, rows 1..P are θ + π/2 e_i and
+      rows P+1..2P are θ - π/2 e_i.
+    """
+    params = np.asarray(params, dtype=float)
+    shifts = SHIFT * np.eye(params.size)
+    return np.vstack([params, params + shifts, params - shifts])
+
+
+def combine_shifted(energies):
+    """
+    Reduce the energies of ``shifted_parameters`` rows into (energy, gradient).
+    """
+    energies = np.asarray(energies, dtype=float)
+    num_params = (energies.size - 1) // 2
+    plus = energies[1:num_params + 1]
+    minus = energies[num_params + 1:]
+    return float(energies[0]), (plus - minus) / 2
+
+
+def _chunks(params_batch, chunk_size):
+    return [params_batch[start:start + chunk_size] for start in range(0, len(params_batch), chunk_size)]
+
+
+class LocalEvaluator:
+    """
+    Evaluate a parameter batch in chunks on a local thread pool.
+
+    Aer releases the GIL while it simulates, so chunks run concurrently.
+
+    Parameters:
+    - ansatz (QuantumCircuit): ISA ansatz circuit.
+    - hamiltonian (SparsePauliOp): Hamiltonian with the ansatz layout applied.
+    - estimator (Estimator): Estimator shared by the threads.
+    - max_workers (int): Pool size; defaults to ThreadPoolExecutor's choice.
+    - chunk_size (int): Parameter vectors per estimator job; by default the batch is
+      split evenly over the pool.
+    """
+
+    def __init__(self, ansatz, hamiltonian, estimator, max_workers=None, chunk_size=None):
+        self.ansatz = ansatz
+        self.hamiltonian = hamiltonian
+        self.estimator = estimator
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.chunk_size = chunk_size
+
+    def __call__(self, params_batch):
+        chunk_size = self.chunk_size or -(-len(params_batch) // self.max_workers)
+        futures = [self.pool.submit(cost_func_batch, chunk, self.ansatz, self.hamiltonian, self.estimator)
+                   for chunk in _chunks(params_batch, chunk_size)]
+        return np.concatenate([future.result() for future in futures])
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class RedisEvaluator:
+    """
+    Evaluate a parameter batch by fanning chunks out to Redis evaluation workers.
+
+    Parameters:
+    - r (redis.Redis): Client created with decode_responses=False.
+    - ansatz (QuantumCircuit): ISA ansatz circuit.
+    - hamiltonian (SparsePauliOp): Hamiltonian with the ansatz layout applied.
+    - chunk_size (int): Parameter vectors per worker task.
+    - timeout (float): Seconds to wait for all chunks of one batch.
+    """
+
+    def __init__(self, r, ansatz, hamiltonian, chunk_size=DEFAULT_CHUNK_SIZE, timeout=300.0):
+        self.client = EvaluationClient(r, timeout)
+        self.chunk_size = chunk_size
+        self.problem_id = store_problem(r, ansatz, hamiltonian)
+
+    def __call__(self, params_batch):
+        chunks = _chunks(np.asarray(params_batch, dtype=float), self.chunk_size)
+        return np.concatenate(self.client.evaluate([(self.problem_id, chunk) for chunk in chunks]))
+
+    def close(self):
+        self.client.close()
+
+
+class GradientService:
+    """
+    Energy and exact parameter-shift gradient from one parallel batch of 2·P + 1 circuits.
+
+    Parameters:
+    - ansatz (QuantumCircuit): ISA ansatz circuit; checked with ``check_parameter_shift``.
+    - evaluator (callable): Maps an (N, P) parameter array to N energies, e.g.
+      ``LocalEvaluator`` or ``RedisEvaluator``.
+    """
+
+    def __init__(self, ansatz, evaluator):
+        check_parameter_shift(ansatz)
+        self.evaluator = evaluator
+        self.stats = {'gradients': 0, 'circuits': 0, 'seconds': 0.0}
+
+    def value_and_gradient(self, params):
+        """Return (energy, gradient) at ``params``; use with ``minimize(..., jac=True)``."""
+        start = time.perf_counter()
+        batch = shifted_parameters(params)
+        energy, gradient = combine_shifted(self.evaluator(batch))
+        self.stats['gradients'] += 1
+        self.stats['circuits'] += len(batch)
+        self.stats['seconds'] += time.perf_counter() - start
+        return energy, gradient
+
+    def gradient(self, params):
+        return self.value_and_gradient(params)[1]
+
+
+def adam(fun, x0, args=(), jac=None, callback=None, learning_rate=0.05, beta1=0.9, beta2=0.999,
+         epsilon=1e-8, maxiter=300, gtol=1e-4, **unknown_options):
+    """
+    Adam, as a custom method for ``scipy.optimize.minimize``.
+
+    Use as ``minimize(service.value_and_gradient, x0, jac=True, method=adam)``; SciPy then
+    splits the combined function into ``fun`` and a memoized ``jac``. Stops when the
+    gradient norm drops below ``gtol`` or after ``maxiter`` steps.
+    """
+    if not callable(jac):
+        raise ValueError("adam needs the gradient: pass jac=True or a callable jac")
+    x = np.array(x0, dtype=float)
+    m = np.zeros_like(x)
+    v = np.zeros_like(x)
+    best_x, best_fun = x.copy(), np.inf
+    nfev = 0
+    for nit in range(1, maxiter + 1):
+        value, gradient = fun(x, *args), jac(x, *args)
+        nfev += 1
+        if value < best_fun:
+            best_x, best_fun = x.copy(), value
+        if np.linalg.norm(gradient) < gtol:
+            return OptimizeResult(x=best_x, fun=best_fun, jac=gradient, nit=nit, nfev=nfev, success=True,
+                                  message='Gradient norm below gtol')
+        m = beta1 * m + (1 - beta1) * gradient
+        v = beta2 * v + (1 - beta2) * gradient ** 2
+        x = x - learning_rate * (m / (1 - beta1 ** nit)) / (np.sqrt(v / (1 - beta2 ** nit)) + epsilon)
+        if callback is not None:
+            callback(np.copy(x))
+    return OptimizeResult(x=best_x, fun=best_fun, jac=gradient, nit=maxiter, nfev=nfev, success=False,
+                          message='Maximum number of iterations reached')
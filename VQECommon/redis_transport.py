@@ -0,0 +1,351 @@
+"""
+Redis connection handling and a Redis Streams message transport.
+
+``get_redis`` returns a client backed by one connection pool per process, configured from
+the environment: ``REDIS_URL`` if set, otherwise ``REDIS_HOST`` (as set in
+docker-compose.yml), ``REDIS_PORT`` and ``REDIS_DB``.
+
+``StreamTransport`` moves task and result messages over a Redis Stream read through a
+consumer group. A message stays in the group's pending entries list until the consumer
+acknowledges it, so if a worker dies mid-task the message is not lost: another consumer
+can reclaim it once it has been idle long enough. A worker busy with a long task keeps
+its entries from looking idle with ``keep_claimed``, which re-claims them periodically. Publishing and reading are batched
+(pipelined XADD, XREADGROUP with COUNT) so that small messages move at high rates.
+
+With ``REDIS_URL=memory://`` every client of the process is a ``fakeredis`` client on
+one in-process server, for tests and benchmarks that run without a Redis server
+(``pip install "fakeredis[lua]"``). Streams, lease queues and caches then all work as
+they do on Redis, within that process.
+
+``get_async_redis``, ``AsyncStreamTransport`` and ``open_async_transport`` are the
+asyncio counterparts, used by ``async_orchestrator``.
+"""
+
+import itertools
+import os
+import threading
+
+import redis
+import redis.asyncio
+
+PAYLOAD_FIELD = 'data'
+DEFAULT_BATCH_SIZE = 1000
+MEMORY_URL = 'memory://'
+
+# Resets the idle time of the entries still pending for the consumer (ARGV[2]);
+# entries another consumer has reclaimed in the meantime are left to it.
+_KEEP_CLAIMED = """
+local kept = 0
+for i = 3, #ARGV do
+    if #redis.call('XPENDING', KEYS[1], ARGV[1], ARGV[i], ARGV[i], 1, ARGV[2]) > 0 then
+        redis.call('XCLAIM', KEYS[1], ARGV[1], ARGV[2], 0, ARGV[i], 'JUSTID')
+        kept = kept + 1
+    end
+end
+return kept
+"""
+
+_pools = {}
+_pools_lock = threading.Lock()
+_memory_server = None
+
+
+def redis_url():
+    """Return the Redis URL for this process from the environment."""
+    url = os.environ.get('REDIS_URL')
+    if url:
+        return url
+    host = os.environ.get('REDIS_HOST', 'localhost')
+    port = os.environ.get('REDIS_PORT', '6379')
+    db = os.environ.get('REDIS_DB', '0')
+    return f'redis://{host}:{port}/{db}'
+
+
+def _fakeredis():
+    """The fakeredis module and this process's in-memory server, for ``memory://``."""
+    global _memory_server
+    try:
+        import fakeredis
+    except ImportError:
+        raise RuntimeError(f"REDIS_URL={MEMORY_URL} needs fakeredis (pip install \"fakeredis[lua]\")") from None
+    with _pools_lock:
+        if _memory_server is None:
+            _memory_server = fakeredis.FakeServer()
+    return fakeredis, _memory_server
+
+
+def get_redis(decode_responses=True):
+    """
+    Return a Redis client that shares this process's connection pool.
+
+    Parameters:
+    - decode_responses (bool): Return str instead of bytes.
+
+    Returns:
+    - redis.Redis: Client bound to the pooled connections, or a fakeredis client on
+      the process's in-memory server if REDIS_URL is ``memory://``.
+    """
+    if redis_url() == MEMORY_URL:
+        fakeredis, server = _fakeredis()
+        return fakeredis.FakeRedis(server=server, decode_responses=decode_responses)
+    key = (os.getpid(), decode_responses)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = redis.ConnectionPool.from_url(
+                redis_url(),
+                decode_responses=decode_responses,
+                max_connections=int(os.environ.get('REDIS_MAX_CONNECTIONS', '64')),
+            )
+            _pools[key] = pool
+    return redis.Redis(connection_pool=pool)
+
+
+class StreamTransport:
+    """
+    Task/result channel over a Redis Stream with a consumer group.
+
+    Payloads may be str or bytes; binary payloads (see ``wire_format``) need a client
+    created with decode_responses=False, which returns them as bytes.
+
+    Parameters:
+    - r (redis.Redis): Redis client.
+    - stream (str): Stream key.
+    - group (str): Consumer group that shares the messages.
+    - maxlen (int): Approximate cap on the stream length, or None for no trimming.
+    """
+
+    def __init__(self, r, stream, group, maxlen=None):
+        self.r = r
+        self.stream = stream
+        self.group = group
+        self.maxlen = maxlen
+        self._keep_claimed = r.register_script(_KEEP_CLAIMED)
+
+    @staticmethod
+    def _payload(fields):
+        payload = fields.get(PAYLOAD_FIELD)
+        return fields.get(PAYLOAD_FIELD.encode()) if payload is None else payload
+
+    def ensure_group(self):
+        """Create the stream and consumer group if they do not exist yet."""
+        try:
+            self.r.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as exc:
+            if 'BUSYGROUP' not in str(exc):
+                raise
+
+    def publish(self, payloads, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Append messages to the stream, one pipelined round trip per batch.
+
+        Parameters:
+        - payloads (iterable of str or bytes): Message bodies.
+        - batch_size (int): Messages per pipeline.
+
+        Returns:
+        - list of str: Stream ids of the new entries.
+        """
+        ids = []
+        payloads = iter(payloads)
+        while True:
+            batch = list(itertools.islice(payloads, batch_size))
+            if not batch:
+                return ids
+            pipe = self.r.pipeline(transaction=False)
+            for payload in batch:
+                pipe.xadd(self.stream, {PAYLOAD_FIELD: payload}, maxlen=self.maxlen, approximate=True)
+            ids.extend(pipe.execute())
+
+    def read(self, consumer, count=1, timeout=None):
+        """
+        Receive up to ``count`` new messages for ``consumer``.
+
+        Parameters:
+        - consumer (str): Name of the reading consumer within the group.
+        - count (int): Maximum number of messages.
+        - timeout (float): Seconds to block for at least one message; None returns at once.
+
+        Returns:
+        - list of (str, bytes): (message id, payload) pairs.
+        """
+        block = int(timeout * 1000) if timeout else None
+        response = self.r.xreadgroup(self.group, consumer, {self.stream: '>'}, count=count, block=block)
+        if not response:
+            return []
+        return [(entry_id, self._payload(fields)) for entry_id, fields in response[0][1]]
+
+    def ack(self, ids, delete=True):
+        """Acknowledge processed messages (and delete them from the stream)."""
+        ids = list(ids)
+        if not ids:
+            return
+        pipe = self.r.pipeline(transaction=False)
+        pipe.xack(self.stream, self.group, *ids)
+        if delete:
+            pipe.xdel(self.stream, *ids)
+        pipe.execute()
+
+    def reclaim(self, consumer, min_idle, count=100):
+        """
+        Take over messages another consumer received but did not acknowledge in time.
+
+        Parameters:
+        - consumer (str): Consumer that takes the messages.
+        - min_idle (float): Seconds a message must have been pending to be reclaimed.
+        - count (int): Maximum number of messages.
+
+        Returns:
+        - list of (str, bytes): (message id, payload) pairs.
+        """
+        response = self.r.xautoclaim(self.stream, self.group, consumer, int(min_idle * 1000),
+                                     start_id='0-0', count=count)
+        # Entries deleted from the stream after delivery come back without fields.
+        return [(entry_id, self._payload(fields)) for entry_id, fields in response[1] if fields]
+
+    def renew_claims(self, consumer, ids):
+        """
+        Reset the idle time of messages ``consumer`` is still working on, so they are not reclaimed.
+
+        Returns:
+        - int: Messages still pending for ``consumer``.
+        """
+        ids = list(ids)
+        return self._keep_claimed(keys=[self.stream], args=[self.group, consumer, *ids]) if ids else 0
+
+    def keep_claimed(self, consumer, ids, interval):
+        """Context manager that renews the claims on ``ids`` every ``interval`` seconds in the background."""
+        return ClaimRenewer(self, consumer, ids, interval)
+
+    def pending_count(self):
+        """Number of delivered but unacknowledged messages."""
+        return self.r.xpending(self.stream, self.group)['pending']
+
+    def backlog(self):
+        """Number of messages in the stream (delivered or not)."""
+        return self.r.xlen(self.stream)
+
+
+class ClaimRenewer:
+    """Renews a consumer's claims on stream entries periodically until the block exits."""
+
+    def __init__(self, transport, consumer, ids, interval):
+        self.transport = transport
+        self.consumer = consumer
+        self.ids = list(ids)
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if self.transport.renew_claims(self.consumer, self.ids) < len(self.ids):
+                print(f"Worker {self.consumer} lost the claim on some of its current tasks")
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+
+def open_transport(stream, group, r=None, maxlen=None):
+    """
+    Create the transport for ``stream``/``group`` and make sure the group exists.
+
+    Parameters:
+    - stream (str): Stream key.
+    - group (str): Consumer group name.
+    - r (redis.Redis): Client to use; defaults to ``get_redis(decode_responses=False)``.
+    - maxlen (int): Approximate cap on the stream length.
+
+    Returns:
+    - StreamTransport
+    """
+    transport = StreamTransport(r if r is not None else get_redis(decode_responses=False), stream, group, maxlen)
+    transport.ensure_group()
+    return transport
+
+
+def get_async_redis(decode_responses=False):
+    """
+    Return an asyncio Redis client for the environment-configured server.
+
+    Async connection pools are bound to the event loop that uses them, so each call
+    creates a client with its own pool; create it inside the running loop and share it.
+    With REDIS_URL ``memory://`` the client shares the in-memory server of ``get_redis``.
+    """
+    if redis_url() == MEMORY_URL:
+        fakeredis, server = _fakeredis()
+        return fakeredis.FakeAsyncRedis(server=server, decode_responses=decode_responses)
+    return redis.asyncio.Redis.from_url(
+        redis_url(),
+        decode_responses=decode_responses,
+        max_connections=int(os.environ.get('REDIS_MAX_CONNECTIONS', '64')),
+    )
+
+
+class AsyncStreamTransport(StreamTransport):
+    """StreamTransport for a ``redis.asyncio`` client; every method is a coroutine."""
+
+    async def ensure_group(self):
+        try:
+            await self.r.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as exc:
+            if 'BUSYGROUP' not in str(exc):
+                raise
+
+    async def publish(self, payloads, batch_size=DEFAULT_BATCH_SIZE):
+        ids = []
+        payloads = iter(payloads)
+        while True:
+            batch = list(itertools.islice(payloads, batch_size))
+            if not batch:
+                return ids
+            async with self.r.pipeline(transaction=False) as pipe:
+                for payload in batch:
+                    pipe.xadd(self.stream, {PAYLOAD_FIELD: payload}, maxlen=self.maxlen, approximate=True)
+                ids.extend(await pipe.execute())
+
+    async def read(self, consumer, count=1, timeout=None):
+        block = int(timeout * 1000) if timeout else None
+        response = await self.r.xreadgroup(self.group, consumer, {self.stream: '>'}, count=count, block=block)
+        if not response:
+            return []
+        return [(entry_id, self._payload(fields)) for entry_id, fields in response[0][1]]
+
+    async def ack(self, ids, delete=True):
+        ids = list(ids)
+        if not ids:
+            return
+        async with self.r.pipeline(transaction=False) as pipe:
+            pipe.xack(self.stream, self.group, *ids)
+            if delete:
+                pipe.xdel(self.stream, *ids)
+            await pipe.execute()
+
+    async def reclaim(self, consumer, min_idle, count=100):
+        response = await self.r.xautoclaim(self.stream, self.group, consumer, int(min_idle * 1000),
+                                           start_id='0-0', count=count)
+        return [(entry_id, self._payload(fields)) for entry_id, fields in response[1] if fields]
+
+    async def pending_count(self):
+        return (await self.r.xpending(self.stream, self.group))['pending']
+
+    async def backlog(self):
+        return await self.r.xlen(self.stream)
+
+
+async def open_async_transport(stream, group, r=None, maxlen=None):
+    """
+    Asyncio version of ``open_transport``.
+
+    Parameters:
+    - r (redis.asyncio.Redis): Client to use; defaults to ``get_async_redis()``.
+    """
+    transport = AsyncStreamTransport(r if r is not None else get_async_redis(), stream, group, maxlen)
+    await transport.ensure_group()
+    return transport
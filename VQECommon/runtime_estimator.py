@@ -0,0 +1,51 @@
+"""
+The estimator every VSP and VHD worker evaluates its energies with.
+
+``open_estimator`` opens a runtime session on the worker's backend and stacks the
+estimator options of the workers on top of it (exact evaluation, adaptive or shared
+shots, memoization), so both strategies run with the same shot count and precision
+on the same backend.
+"""
+
+from contextlib import contextmanager
+
+from qiskit_ibm_runtime import Session, EstimatorV2 as Estimator, SamplerV2 as Sampler
+
+from .exact_estimator import ExactEstimator
+from .expectation_cache import MemoizedEstimator, DEFAULT_TOLERANCE
+from .shot_allocation import AdaptiveShotEstimator
+from .shared_counts import SharedCountsEstimator
+
+DEFAULT_SHOTS = 10000   # shots per sampled evaluation without adaptive shots
+
+
+@contextmanager
+def open_estimator(backend_passed, expectation_cache=None, memo_tolerance=DEFAULT_TOLERANCE, adaptive_shots=None,
+                   shared_counts=False, resources=None):
+    """
+    Open a runtime session on the backend and yield an estimator bound to it.
+
+    With an ``ExpectationCache`` the estimator is memoized, and the cache statistics are
+    printed when the session closes. With ``adaptive_shots`` (a target standard error)
+    energies are sampled, with shots allocated by ``AdaptiveShotEstimator``, instead of
+    computed exactly. With ``shared_counts`` energies that are sampled (with adaptive
+    shots, or for circuits too wide to compute exactly) are estimated by
+    ``SharedCountsEstimator``, which samples every measurement basis once for all its terms.
+    With ``HostResources`` the exact engine's simulator gets this worker's share of the host.
+    Sampled evaluations default to ``DEFAULT_SHOTS`` shots.
+    """
+    with Session(backend=backend_passed) as session:
+        shot_estimator = SharedCountsEstimator(Sampler(session=session)) if shared_counts \
+            else Estimator(session=session)
+        if adaptive_shots is not None:
+            estimator = AdaptiveShotEstimator(shot_estimator, target_stderr=adaptive_shots)
+        else:
+            estimator = ExactEstimator(shot_estimator, **(resources.exact_options() if resources is not None else {}))
+        estimator.options.default_shots = DEFAULT_SHOTS
+        yield MemoizedEstimator(estimator, expectation_cache, memo_tolerance) if expectation_cache is not None \
+            else estimator
+    if expectation_cache is not None:
+        print(f"Expectation cache: {expectation_cache.summary()}")
+    if adaptive_shots is not None:
+        stats = estimator.stats
+        print(f"Adaptive shots: {stats['shots']} shots over {stats['evaluations']} evaluations")
@@ -0,0 +1,264 @@
+"""
+Shot-based expectation values of many Pauli terms from shared measurement counts.
+
+``SharedCountsEstimator`` is an EstimatorV2-compatible wrapper around a SamplerV2. It
+splits every observable into qubit-wise-commuting groups (``VQECommon.pauli_grouping``),
+samples the circuit once per measurement basis, and computes the expectation of every
+term measured in that basis from the same counts.
+
+Outcomes are kept as integers: the sampled bitstrings are packed into uint64 words
+(bit q of an outcome is qubit q), reduced to their distinct values and counts, and the
+eigenvalue of every term on every outcome is the parity of ``outcome & mask``, where
+``mask`` marks the qubits the term acts on. These parities are computed for all terms
+and all distinct outcomes in a few vectorized NumPy passes, so a group of thousands of
+terms costs one sampler pub plus one array pass rather than one evaluation per term.
+
+Basis changes are appended as ``h`` and ``sdg`` gates followed by ``measure_all``, so
+the sampler's backend must accept those gates (``AerSimulator`` does).
+"""
+
+import numpy as np
+from qiskit.primitives.containers import DataBin, PrimitiveResult, PubResult
+from qiskit.quantum_info import SparsePauliOp
+
+from .exact_estimator import _DoneJob, _as_object_array, _parity, PARITY_CHUNK_ELEMENTS
+from .pauli_grouping import group_qubit_wise_commuting, measurement_basis
+from .tracing import span
+
+DEFAULT_SHOTS = 4096    # shots per basis when neither precision nor default_shots is set
+
+
+def _pack_words(bits):
+    """Pack (rows, qubits) bools into (rows, words) uint64, bit q of the row in bit q % 64 of word q // 64."""
+    packed = np.packbits(bits, axis=-1, bitorder='little')
+    words = -(-max(bits.shape[-1], 1) // 64)
+    padded = np.zeros(packed.shape[:-1] + (8 * words,), dtype=np.uint8)
+    padded[..., :packed.shape[-1]] = packed
+    return padded.view('<u8')
+
+
+def outcome_counts(bit_array):
+    """
+    Distinct outcomes of a one-dimensional BitArray and how often each was sampled.
+
+    Returns:
+    - numpy.ndarray: (outcomes, words) uint64 outcomes, bit q being the measured bit q.
+    - numpy.ndarray: int64 count of every outcome.
+    """
+    # BitArray rows are big-endian bytes; reversing them gives little-endian bit order.
+    rows = np.ascontiguousarray(bit_array.array[..., ::-1])
+    words = -(-max(bit_array.num_bits, 1) // 64)
+    padded = np.zeros((rows.shape[0], 8 * words), dtype=np.uint8)
+    padded[:, :rows.shape[1]] = rows
+    outcomes = padded.view('<u8')
+    if words == 1:
+        values, counts = np.unique(outcomes[:, 0], return_counts=True)
+        return values[:, None], counts
+    return np.unique(outcomes, axis=0, return_counts=True)
+
+
+def parity_signs(masks, outcomes):
+    """
+    Eigenvalue (+1 or -1) of every term on every outcome.
+
+    Parameters:
+    - masks (numpy.ndarray): (terms, words) uint64 support of every term.
+    - outcomes (numpy.ndarray): (outcomes, words) uint64 outcomes.
+
+    Returns:
+    - numpy.ndarray: (terms, outcomes) int64 signs.
+    """
+    overlap = masks[:, None, :] & outcomes[None, :, :]
+    parities = np.bitwise_xor.reduce(_parity(overlap.view(np.int64)), axis=-1)
+    return 1 - 2 * parities
+
+
+class BasisTerms:
+    """
+    Terms of one observable measured in the same basis.
+
+    Parameters:
+    - basis (str): Pauli label of the measurement basis.
+    - masks (numpy.ndarray): (terms, words) uint64 support of every term.
+    - coeffs (numpy.ndarray): float64 coefficient of every term.
+    """
+
+    def __init__(self, basis, masks, coeffs):
+        self.basis = basis
+        self.masks = masks
+        self.coeffs = coeffs
+
+    def estimate(self, outcomes, counts):
+        """
+        Mean and variance of one shot of the terms' sum, from the basis' counts.
+
+        Every term is evaluated on the same outcomes, so the covariances between terms
+        are part of the variance.
+        """
+        shot_values = np.zeros(len(outcomes))
+        chunk = max(1, PARITY_CHUNK_ELEMENTS // (len(outcomes) * self.masks.shape[1]))
+        for start in range(0, len(self.coeffs), chunk):
+            stop = start + chunk
+            shot_values += self.coeffs[start:stop] @ parity_signs(self.masks[start:stop], outcomes)
+        shots = counts.sum()
+        mean = shot_values @ counts / shots
+        variance = max(0.0, np.square(shot_values) @ counts / shots - mean ** 2)
+        return mean, variance
+
+
+def basis_terms(observable, grouping='greedy'):
+    """
+    Split an observable into the terms of every measurement basis it needs.
+
+    Groups sharing a basis are merged. Imaginary parts of the coefficients are dropped,
+    as for the expectation of a Hermitian observable.
+
+    Returns:
+    - list of BasisTerms.
+    """
+    merged = {}
+    for group in group_qubit_wise_commuting(SparsePauliOp(observable), method=grouping):
+        merged.setdefault(measurement_basis(group), []).append(group)
+    return [BasisTerms(basis, _pack_words(group.paulis.x | group.paulis.z), np.real(group.coeffs))
+            for basis, group in ((basis, SparsePauliOp.sum(groups)) for basis, groups in merged.items())]
+
+
+class SharedCountsEstimator:
+    """
+    EstimatorV2-compatible engine sampling each measurement basis once for all its terms.
+
+    Parameters:
+    - sampler (SamplerV2): Sampler running the measurement circuits, e.g. a runtime
+      SamplerV2 bound to a session.
+    - grouping (str): Grouping method, see ``group_qubit_wise_commuting``.
+    """
+
+    def __init__(self, sampler, grouping='greedy'):
+        self.sampler = sampler
+        self.grouping = grouping
+        self._terms = {}
+        self._circuits = {}
+        self.stats = {'pubs': 0, 'bases': 0, 'terms': 0, 'shots': 0}
+
+    @property
+    def options(self):
+        """Options of the sampler (e.g. ``default_shots``)."""
+        return self.sampler.options
+
+    def _basis_terms(self, observable):
+        # Call sites pass the same SparsePauliOp object on every evaluation, so its
+        # grouping is computed once and reused.
+        key = id(observable)
+        cached = self._terms.get(key)
+        if cached is None or cached[0] is not observable:
+            if len(self._terms) >= 64:
+                self._terms.clear()
+            cached = (observable, basis_terms(observable, self.grouping))
+            self._terms[key] = cached
+        return cached[1]
+
+    def _measurement_circuit(self, circuit, basis):
+        """``circuit`` rotated into ``basis`` and measured on every qubit."""
+        key = (id(circuit), basis)
+        cached = self._circuits.get(key)
+        if cached is None or cached[0] is not circuit:
+            if len(self._circuits) >= 4096:
+                self._circuits.clear()
+            measured = circuit.copy()
+            # Labels put qubit 0 last.
+            for qubit, pauli in enumerate(reversed(basis)):
+                if pauli == 'Y':
+                    measured.sdg(qubit)
+                if pauli in 'XY':
+                    measured.h(qubit)
+            measured.measure_all()
+            cached = (circuit, measured)
+            self._circuits[key] = cached
+        return cached[1]
+
+    def _shots(self, precision):
+        if precision is not None:
+            # Tolerate rounding, so a precision of 1/sqrt(n) asks for exactly n shots.
+            return int(np.ceil(1 / precision ** 2 - 1e-6))
+        shots = getattr(self.options, 'default_shots', None)
+        return shots if isinstance(shots, int) and shots > 0 else DEFAULT_SHOTS
+
+    def run(self, pubs, *, precision=None):
+        """
+        Estimate expectation values from one sampler pub per circuit and measurement basis.
+
+        Parameters:
+        - pubs (list of tuple): ``(circuit, observables[, parameter_values[, precision]])``.
+        - precision (float): Standard error aimed at; the shots of a basis are 1/precision^2.
+
+        Returns:
+        - job: Object whose ``result()`` is a PrimitiveResult with one PubResult per pub.
+        """
+        plans = []
+        sampler_pubs = []
+        for pub in pubs:
+            circuit, observables = pub[0], pub[1]
+            parameter_values = pub[2] if len(pub) > 2 else None
+            pub_precision = pub[3] if len(pub) > 3 and pub[3] is not None else precision
+            shots = self._shots(pub_precision)
+
+            observables_array = _as_object_array(observables)
+            if parameter_values is None:
+                parameter_values = np.zeros((0,))
+            parameter_values = np.asarray(parameter_values, dtype=float)
+            params_shape = parameter_values.shape[:-1] if circuit.num_parameters else ()
+            flat_params = parameter_values.reshape(-1, circuit.num_parameters) if circuit.num_parameters \
+                else np.zeros((1, 0))
+            shape = np.broadcast_shapes(observables_array.shape, params_shape)
+
+            # Observables of a pub measured in the same basis share its samples.
+            bases = {}
+            terms = np.empty(observables_array.shape, dtype=object)
+            for index in np.ndindex(observables_array.shape):
+                terms[index] = self._basis_terms(observables_array[index])
+                for basis_group in terms[index]:
+                    if basis_group.basis not in bases:
+                        bases[basis_group.basis] = len(sampler_pubs)
+                        measured = self._measurement_circuit(circuit, basis_group.basis)
+                        sampler_pubs.append((measured, flat_params, shots) if circuit.num_parameters
+                                            else (measured, None, shots))
+            plans.append((shape, params_shape, flat_params.shape[0], terms, bases, shots, pub_precision))
+
+        with span('sample', pubs=len(sampler_pubs)):
+            sampled = self.sampler.run(sampler_pubs).result() if sampler_pubs else []
+
+        pub_results = []
+        for shape, params_shape, num_rows, terms, bases, shots, pub_precision in plans:
+            with span('shared counts', bases=len(bases), values=int(np.prod(shape))):
+                counts = {}
+                for basis, position in bases.items():
+                    bit_array = sampled[position].data.meas
+                    for row in range(num_rows):
+                        rows = bit_array[row] if bit_array.ndim else bit_array
+                        counts[basis, row] = outcome_counts(rows)
+
+                param_index = np.broadcast_to(np.arange(num_rows).reshape(params_shape), shape)
+                terms_at = np.broadcast_to(terms, shape)
+                evs = np.empty(shape, dtype=float)
+                stds = np.empty(shape, dtype=float)
+                for index in np.ndindex(shape):
+                    row = param_index[index]
+                    mean = variance = 0.0
+                    for basis_group in terms_at[index]:
+                        group_mean, group_variance = basis_group.estimate(*counts[basis_group.basis, row])
+                        mean += group_mean
+                        variance += group_variance
+                    evs[index] = mean
+                    stds[index] = np.sqrt(variance / shots)
+
+            self.stats['pubs'] += 1
+            self.stats['bases'] += len(bases)
+            self.stats['terms'] += sum(len(group.coeffs) for groups in terms.flat for group in groups)
+            self.stats['shots'] += len(bases) * num_rows * shots
+            data = DataBin(evs=evs, stds=stds, shape=shape)
+            pub_results.append(PubResult(data, metadata={
+                'target_precision': pub_precision if pub_precision is not None else 1 / np.sqrt(shots),
+                'shots': shots, 'bases': len(bases),
+            }))
+
+        return _DoneJob(PrimitiveResult(pub_results, metadata={'version': 2}))
@@ -0,0 +1,236 @@
+"""
+Adaptive shot allocation across Hamiltonian groups and optimizer iterations.
+
+A flat ``default_shots`` spends as many shots on a term with coefficient 0.01 as on one
+with 0.4, and as many on the first exploratory optimizer steps as on the last ones.
+``AdaptiveShotEstimator`` wraps a shot-based EstimatorV2 and, for every evaluation of
+an observable, lets a ``ShotAllocator``:
+
+- split the observable into qubit-wise-commuting groups (``VQECommon.pauli_grouping``);
+- choose the standard error the energy needs: a fraction ``resolution`` of the gap
+  between the median and the lowest of the last ``window`` energies, between
+  ``initial_stderr`` and ``target_stderr``. While the optimizer still moves by large
+  steps a coarse estimate tells its candidates apart; as it converges the energies it
+  compares get closer and the shots ramp up to reach ``target_stderr``;
+- spend the fewest total shots reaching that standard error, by giving group k a share
+  proportional to sigma_k, the standard deviation of one shot of the group (Neyman
+  allocation). sigma_k starts at the sum of the group's |coefficients| and is then
+  tracked as a running average of the variances reported by the estimator.
+
+Shots are requested through the per-pub precision of EstimatorV2, 1/sqrt(shots).
+"""
+
+from collections import deque
+
+import numpy as np
+from qiskit.primitives.containers import DataBin, PrimitiveResult, PubResult
+from qiskit.quantum_info import SparsePauliOp
+
+from .exact_estimator import _DoneJob
+from .pauli_grouping import group_qubit_wise_commuting
+from .tracing import span
+
+DEFAULT_TARGET_STDERR = 1e-3    # standard error of the converged energy
+DEFAULT_INITIAL_STDERR = 3e-2   # standard error of the first evaluations
+DEFAULT_RESOLUTION = 0.1        # standard error as a fraction of the recent energy gap
+DEFAULT_WINDOW = 10             # evaluations whose spread sets the standard error
+DEFAULT_MIN_SHOTS = 64          # per group and evaluation
+DEFAULT_VARIANCE_DECAY = 0.2    # weight of the newest variance in the running average
+
+
+class ShotAllocator:
+    """
+    Shots of each group of one observable, for the next evaluation.
+
+    Parameters:
+    - groups (list of SparsePauliOp): Qubit-wise-commuting groups summing to the observable.
+    - target_stderr (float): Standard error of the energy once the optimizer has converged.
+    - initial_stderr (float): Standard error while the optimizer is exploring.
+    - resolution (float): Standard error as a fraction of the gap between the median and
+      the lowest recent energy.
+    - window (int): Number of recent energies considered.
+    - min_shots (int): Fewest shots given to a group.
+    - max_shots (int): Most shots of one evaluation in total; unbounded if omitted.
+    """
+
+    def __init__(self, groups, target_stderr=DEFAULT_TARGET_STDERR, initial_stderr=DEFAULT_INITIAL_STDERR,
+                 resolution=DEFAULT_RESOLUTION, window=DEFAULT_WINDOW, min_shots=DEFAULT_MIN_SHOTS,
+                 max_shots=None):
+        self.groups = groups
+        self.target_stderr = target_stderr
+        self.initial_stderr = max(initial_stderr, target_stderr)
+        self.resolution = resolution
+        self.min_shots = min_shots
+        self.max_shots = max_shots
+        self.coeff_norms = np.array([np.abs(group.coeffs).sum() for group in groups])
+        self.variances = self.coeff_norms ** 2  # bound until the estimator reports variances
+        self.energies = deque(maxlen=window)
+        self.stats = {'evaluations': 0, 'shots': 0}
+
+    def sigmas(self):
+        """Estimated standard deviation of one shot of every group."""
+        # A group near an eigenstate has almost no variance; keep a floor so it still
+        # gets shots and its variance can be re-estimated when the state moves.
+        return np.maximum(np.sqrt(self.variances), 1e-2 * self.coeff_norms)
+
+    def stderr(self):
+        """Standard error the next energy should reach."""
+        if len(self.energies) < self.energies.maxlen:
+            return self.initial_stderr
+        # The median-to-best gap measures the differences the optimizer is resolving, and
+        # unlike the full spread it is not dominated by a single far-off trial point.
+        gap = np.median(self.energies) - min(self.energies)
+        return float(np.clip(self.resolution * gap, self.target_stderr, self.initial_stderr))
+
+    def allocate(self):
+        """
+        Shots of every group for the next evaluation.
+
+        Returns:
+        - numpy.ndarray: int64 shots of every group.
+        - float: Standard error the allocation aims for.
+        """
+        stderr = self.stderr()
+        sigmas = self.sigmas()
+        # With N_k = N sigma_k / sum(sigma), Var = sum(sigma_k^2 / N_k) = sum(sigma)^2 / N.
+        total = (sigmas.sum() / stderr) ** 2
+        if self.max_shots is not None:
+            total = min(total, self.max_shots)
+        shots = np.maximum(np.ceil(total * sigmas / sigmas.sum()), self.min_shots).astype(np.int64)
+        return shots, stderr
+
+    def update(self, energies, group_stds, shots):
+        """
+        Record the outcome of an evaluation.
+
+        Parameters:
+        - energies (numpy.ndarray): Energy of every evaluated parameter vector.
+        - group_stds (numpy.ndarray): Standard error of every group, shape (groups, vectors).
+        - shots (numpy.ndarray): Shots every group was given.
+        """
+        shot_variances = np.mean(np.square(group_stds), axis=1) * shots
+        self.variances = (1 - DEFAULT_VARIANCE_DECAY) * self.variances + DEFAULT_VARIANCE_DECAY * shot_variances
+        self.energies.extend(np.asarray(energies, dtype=float).ravel())
+        self.stats['evaluations'] += np.size(energies)
+        self.stats['shots'] += int(shots.sum()) * np.size(energies)
+
+
+class AdaptiveShotEstimator:
+    """
+    EstimatorV2-compatible wrapper choosing the shots of every evaluation with a ``ShotAllocator``.
+
+    Pubs with a single observable and no precision of their own (the form used by every
+    ``cost_func`` in this project) are split into one pub per group, each with the
+    precision of its allocated shots; their expectation values are summed back into
+    the usual result. Other pubs, and calls with an explicit ``precision``, are
+    forwarded unchanged.
+
+    Parameters:
+    - estimator (EstimatorV2): Shot-based estimator.
+    - grouping (str): Grouping method, see ``group_qubit_wise_commuting``.
+    - **allocator_options: Passed to every ``ShotAllocator`` (e.g. ``target_stderr``).
+    """
+
+    def __init__(self, estimator, grouping='greedy', **allocator_options):
+        self.estimator = estimator
+        self.grouping = grouping
+        self.allocator_options = allocator_options
+        self._allocators = {}
+
+    @property
+    def options(self):
+        """Options of the wrapped estimator."""
+        return self.estimator.options
+
+    @property
+    def stats(self):
+        """Evaluations and shots spent, summed over every observable."""
+        allocators = [allocator for _, allocator in self._allocators.values()]
+        return {
+            'evaluations': sum(allocator.stats['evaluations'] for allocator in allocators),
+            'shots': sum(allocator.stats['shots'] for allocator in allocators),
+        }
+
+    def allocator(self, observable):
+        """The ``ShotAllocator`` of an observable, created on its first evaluation."""
+        # Call sites pass the same SparsePauliOp object on every evaluation, so the
+        # allocator (and the variances it has learnt) persists across the optimization.
+        key = id(observable)
+        cached = self._allocators.get(key)
+        if cached is None or cached[0] is not observable:
+            if len(self._allocators) >= 64:
+                self._allocators.clear()
+            groups = group_qubit_wise_commuting(SparsePauliOp(observable), method=self.grouping)
+            cached = (observable, ShotAllocator(groups, **self.allocator_options))
+            self._allocators[key] = cached
+        return cached[1]
+
+    @staticmethod
+    def _single_observable(pub):
+        """The observable of a pub this wrapper allocates shots for, or None."""
+        if len(pub) != 3:
+            return None
+        observables = pub[1]
+        if isinstance(observables, (list, tuple)):
+            if len(observables) != 1:
+                return None
+            observables = observables[0]
+        return observables if isinstance(observables, SparsePauliOp) else None
+
+    def run(self, pubs, *, precision=None):
+        """
+        Estimate expectation values with adaptively allocated shots.
+
+        Parameters:
+        - pubs (list of tuple): ``(circuit, observables[, parameter_values[, precision]])``.
+        - precision (float): If given, every pub is forwarded with it unchanged.
+
+        Returns:
+        - job: Object whose ``result()`` is a PrimitiveResult with one PubResult per pub.
+        """
+        pubs = list(pubs)
+        if precision is not None:
+            return self.estimator.run(pubs, precision=precision)
+
+        plans = []      # per pub: (allocator, shots, stderr, shape), or None if forwarded
+        run_pubs = []
+        for pub in pubs:
+            observable = self._single_observable(pub)
+            if observable is None:
+                plans.append(None)
+                run_pubs.append(pub)
+                continue
+            circuit, observables, parameter_values = pub
+            allocator = self.allocator(observable)
+            shots, stderr = allocator.allocate()
+            parameter_values = np.asarray(parameter_values, dtype=float)
+            shape = np.broadcast_shapes(() if isinstance(observables, SparsePauliOp) else (1,),
+                                        parameter_values.shape[:-1] if circuit.num_parameters else ())
+            plans.append((allocator, shots, stderr, shape))
+            for group, group_shots in zip(allocator.groups, shots):
+                run_pubs.append((circuit, group, parameter_values, 1 / np.sqrt(group_shots)))
+
+        with span('adaptive shots', pubs=len(run_pubs)):
+            run_results = self.estimator.run(run_pubs).result()
+
+        pub_results = []
+        position = 0
+        for plan in plans:
+            if plan is None:
+                pub_results.append(run_results[position])
+                position += 1
+                continue
+            allocator, shots, stderr, shape = plan
+            group_results = [run_results[position + k] for k in range(len(shots))]
+            position += len(shots)
+            group_evs = np.array([np.asarray(result.data.evs, dtype=float).reshape(-1) for result in group_results])
+            group_stds = np.array([np.asarray(result.data.stds, dtype=float).reshape(-1) for result in group_results])
+            evs = group_evs.sum(axis=0)
+            stds = np.sqrt(np.square(group_stds).sum(axis=0))
+            allocator.update(evs, group_stds, shots)
+            data = DataBin(evs=evs.reshape(shape), stds=stds.reshape(shape), shape=shape)
+            pub_results.append(PubResult(data, metadata={
+                'target_precision': stderr, 'shots': int(shots.sum()), 'group_shots': shots.tolist(),
+            }))
+
+        return _DoneJob(PrimitiveResult(pub_results, metadata={'version': 2}))
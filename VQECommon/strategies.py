@@ -0,0 +1,95 @@
+"""
+The VSP and VHD strategies, written once against the ``executors`` API.
+
+- ``run_separate_parameters`` (VSP): independent minimizations from a population of
+  starting points, one optimization task each.
+- ``run_hamiltonian_distribution`` (VHD): every qubit-wise-commuting group of the
+  Hamiltonian minimized on its own from the same starting point; the sum of the group
+  minima is a lower bound on the ground-state energy.
+- ``minimize_shared_parameters`` (synchronous VHD): one optimizer over shared
+  parameters, with the groups evaluated in parallel at every step.
+
+The backend is whatever executor is passed in, e.g. ``make_executor(args.executor)``.
+"""
+
+import time
+
+import numpy as np
+from scipy.optimize import minimize
+
+from .pauli_grouping import group_qubit_wise_commuting
+
+
+def _groups(hamiltonian, grouping):
+    if grouping is None:
+        return list(hamiltonian)
+    return group_qubit_wise_commuting(hamiltonian, method=grouping)
+
+
+def run_separate_parameters(executor, ansatz, hamiltonian, initial_population, method='cobyla', options=None):
+    """
+    Minimize from every starting point in parallel.
+
+    Parameters:
+    - executor (Executor): Backend running the optimizations.
+    - ansatz (QuantumCircuit): ISA ansatz circuit.
+    - hamiltonian (SparsePauliOp): Hamiltonian with the ansatz layout applied.
+    - initial_population (list of numpy.ndarray): Starting points.
+    - method (str): SciPy minimization method.
+    - options (dict): Options forwarded to scipy.optimize.minimize.
+
+    Returns:
+    - list of dict: ``optimize_start`` result of every start, in order.
+    """
+    problem = executor.problem(ansatz, hamiltonian)
+    return executor.gather(executor.submit_optimizations(problem, initial_population, method, options))
+
+
+def run_hamiltonian_distribution(executor, ansatz, hamiltonian, x0, grouping='greedy', method='cobyla',
+                                 options=None):
+    """
+    Minimize every group of the Hamiltonian separately, all groups in parallel.
+
+    Parameters:
+    - grouping (str): 'greedy' or 'coloring' qubit-wise-commuting groups, or None for
+      one task per term.
+    - Others: As for ``run_separate_parameters``; ``x0`` is the common starting point.
+
+    Returns:
+    - results (list of dict): ``optimize_start`` result of every group.
+    - total_energy (float): Sum of the group minima.
+    """
+    # The problems stay referenced until gathered; Dask drops scattered data without a holder.
+    problems = [executor.problem(ansatz, group) for group in _groups(hamiltonian, grouping)]
+    handles = []
+    for problem in problems:
+        handles += executor.submit_optimizations(problem, [x0], method, options)
+    results = executor.gather(handles)
+    return results, sum(result['energy'] for result in results)
+
+
+def minimize_shared_parameters(executor, ansatz, hamiltonian, x0, grouping='greedy', method='cobyla',
+                               options=None):
+    """
+    Run one VQE over shared parameters, evaluating the Hamiltonian groups in parallel.
+
+    Returns:
+    - scipy.optimize.OptimizeResult: Result of the minimization; ``stats`` holds the
+      number of steps and the seconds spent waiting for the backend.
+    """
+    problems = [executor.problem(ansatz, group) for group in _groups(hamiltonian, grouping)]
+    stats = {'steps': 0, 'seconds': 0.0}
+
+    def energy(params):
+        start = time.perf_counter()
+        handles = []
+        for problem in problems:
+            handles += executor.submit_evaluations(problem, np.asarray(params, dtype=float)[None, :])
+        value = float(sum(partial[0] for partial in executor.gather(handles)))
+        stats['steps'] += 1
+        stats['seconds'] += time.perf_counter() - start
+        return value
+
+    result = minimize(energy, x0, method=method, options=options)
+    result.stats = stats
+    return result
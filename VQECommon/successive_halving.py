@@ -0,0 +1,139 @@
+"""
+Successive halving of VQE starting points, so stuck starts stop early.
+
+Independent starts differ a lot in quality, and a start that is far above the others
+after a few dozen evaluations rarely ends up best. ``SuccessiveHalving`` runs every
+start in rungs of increasing evaluation budget (``min_budget``, ``eta`` times that, ...,
+``max_budget``): after each rung only the best ``1/eta`` of the starts that reached it
+continue to the next one, warm-started from their best parameters, and the rest are
+stopped.
+
+Promotions are decided asynchronously, in the way of ASHA (Li et al., "A System for
+Massively Parallel Hyperparameter Tuning", 2020): whenever a worker becomes free,
+``next_task`` promotes a start that is in the top ``1/eta`` of the results its rung has
+so far, preferring higher rungs, and otherwise launches a new start. No worker waits
+for a rung to complete, so the freed workers go to new or surviving starts straight
+away. Once every start has been launched and nothing is running, the best start of a
+rung is always promoted, so the best start overall reaches ``max_budget``.
+
+The scheduler only does bookkeeping; ``VSPOrchestrator.run_race`` sends its tasks to
+the workers and reports their results.
+"""
+
+import numpy as np
+
+DEFAULT_MIN_BUDGET = 30     # evaluations in the first rung
+DEFAULT_MAX_BUDGET = 1000   # evaluations of a start that survives every rung
+DEFAULT_ETA = 3             # 1/eta of the starts of a rung continue
+
+
+def rung_budgets(min_budget=DEFAULT_MIN_BUDGET, max_budget=DEFAULT_MAX_BUDGET, eta=DEFAULT_ETA):
+    """Cumulative evaluation budget of every rung: min_budget * eta**k, ending at max_budget."""
+    budgets = [min_budget]
+    while budgets[-1] < max_budget:
+        budgets.append(min(budgets[-1] * eta, max_budget))
+    return budgets
+
+
+class SuccessiveHalving:
+    """
+    Asynchronous successive-halving schedule over a population of starting points.
+
+    Parameters:
+    - initial_population (list of numpy.ndarray): Starting points, launched in order.
+    - min_budget (int): Evaluations of every start in the first rung.
+    - max_budget (int): Total evaluations of a start that reaches the last rung.
+    - eta (int): Reduction factor; 1/eta of the starts of a rung are promoted.
+    """
+
+    def __init__(self, initial_population, min_budget=DEFAULT_MIN_BUDGET, max_budget=DEFAULT_MAX_BUDGET,
+                 eta=DEFAULT_ETA):
+        self.population = [np.asarray(initial_param, dtype=float) for initial_param in initial_population]
+        self.budgets = rung_budgets(min_budget, max_budget, eta)
+        self.eta = eta
+        self.launched = 0
+        self.rungs = [{} for _ in self.budgets]          # start -> energy reached in that rung
+        self.promoted = [set() for _ in self.budgets]
+        self.converged = set()
+        self.best = {}                                   # start -> (energy, params)
+        self.stats = {'tasks': 0, 'evaluations': 0, 'promotions': 0, 'stopped': 0}
+
+    def task_id(self, start, rung):
+        """Id of the task running ``start`` through ``rung``; every (start, rung) pair runs once."""
+        return start * len(self.budgets) + rung
+
+    def num_tasks(self):
+        """Largest number of tasks the schedule can issue."""
+        return len(self.population) * len(self.budgets)
+
+    def _promotable(self, rung, running):
+        results = self.rungs[rung]
+        keep = len(results) // self.eta
+        if not running and self.launched == len(self.population):
+            keep = max(keep, 1)
+        ranked = sorted(results, key=results.get)[:keep]
+        return [start for start in ranked if start not in self.promoted[rung] and start not in self.converged]
+
+    def next_task(self, running=0):
+        """
+        The task a free worker should run next.
+
+        Parameters:
+        - running (int): Tasks currently running.
+
+        Returns:
+        - tuple: (start, rung, initial parameters, evaluation budget), or None if there
+          is nothing to do until a running task reports.
+        """
+        for rung in reversed(range(len(self.budgets) - 1)):
+            candidates = self._promotable(rung, running)
+            if candidates:
+                start = candidates[0]
+                self.promoted[rung].add(start)
+                self.stats['promotions'] += 1
+                self.stats['tasks'] += 1
+                return start, rung + 1, self.best[start][1], self.budgets[rung + 1] - self.budgets[rung]
+        if self.launched < len(self.population):
+            start = self.launched
+            self.launched += 1
+            self.stats['tasks'] += 1
+            return start, 0, self.population[start], self.budgets[0]
+        return None
+
+    def report(self, start, rung, energy, params, nfev, budget):
+        """
+        Record the result of a task.
+
+        A start whose optimizer stopped before using its ``budget`` has converged and is
+        not promoted again.
+        """
+        self.rungs[rung][start] = energy
+        if start not in self.best or energy < self.best[start][0]:
+            self.best[start] = (energy, np.asarray(params, dtype=float))
+        if nfev < budget:
+            self.converged.add(start)
+        self.stats['evaluations'] += nfev
+
+    def finish(self, running=()):
+        """
+        Summarize the race once no task is left, or once it timed out.
+
+        Parameters:
+        - running (iterable of int): Starts whose tasks were still running at a timeout.
+
+        Returns:
+        - dict: 'energy', 'params' and 'start' of the best start (all None if no task
+          reported), 'rungs' (starts that reached every rung), 'running' (sorted starts of
+          ``running``), and the counters in ``stats``, with 'stopped' being the starts that
+          ended before ``max_budget`` without converging.
+        """
+        running = sorted(set(running))
+        reached_last = set(self.rungs[-1])
+        self.stats['stopped'] = len(set(self.best) - reached_last - self.converged - set(running))
+        energy = params = start = None
+        if self.best:
+            start = min(self.best, key=lambda s: self.best[s][0])
+            energy, params = self.best[start]
+        return dict(self.stats, energy=energy, params=params, start=start, running=running,
+                    rungs=[len(results) for results in self.rungs],
+                    full_budget=len(self.population) * self.budgets[-1])
@@ -0,0 +1,262 @@
+"""
+Span tracing of the evaluation hot path, written in the Chrome trace event format.
+
+Tracing is off unless the ``VQE_TRACE_DIR`` environment variable names a directory (or
+``enable_tracing`` is called, e.g. by the ``--trace DIR`` option of the orchestrator and
+workers). Every process then appends its events to its own
+``trace-<host>-<pid>.json`` in that directory, one event per line. Processes started
+from a traced one (process pools, Dask workers) inherit the variable and trace too.
+
+The instrumented phases are:
+
+- orchestrator: task encoding and the RPUSH round trips of the dispatch, and every
+  result as it is routed back
+- worker: waiting for a task, the time the task spent queued, decoding, transpilation
+  (``pm.run``), the minimization, every ``cost_func`` with the parameter binding,
+  simulation and expectation passes of ``ExactEstimator``, encoding and the
+  acknowledging round trip
+
+Spans carry the task id of the message they belong to, and flow arrows connect the
+dispatch of a task to the worker that ran it and its result back to the orchestrator.
+Timestamps are wall-clock microseconds, so files of processes on hosts with
+synchronized clocks line up.
+
+Merge the files of all processes into one trace with
+
+    python3 VQECommon/tracing.py DIR [-o trace.json]
+
+and open it in https://ui.perfetto.dev or chrome://tracing.
+
+When tracing is off, ``span`` returns a shared no-op context manager and the other
+calls return immediately, so the instrumentation costs a function call per phase.
+"""
+
+import argparse
+import atexit
+import glob
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+TRACE_DIR_ENV = 'VQE_TRACE_DIR'
+FILE_PATTERN = 'trace-*.json'
+FLUSH_EVENTS = 1000
+FLUSH_SECONDS = 2.0
+
+_tracer = None
+
+
+def _now_us():
+    return time.time_ns() // 1000
+
+
+def task_key(job, task_id):
+    """Flow id of a task, from the job and task id it carries in its message."""
+    return f'{job}:{task_id}'
+
+
+class _NullSpan:
+    """Span returned while tracing is off."""
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed phase; ``set`` adds arguments (e.g. the task id once it is known)."""
+
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.emit({'ph': 'X', 'name': self.name, 'ts': self.start, 'dur': _now_us() - self.start,
+                          'args': self.args})
+        return False
+
+
+class Tracer:
+    """
+    Buffers the events of this process and appends them to its trace file.
+
+    Parameters:
+    - trace_dir (str): Directory of the trace files, created if needed.
+    - process_name (str): Name shown for this process; the script name by default.
+    """
+
+    def __init__(self, trace_dir, process_name=None):
+        os.makedirs(trace_dir, exist_ok=True)
+        self.trace_dir = trace_dir
+        self.pid = os.getpid()
+        self.path = os.path.join(trace_dir, f'trace-{socket.gethostname()}-{self.pid}.json')
+        self._events = []
+        self._threads = set()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        with open(self.path, 'w') as f:
+            f.write('[\n')
+        name = process_name or os.path.basename(sys.argv[0] or 'python')
+        self._events.append({'ph': 'M', 'name': 'process_name', 'pid': self.pid, 'tid': 0,
+                             'args': {'name': f'{name} ({socket.gethostname()}:{self.pid})'}})
+        atexit.register(self.flush)
+
+    def emit(self, event):
+        """Record one event; ``pid``, ``tid`` and ``cat`` are filled in."""
+        tid = threading.get_native_id()
+        event.setdefault('tid', tid)
+        event.setdefault('cat', 'vqe')
+        event['pid'] = self.pid
+        with self._lock:
+            if tid not in self._threads:
+                self._threads.add(tid)
+                self._events.append({'ph': 'M', 'name': 'thread_name', 'pid': self.pid, 'tid': tid,
+                                     'args': {'name': threading.current_thread().name}})
+            self._events.append(event)
+            due = len(self._events) >= FLUSH_EVENTS or time.monotonic() - self._last_flush > FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Append the buffered events to the trace file."""
+        with self._lock:
+            events, self._events = self._events, []
+            self._last_flush = time.monotonic()
+            if events:
+                with open(self.path, 'a') as f:
+                    f.write(''.join(json.dumps(event, separators=(',', ':'), default=str) + ',\n'
+                                    for event in events))
+
+
+def enable_tracing(trace_dir=None, process_name=None):
+    """
+    Start tracing this process, and the processes it starts, to ``trace_dir``.
+
+    Parameters:
+    - trace_dir (str): Trace directory; ``VQE_TRACE_DIR`` if omitted.
+    - process_name (str): Name shown for this process in the trace.
+
+    Returns:
+    - Tracer: The tracer, or None if no directory was given.
+    """
+    global _tracer
+    trace_dir = trace_dir or os.environ.get(TRACE_DIR_ENV)
+    if not trace_dir:
+        return None
+    os.environ[TRACE_DIR_ENV] = trace_dir
+    if _tracer is None or _tracer.pid != os.getpid():
+        _tracer = Tracer(trace_dir, process_name)
+    return _tracer
+
+
+def tracing_enabled():
+    return _tracer is not None
+
+
+def span(name, **args):
+    """Context manager timing the phase ``name``; ``args`` are shown with it."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(_tracer, name, args)
+
+
+def flow_start(name, flow_id):
+    """Start a flow arrow from the current span (e.g. a task being dispatched)."""
+    if _tracer is not None:
+        _tracer.emit({'ph': 's', 'name': name, 'cat': 'flow', 'id': flow_id, 'ts': _now_us()})
+
+
+def flow_end(name, flow_id):
+    """End the flow arrow ``flow_id`` in the current span (e.g. the task being run)."""
+    if _tracer is not None:
+        _tracer.emit({'ph': 'f', 'bp': 'e', 'name': name, 'cat': 'flow', 'id': flow_id, 'ts': _now_us()})
+
+
+def trace_fields():
+    """Fields to add to a task message so the worker can trace its queue wait."""
+    if _tracer is None:
+        return {}
+    return {'enqueued_at': _now_us()}
+
+
+def queue_wait(fields, flow_id):
+    """Record the time between ``trace_fields`` and now as the queue wait of a task."""
+    if _tracer is not None and 'enqueued_at' in fields:
+        event = {'name': 'queue wait', 'cat': 'queue', 'id': flow_id, 'args': {'task': flow_id}}
+        _tracer.emit(dict(event, ph='b', ts=int(fields['enqueued_at'])))
+        _tracer.emit(dict(event, ph='e', ts=_now_us()))
+
+
+def read_trace_file(path):
+    """Events of one process's trace file; a line cut off by a crash is skipped."""
+    events = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip().rstrip(',')
+            if line in ('', '[', ']'):
+                continue
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+    return events
+
+
+def merge_traces(trace_dir, output=None):
+    """
+    Merge the trace files of every process in ``trace_dir`` into one trace.
+
+    Each file gets its own process id in the merged trace, since processes on different
+    hosts can share a pid.
+
+    Parameters:
+    - trace_dir (str): Directory written by the traced processes.
+    - output (str): Merged trace file; ``trace.json`` in ``trace_dir`` if omitted.
+
+    Returns:
+    - str: Path of the merged trace.
+    """
+    output = output or os.path.join(trace_dir, 'trace.json')
+    merged = []
+    for process_index, path in enumerate(sorted(glob.glob(os.path.join(trace_dir, FILE_PATTERN))), start=1):
+        for event in read_trace_file(path):
+            event['pid'] = process_index
+            merged.append(event)
+    with open(output, 'w') as f:
+        json.dump({'traceEvents': merged, 'displayTimeUnit': 'ms'}, f)
+    return output
+
+
+if os.environ.get(TRACE_DIR_ENV):
+    enable_tracing()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the trace files of all processes into one trace")
+    parser.add_argument("trace_dir")
+    parser.add_argument("-o", "--output", default=None, help="merged trace; trace.json in TRACE_DIR by default")
+    args = parser.parse_args()
+    print(f"Merged trace written to {merge_traces(args.trace_dir, args.output)}")
@@ -0,0 +1,206 @@
+"""
+Persistent, content-addressed cache for transpiled (ISA) ansatz circuits.
+
+Every experiment builds an EfficientSU2 ansatz and runs the level-3 preset pass manager
+on it before doing any work. The transpiled circuit only depends on the ansatz, the
+backend target and the optimization level, so it is stored as QPY (which keeps the
+layout needed by ``SparsePauliOp.apply_layout``) under a hash of those three inputs.
+Entries live in a local directory shared by every process on the host, and optionally
+in Redis so that workers on other machines can reuse them too.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+import qiskit
+from qiskit import qpy
+from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+
+from .tracing import span
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'TRANSPILE_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.transpile_cache'),
+)
+REDIS_KEY_PREFIX = 'transpile_cache:'
+
+
+def circuit_fingerprint(circuit):
+    """
+    Build a deterministic description of a circuit's content.
+
+    Parameters are described by name rather than identity, so two independently built
+    copies of the same ansatz get the same fingerprint.
+
+    Parameters:
+    - circuit (QuantumCircuit): The (untranspiled) ansatz circuit.
+
+    Returns:
+    - list: JSON-serializable description of every instruction.
+    """
+    decomposed = circuit.decompose()
+    return [
+        [
+            instruction.operation.name,
+            [str(param) for param in instruction.operation.params],
+            [decomposed.find_bit(qubit).index for qubit in instruction.qubits],
+        ]
+        for instruction in decomposed.data
+    ]
+
+
+def backend_fingerprint(backend):
+    """
+    Describe the parts of a backend target that influence transpilation.
+
+    Parameters:
+    - backend (BackendV2): The backend the circuit is transpiled for.
+
+    Returns:
+    - dict: JSON-serializable description of the target.
+    """
+    target = backend.target
+    coupling_map = target.build_coupling_map()
+    return {
+        'name': backend.name,
+        'num_qubits': target.num_qubits,
+        'operations': sorted(target.operation_names),
+        'coupling_map': sorted(coupling_map.get_edges()) if coupling_map is not None else None,
+    }
+
+
+def cache_key(ansatz, backend, optimization_level):
+    """
+    Hash the ansatz, backend target and optimization level into a cache key.
+
+    Parameters:
+    - ansatz (QuantumCircuit): The (untranspiled) ansatz circuit.
+    - backend (BackendV2): The backend the circuit is transpiled for.
+    - optimization_level (int): Preset pass manager optimization level.
+
+    Returns:
+    - str: Hex digest identifying the transpiled circuit.
+    """
+    spec = {
+        'ansatz': circuit_fingerprint(ansatz),
+        'backend': backend_fingerprint(backend),
+        'optimization_level': optimization_level,
+        'qiskit': qiskit.__version__,
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+class TranspileCache:
+    """
+    Two-tier (local disk, optional Redis) store of QPY-serialized ISA circuits.
+
+    Circuits loaded or transpiled by this process are also kept in memory, so asking
+    for the same ansatz again (e.g. once per Hamiltonian term) is free.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, redis_client=None):
+        self.cache_dir = cache_dir
+        self.redis_client = redis_client
+        self._memory = {}
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'redis_hits': 0, 'misses': 0}
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.qpy')
+
+    def load(self, key):
+        """Return the cached circuit for ``key``, or None if no tier has it."""
+        if key in self._memory:
+            self.stats['memory_hits'] += 1
+            return self._memory[key]
+
+        data = None
+        if self.cache_dir and os.path.exists(self._path(key)):
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+            self.stats['disk_hits'] += 1
+        elif self.redis_client is not None:
+            encoded = self.redis_client.get(REDIS_KEY_PREFIX + key)
+            if encoded is not None:
+                data = base64.b64decode(encoded)
+                self.stats['redis_hits'] += 1
+                self._write_disk(key, data)
+        if data is None:
+            return None
+
+        circuit = qpy.load(io.BytesIO(data))[0]
+        self._memory[key] = circuit
+        return circuit
+
+    def store(self, key, circuit):
+        """Store ``circuit`` under ``key`` in every configured tier."""
+        buffer = io.BytesIO()
+        qpy.dump(circuit, buffer)
+        data = buffer.getvalue()
+        self._memory[key] = circuit
+        self._write_disk(key, data)
+        if self.redis_client is not None:
+            # Base64 keeps the value valid for clients created with decode_responses=True.
+            self.redis_client.set(REDIS_KEY_PREFIX + key, base64.b64encode(data).decode('ascii'))
+
+    def _write_disk(self, key, data):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary file first so concurrent workers never read a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+    def get_or_transpile(self, ansatz, backend, optimization_level=3):
+        """
+        Return the ISA circuit for ``ansatz``, transpiling and storing it on a miss.
+
+        Parameters:
+        - ansatz (QuantumCircuit): The (untranspiled) ansatz circuit.
+        - backend (BackendV2): The backend the circuit is transpiled for.
+        - optimization_level (int): Preset pass manager optimization level.
+
+        Returns:
+        - QuantumCircuit: The transpiled ansatz, with its layout.
+        """
+        with span('transpile', qubits=ansatz.num_qubits) as transpile_span:
+            key = cache_key(ansatz, backend, optimization_level)
+            ansatz_isa = self.load(key)
+            transpile_span.set(cached=ansatz_isa is not None)
+            if ansatz_isa is None:
+                self.stats['misses'] += 1
+                pm = generate_preset_pass_manager(backend=backend, optimization_level=optimization_level)
+                with span('pm.run'):
+                    ansatz_isa = pm.run(ansatz)
+                self.store(key, ansatz_isa)
+        return ansatz_isa
+
+
+_default_cache = None
+
+
+def transpile_ansatz(ansatz, backend, optimization_level=3, cache=None):
+    """
+    Transpile ``ansatz`` for ``backend``, reusing a cached result when one exists.
+
+    Parameters:
+    - ansatz (QuantumCircuit): The (untranspiled) ansatz circuit.
+    - backend (BackendV2): The backend the circuit is transpiled for.
+    - optimization_level (int): Preset pass manager optimization level.
+    - cache (TranspileCache): Cache to use; defaults to a per-process cache over
+      TRANSPILE_CACHE_DIR (or ``.transpile_cache`` in the project root).
+
+    Returns:
+    - QuantumCircuit: The transpiled ansatz, with its layout.
+    """
+    global _default_cache
+    if cache is None:
+        if _default_cache is None:
+            _default_cache = TranspileCache()
+        cache = _default_cache
+    return cache.get_or_transpile(ansatz, backend, optimization_level)
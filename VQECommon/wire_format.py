@@ -0,0 +1,257 @@
+"""
+Compact, versioned binary wire format for the messages exchanged through Redis.
+
+A message is a small JSON header followed by raw array buffers::
+
+    b'VQW' | version (uint8) | header length (uint32 LE) | header JSON | arrays
+
+The header names the message kind, carries scalar fields (task id, energy, optimizer
+message, ...) and describes each array by dtype, shape and offset. Arrays are stored
+back to back, each aligned to 8 bytes, so ``decode_message`` returns them as read-only
+``numpy.frombuffer`` views into the received bytes without copying.
+
+Pauli operators are sent as their symplectic form: the X and Z bit matrices packed
+8 qubits per byte, plus the complex128 coefficients.
+
+Run this file directly to compare message size and encode/decode time against the
+previous JSON encoding.
+"""
+
+import json
+import struct
+import time
+
+import numpy as np
+from qiskit.quantum_info import PauliList, SparsePauliOp
+
+MAGIC = b'VQW'
+WIRE_VERSION = 1
+_PREFIX = struct.Struct('<3sBI')
+_ALIGNMENT = 8
+
+
+def _padding(size):
+    return -size % _ALIGNMENT
+
+
+def encode_message(kind, fields=None, arrays=None):
+    """
+    Encode scalar fields and numpy arrays into one binary message.
+
+    Parameters:
+    - kind (str): Message kind, checked by the decoder.
+    - fields (dict): JSON-serializable scalar fields.
+    - arrays (dict): Name -> numpy array.
+
+    Returns:
+    - bytes: The encoded message.
+    """
+    descriptors = []
+    buffers = []
+    offset = 0
+    for name, array in (arrays or {}).items():
+        array = np.ascontiguousarray(array)
+        descriptors.append([name, array.dtype.str, list(array.shape), offset])
+        buffers.append(array.tobytes())
+        buffers.append(b'\0' * _padding(array.nbytes))
+        offset += array.nbytes + _padding(array.nbytes)
+
+    header = json.dumps({'kind': kind, 'fields': fields or {}, 'arrays': descriptors},
+                        separators=(',', ':')).encode()
+    header += b' ' * _padding(_PREFIX.size + len(header))
+    return b''.join([_PREFIX.pack(MAGIC, WIRE_VERSION, len(header)), header] + buffers)
+
+
+def _read_header(data):
+    magic, version, header_size = _PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a VQW message")
+    if version != WIRE_VERSION:
+        raise ValueError(f"Unsupported wire format version {version} (expected {WIRE_VERSION})")
+    header = json.loads(bytes(data[_PREFIX.size:_PREFIX.size + header_size]))
+    return header, _PREFIX.size + header_size
+
+
+def message_kind(data):
+    """Kind of an encoded message, read from its header only."""
+    return _read_header(data)[0]['kind']
+
+
+def decode_message(data, kind=None):
+    """
+    Decode a message produced by ``encode_message``.
+
+    Parameters:
+    - data (bytes): The encoded message.
+    - kind (str): Expected message kind, or None to accept any.
+
+    Returns:
+    - fields (dict): Scalar fields.
+    - arrays (dict): Name -> read-only numpy view into ``data``.
+    """
+    header, start = _read_header(data)
+    if kind is not None and header['kind'] != kind:
+        raise ValueError(f"Expected a {kind!r} message, got {header['kind']!r}")
+
+    arrays = {}
+    for name, dtype, shape, offset in header['arrays']:
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=start + offset).reshape(shape)
+    return header['fields'], arrays
+
+
+def encode_pauli_op(operator, **fields):
+    """Encode a SparsePauliOp (and scalar fields such as the task id)."""
+    paulis = operator.paulis
+    return encode_symplectic(paulis.x, paulis.z, operator.coeffs, **fields)
+
+
+def encode_symplectic(x, z, coeffs, **fields):
+    """
+    Encode Pauli terms given as (terms, qubits) X and Z bool arrays and their coefficients.
+
+    Produces the same message as ``encode_pauli_op``, but works on slices of an
+    operator's arrays, so no SparsePauliOp has to be built per message.
+    """
+    return encode_message('pauli_op', dict(fields, num_qubits=x.shape[1]), {
+        'x': np.packbits(x, axis=1, bitorder='little'),
+        'z': np.packbits(z, axis=1, bitorder='little'),
+        'coeffs': np.asarray(coeffs, dtype=np.complex128),
+    })
+
+
+def decode_pauli_op(data):
+    """
+    Decode a message produced by ``encode_pauli_op``.
+
+    Returns:
+    - SparsePauliOp: The operator.
+    - dict: The scalar fields sent with it.
+    """
+    fields, arrays = decode_message(data, 'pauli_op')
+    num_qubits = fields.pop('num_qubits')
+    x = np.unpackbits(arrays['x'], axis=1, count=num_qubits, bitorder='little').astype(bool)
+    z = np.unpackbits(arrays['z'], axis=1, count=num_qubits, bitorder='little').astype(bool)
+    return SparsePauliOp(PauliList.from_symplectic(z, x), arrays['coeffs']), fields
+
+
+def encode_parameters(params, **fields):
+    """Encode a parameter vector (and scalar fields such as the task id)."""
+    return encode_message('parameters', fields, {'params': np.asarray(params, dtype=np.float64)})
+
+
+def decode_parameters(data):
+    """
+    Decode a message produced by ``encode_parameters``.
+
+    Returns:
+    - numpy.ndarray: Read-only float64 parameter vector.
+    - dict: The scalar fields sent with it.
+    """
+    fields, arrays = decode_message(data, 'parameters')
+    return arrays['params'], fields
+
+
+def _scalar(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def encode_optimize_result(result, **fields):
+    """
+    Encode a scipy OptimizeResult or a result dictionary.
+
+    Array entries (``x``, ``jac``, ``params``, ...) and lists of numbers are sent as raw
+    buffers and strings, numbers, booleans and None as scalar fields; ``fields`` (e.g.
+    task and worker id) are added to the latter. Any other entry (dictionaries, nested
+    or mixed lists, objects such as L-BFGS-B's ``hess_inv``) is dropped, so it does not
+    appear in the decoded result.
+    """
+    scalars = {}
+    arrays = {}
+    for key, value in dict(result).items():
+        if isinstance(value, np.ndarray):
+            arrays[key] = value
+        elif isinstance(value, (list, tuple)) and all(isinstance(v, (int, float, np.number)) for v in value):
+            arrays[key] = np.asarray(value, dtype=np.float64)
+        elif isinstance(value, (str, bool, int, float, np.generic)) or value is None:
+            scalars[key] = _scalar(value)
+        # Other entries are dropped, see the docstring.
+    scalars.update(fields)
+    return encode_message('optimize_result', scalars, arrays)
+
+
+def decode_optimize_result(data):
+    """Decode a message produced by ``encode_optimize_result`` into a flat dictionary."""
+    fields, arrays = decode_message(data, 'optimize_result')
+    fields.update(arrays)
+    return fields
+
+
+def _json_encode_pauli_op(operator, task_id):
+    """The previous JSON task encoding, kept only for ``compare_with_json``."""
+    return json.dumps({'id': task_id, 'data': {
+        'paulis': operator.paulis.to_labels(),
+        'coeffs': [{'real': c.real, 'imag': c.imag} for c in operator.coeffs.tolist()],
+    }})
+
+
+def _json_decode_pauli_op(message):
+    data = json.loads(message)['data']
+    return SparsePauliOp(data['paulis'], [complex(c['real'], c['imag']) for c in data['coeffs']])
+
+
+def _best_time(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare_with_json(operator, repeat=3):
+    """
+    Measure message size and encode/decode time of one operator in both formats.
+
+    Returns:
+    - dict: Sizes in bytes and best-of-``repeat`` times in seconds for the JSON and
+      binary encodings, and the size and time ratios.
+    """
+    json_message = _json_encode_pauli_op(operator, 0)
+    binary_message = encode_pauli_op(operator, id=0)
+    assert decode_pauli_op(binary_message)[0] == operator
+
+    report = {
+        'num_qubits': operator.num_qubits,
+        'num_terms': len(operator),
+        'json_bytes': len(json_message),
+        'binary_bytes': len(binary_message),
+        'json_encode_s': _best_time(lambda: _json_encode_pauli_op(operator, 0), repeat),
+        'binary_encode_s': _best_time(lambda: encode_pauli_op(operator, id=0), repeat),
+        'json_decode_s': _best_time(lambda: _json_decode_pauli_op(json_message), repeat),
+        'binary_decode_s': _best_time(lambda: decode_pauli_op(binary_message), repeat),
+    }
+    report['size_ratio'] = report['json_bytes'] / report['binary_bytes']
+    report['encode_speedup'] = report['json_encode_s'] / report['binary_encode_s']
+    report['decode_speedup'] = report['json_decode_s'] / report['binary_decode_s']
+    return report
+
+
+def random_pauli_op(num_qubits, num_terms, seed=0):
+    """Random SparsePauliOp with real coefficients, for benchmarks."""
+    rng = np.random.default_rng(seed)
+    x = rng.random((num_terms, num_qubits)) < 0.5
+    z = rng.random((num_terms, num_qubits)) < 0.5
+    return SparsePauliOp(PauliList.from_symplectic(z, x), rng.normal(size=num_terms))
+
+
+if __name__ == "__main__":
+    for num_qubits, num_terms in [(4, 4), (20, 1000), (50, 10000)]:
+        report = compare_with_json(random_pauli_op(num_qubits, num_terms))
+        print(f"{num_qubits} qubits, {num_terms} terms: "
+              f"{report['json_bytes']} -> {report['binary_bytes']} bytes ({report['size_ratio']:.1f}x smaller), "
+              f"encode {report['json_encode_s'] * 1e3:.2f} -> {report['binary_encode_s'] * 1e3:.2f} ms "
+              f"({report['encode_speedup']:.1f}x), "
+              f"decode {report['json_decode_s'] * 1e3:.2f} -> {report['binary_decode_s'] * 1e3:.2f} ms "
+              f"({report['decode_speedup']:.1f}x)")
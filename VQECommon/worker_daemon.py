@@ -0,0 +1,177 @@
+"""
+Long-running worker loop shared by the VHD and VSP workers.
+
+In daemon mode a worker keeps its simulator, session and transpiled circuits in memory
+and loops over tasks until it is told to stop, instead of exiting after one task. While
+it runs it publishes a heartbeat to ``worker:{id}:heartbeat`` (a JSON status that
+expires if the worker stops refreshing it), and it shuts down gracefully, after the
+task in progress, when ``stop`` is pushed to ``worker:{id}:control`` or the process
+receives SIGINT/SIGTERM.
+"""
+
+import json
+import os
+import signal
+import socket
+import threading
+import time
+
+from .tracing import span
+
+CONTROL_STOP = 'stop'
+DEFAULT_HEARTBEAT_INTERVAL = 5.0
+
+
+def control_key(worker_id):
+    return f'worker:{worker_id}:control'
+
+
+def heartbeat_key(worker_id):
+    return f'worker:{worker_id}:heartbeat'
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _task_summary(message):
+    """Short printable form of a task message for the heartbeat."""
+    return message[:200] if isinstance(message, str) else repr(message)[:200]
+
+
+class Heartbeat:
+    """
+    Background thread that periodically publishes a worker's status to Redis.
+
+    Parameters:
+    - r (redis.Redis): Redis connection.
+    - worker_id (str): Worker identifier.
+    - interval (float): Seconds between heartbeats; the key expires after three.
+    """
+
+    def __init__(self, r, worker_id, interval=DEFAULT_HEARTBEAT_INTERVAL):
+        self.r = r
+        self.worker_id = worker_id
+        self.interval = interval
+        self.status = {
+            'worker_id': worker_id,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'started_at': time.time(),
+            'state': 'idle',
+            'current_task': None,
+            'tasks_processed': 0,
+            'tasks_failed': 0,
+        }
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def update(self, **fields):
+        """Change status fields and publish them immediately."""
+        with self._lock:
+            self.status.update(fields)
+        self.publish()
+
+    def publish(self):
+        with self._lock:
+            status = dict(self.status, timestamp=time.time())
+        self.r.set(heartbeat_key(self.worker_id), json.dumps(status),
+                   ex=max(1, int(3 * self.interval)))
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.publish()
+
+    def __enter__(self):
+        self.publish()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        self.update(state='stopped', current_task=None)
+
+
+def list_source(r, task_keys, pop=None):
+    """
+    Build a ``next_task`` callable that pops plain Redis lists.
+
+    Parameters:
+    - r (redis.Redis): Redis connection.
+    - task_keys (list of str): Redis lists the worker takes tasks from.
+    - pop (callable): Blocking pop command, ``r.blpop`` (default) or ``r.brpop``.
+    """
+    pop = pop or r.blpop
+
+    def next_task(timeout):
+        item = pop(list(task_keys), timeout=max(1, int(timeout)))
+        return _decode(item[1]) if item else None
+
+    return next_task
+
+
+def run_daemon(r, worker_id, next_task, handle_task, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL):
+    """
+    Process tasks until a stop message or signal arrives.
+
+    Parameters:
+    - r (redis.Redis): Redis connection.
+    - worker_id (str): Worker identifier.
+    - next_task (callable): ``next_task(timeout)`` returns the next task message, or None
+      if none arrived within ``timeout`` seconds (see ``list_source``).
+    - handle_task (callable): Called with each task message.
+    - heartbeat_interval (float): Seconds between heartbeats and control checks.
+
+    Returns:
+    - int: Number of tasks processed successfully.
+    """
+    stop_requested = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"Worker {worker_id} received signal {signum}, stopping after the current task")
+        stop_requested.set()
+
+    # Signal handlers can only be installed from the main thread; a worker run in a thread
+    # (e.g. the in-process workers of the benchmarks) is stopped by its control list only.
+    previous_handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        previous_handlers = {
+            sig: signal.signal(sig, request_stop) for sig in (signal.SIGINT, signal.SIGTERM)
+        }
+    own_control_key = control_key(worker_id)
+    try:
+        with Heartbeat(r, worker_id, heartbeat_interval) as heartbeat:
+            print(f"Worker {worker_id} running as a daemon")
+            while not stop_requested.is_set():
+                # Control messages are checked before every task so a stop wins over a backlog.
+                if _decode(r.lpop(own_control_key)) == CONTROL_STOP:
+                    print(f"Worker {worker_id} received stop message")
+                    break
+                with span('wait for task'):
+                    message = next_task(heartbeat_interval)
+                if message is None:
+                    continue
+
+                heartbeat.update(state='busy', current_task=_task_summary(message))
+                try:
+                    handle_task(message)
+                except Exception as exc:
+                    # Keep the warm process alive; the failure is visible in the heartbeat.
+                    print(f"Worker {worker_id} failed to process task: {exc!r}")
+                    heartbeat.update(state='idle', current_task=None,
+                                     tasks_failed=heartbeat.status['tasks_failed'] + 1)
+                else:
+                    heartbeat.update(state='idle', current_task=None,
+                                     tasks_processed=heartbeat.status['tasks_processed'] + 1)
+            return heartbeat.status['tasks_processed']
+    finally:
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+
+
+def stop_workers(r, worker_ids):
+    """Ask each daemon worker in ``worker_ids`` to exit after its current task."""
+    for worker_id in worker_ids:
+        r.rpush(control_key(worker_id), CONTROL_STOP)
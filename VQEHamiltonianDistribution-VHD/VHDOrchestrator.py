@@ -1,9 +1,11 @@
 # General imports
 import numpy as np
 import numpy as np
-import redis
-import json
-import time
+import os
+import sys
+import argparse
+import asyncio
+from scipy.optimize import minimize
 
 # Pre-defined ansatz circuit and operator class for Hamiltonian
 from qiskit.circuit.library import EfficientSU2
@@ -13,102 +15,160 @@ from qiskit.quantum_info import SparsePauliOp
 # runtime imports
 from qiskit_aer import AerSimulator
 from qiskit_ibm_runtime import Session, EstimatorV2 as Estimator
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
 
-def complex_to_dict(z):
-    return {"real": z.real, "imag": z.imag}
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.transpile_cache import transpile_ansatz, TranspileCache
+from VQECommon.pauli_grouping import group_qubit_wise_commuting, grouping_statistics
+from VQECommon.lease_queue import LeaseQueue
+from VQECommon.redis_transport import get_redis, get_async_redis
+from VQECommon.async_orchestrator import AsyncResultRouter
+from VQECommon.wire_format import encode_pauli_op
+from VQECommon.bulk_submission import (term_chunk_messages, submit_messages, num_chunks,
+                                       DEFAULT_CHUNK_SIZE, DEFAULT_BATCH_SIZE)
+from VQECommon.evaluation_service import EvaluationClient, DistributedEnergy
+from VQECommon.hamiltonian_store import HamiltonianStore, open_hamiltonian_store, term_range_messages
+from VQECommon.tracing import (enable_tracing, tracing_enabled, span, flow_start, flow_end, trace_fields,
+                               task_key)
 
-def sparse_pauli_op_to_dict(sparse_pauli_op):
-    """Convert a SparsePauliOp to a dictionary."""
-    return {
-        'paulis': sparse_pauli_op.paulis.to_labels(),
-        'coeffs': [complex_to_dict(c) for c in sparse_pauli_op.coeffs.tolist()]
-    }
-    
-class NumpyEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        if isinstance(obj, np.integer):
-            return int(obj)
-        if isinstance(obj, np.floating):
-            return float(obj)
-        return super(NumpyEncoder, self).default(obj)
-    
-def deserialize_optimize_result(json_string):
+TASK_QUEUE = 'vhd:tasks'        # Shared by all workers, each task is leased to one of them
+RESULT_STREAM = 'vhd:result-stream'
+ORCHESTRATOR_GROUP = 'vhd-orchestrator'
+
+def group_hamiltonian(hamiltonian, grouping=None):
     """
-    Deserialize a JSON string back to an OptimizeResult-like dictionary.
-    
-    :param json_string: JSON string of serialized OptimizeResult
-    :return: Dictionary with OptimizeResult-like structure
+    Split the Hamiltonian into the operators that become one task each.
+
+    :param hamiltonian: SparsePauliOp to distribute
+    :param grouping: None for one task per term, or 'greedy'/'coloring' for one task
+        per qubit-wise-commuting group sharing a single measurement basis
+    :return: List of SparsePauliOp, one per task
     """
-    result_dict = json.loads(json_string)
-    
-    # Convert lists back to numpy arrays where appropriate
-    array_attrs = ['x', 'jac']
-    for attr in array_attrs:
-        if attr in result_dict and isinstance(result_dict[attr], list):
-            result_dict[attr] = np.array(result_dict[attr])
-    
-    return result_dict
+    if grouping is None:
+        return list(hamiltonian)
+
+    groups = group_qubit_wise_commuting(hamiltonian, method=grouping)
+    stats = grouping_statistics(hamiltonian, groups)
+    print(f"Grouped {stats['num_terms']} terms into {stats['num_groups']} qubit-wise-commuting groups "
+          f"({grouping}): circuit executions {stats['executions_before']} -> {stats['executions_after']} "
+          f"({stats['reduction_factor']:.2f}x fewer)")
+    for i, group_stats in enumerate(stats['groups']):
+        print(f"Group {i}: {group_stats['size']} terms, basis {group_stats['basis']}, "
+              f"sum |coeff| = {group_stats['coeff_norm']:.4f}")
+    return groups
+
+async def distribute_tasks(r, router, hamiltonian, grouping=None,
+                           chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Push one task per Hamiltonian group, or per chunk of terms, onto the shared task queue.
+
+    Workers pull from the queue as they become free, so any number of workers can take
+    part, fast workers take more tasks, and a task whose worker dies is requeued once
+    its lease expires. Tasks are encoded
+    lazily and sent in batches, so operators with 100k+ terms are submitted quickly and
+    in bounded memory.
+
+    :param r: redis.asyncio client
+    :param router: AsyncResultRouter that will receive the results
+    :param hamiltonian: SparsePauliOp, or HamiltonianStore whose chunks are sent as term
+        ranges that the workers read from the store themselves
+    :param grouping: 'greedy'/'coloring' for one task per qubit-wise-commuting group, or
+        None to slice the terms into tasks of ``chunk_size`` terms each
+    :param batch_size: Tasks sent per round trip
+    :return: Job awaiting one result per task
+    """
+    queue = LeaseQueue(r, TASK_QUEUE)
+    if grouping is None:
+        job = router.expect(range(num_chunks(len(hamiltonian), chunk_size)))
+        if isinstance(hamiltonian, HamiltonianStore):
+            messages = term_range_messages(hamiltonian, chunk_size, job=job.id, **trace_fields())
+        else:
+            messages = term_chunk_messages(hamiltonian, chunk_size, job=job.id, **trace_fields())
+    else:
+        if isinstance(hamiltonian, HamiltonianStore):
+            hamiltonian = hamiltonian.to_operator()
+        groups = group_hamiltonian(hamiltonian, grouping)
+        job = router.expect(range(len(groups)))
+        messages = (encode_pauli_op(group, id=i, job=job.id, **trace_fields()) for i, group in enumerate(groups))
     
-def distribute_tasks(r, hamiltonian, number_of_workers):
-    for i, hamiltonian_term in enumerate(hamiltonian):
-        print(f"Hamiltonian term {hamiltonian_term}")
-        task = {
-            "id": i,
-            "data": sparse_pauli_op_to_dict(hamiltonian_term)
-        }
-        print(f"Pushing task: {json.dumps(task, indent=2)}")
-        worker_id = (i % 5) + 1  # Round-robin distribution
-        r.rpush(f'worker:{worker_id}:tasks_queue', json.dumps(task))
-        print(f"Pushed task {i} to queue \n")
-        
-    # Signal all workers to start
-    for i in range(1, number_of_workers+1):
-        r.rpush(f'worker:{i}:control', 'start')
+    with span('dispatch', job=job.id, tasks=len(job.futures)):
+        if tracing_enabled():
+            for task_id in job.futures:
+                flow_start('task', task_key(job.id, task_id))
+        report = await submit_messages(r, queue.pending_key, messages, batch_size)
+    print(f"Pushed {report['tasks']} tasks ({report['bytes']} bytes in {report['batches']} batches) "
+          f"to the shared queue in {report['seconds']:.3f} s: {report['tasks_per_s']:.0f} tasks/s, "
+          f"{report['mb_per_s']:.1f} MB/s \n")
 
     print(f"All tasks pushed. Waiting for results...")
-   
-def collect_results(r, hamiltonian, number_of_workers):
-    results = {i: [] for i in range(1, number_of_workers + 1)}
-    completed_workers = set()
-    total_tasks = len(hamiltonian)
-    received_results = 0
-    
-    start_time = time.time()
-    while len(completed_workers) < 5 and received_results < total_tasks:
-        for i in range(1, number_of_workers + 1):
-            if i in completed_workers:
-                continue
-            json_result = r.blpop(f'worker:{i}:results', timeout=1)
-        
-            if json_result:
-                # Process result...
-                result_data = json.loads(json_result[1])
-                results[i].append(result_data)
-                received_results += 1
-                print(f"Received result from worker {i}: {json.dumps(result_data, indent=2)}")
-                
-                # Check if this worker has completed all its tasks
-                if r.llen(f'worker:{i}:tasks_queue') == 0 and r.llen(f'worker:{i}:results') == 0:
-                    completed_workers.add(i)
-                    print(f"Worker {i} has completed all tasks")
-            else:
-                print(f"Waiting for results from worker {i}...")
-        
-        # Add a timeout condition
-        if time.time() - start_time > 300:  # 5 minutes timeout
-            print("Timeout reached. Exiting.")
-            break
+    return job
+
+async def requeue_expired_periodically(queue, interval=1.0):
+    """
+    Return tasks of workers that stopped renewing their lease to the queue, every
+    ``interval`` seconds; tasks delivered ``queue.max_deliveries`` times are dead-lettered.
+    """
+    dead = await queue.dead_count()
+    while True:
+        requeued = await queue.requeue_expired()
+        if requeued:
+            print(f"Requeued {requeued} task(s) whose worker stopped renewing its lease")
+        now_dead = await queue.dead_count()
+        if now_dead > dead:
+            print(f"{now_dead - dead} task(s) failed {queue.max_deliveries} times and were moved to "
+                  f"'{queue.dead_key}'")
+            dead = now_dead
+        await asyncio.sleep(interval)
+
+async def collect_results(r, job, timeout=300):
+    """
+    Await the results of ``job`` as they arrive, grouped by the worker that computed them.
+
+    :param r: redis.asyncio client
+    :param job: Job returned by ``distribute_tasks``
+    :param timeout: Seconds to wait for all results
+    """
+    results = {}
+    requeuer = asyncio.create_task(requeue_expired_periodically(LeaseQueue(r, TASK_QUEUE)))
+    try:
+        async for result_data in job.as_completed(timeout=timeout):
+            key = task_key(job.id, result_data['id'])
+            with span('result', task=key):
+                flow_end('result', key)
+                worker_id = str(result_data.get('worker_id'))
+                results.setdefault(worker_id, []).append(result_data)
+                print(f"Received result for task {result_data['id']} from worker {worker_id}: "
+                      f"fun = {result_data['fun']}, nfev = {result_data.get('nfev')}")
+    finally:
+        requeuer.cancel()
     
-    if received_results < total_tasks:
-        print(f"Warning: Only received {received_results} out of {total_tasks} expected results")
+    if job.missing():
+        print(f"Warning: Only received {len(job.futures) - len(job.missing())} out of "
+              f"{len(job.futures)} expected results")
+        queue = LeaseQueue(r, TASK_QUEUE)
+        dead = await queue.dead_count()
+        if dead:
+            print(f"{dead} task(s) that kept failing are in '{queue.dead_key}'")
     
     return results
 
+async def run_distributed(hamiltonian, grouping=None, chunk_size=DEFAULT_CHUNK_SIZE, timeout=300):
+    """Distribute the Hamiltonian to the workers and collect their results in one event loop."""
+    r = get_async_redis()
+    try:
+        async with AsyncResultRouter(r, RESULT_STREAM, ORCHESTRATOR_GROUP) as router:
+            job = await distribute_tasks(r, router, hamiltonian, grouping, chunk_size)
+            return await collect_results(r, job, timeout)
+    finally:
+        await r.aclose()
+
 
 def calculate_total_energy(results):
+    """
+    Sum the separately minimized energies of the tasks.
+
+    Each task minimizes its own terms with its own parameters, so the sum is a lower
+    bound rather than the ground-state energy; use ``minimize_synchronous`` for the latter.
+    """
     total_energy = 0
     with open('final_results.txt', 'w') as f:
         # Flatten the results into a single list of result dictionaries
@@ -127,15 +187,43 @@ def calculate_total_energy(results):
     print(f"All tasks completed. Results saved in 'final_results.txt'")
     print(f"Total Energy: {total_energy}")
     
-def main():
-    number_of_workers = 4
-    r = redis.Redis(host='localhost', port=6379, decode_responses=True)
+def minimize_synchronous(r, ansatz_isa, hamiltonian_isa, grouping='greedy', method='cobyla'):
+    """
+    Run one VQE over shared parameters, with the Hamiltonian groups evaluated by the workers.
+
+    Every optimizer step broadcasts the current parameters, each worker started with
+    ``--evaluate`` evaluates the groups it takes, and the partial expectations are summed
+    into the energy of the full Hamiltonian.
+
+    :param hamiltonian_isa: Hamiltonian with the ansatz layout applied
+    :param grouping: Grouping passed to ``group_hamiltonian``
+    :param method: SciPy minimization method
+    :return: scipy OptimizeResult
+    """
+    groups = group_hamiltonian(hamiltonian_isa, grouping)
+    client = EvaluationClient(r)
+    energy = DistributedEnergy(client, ansatz_isa, groups)
+    x0 = 2 * np.pi * np.random.random(ansatz_isa.num_parameters)
+    try:
+        result = minimize(energy, x0, method=method)
+    finally:
+        client.close()
+    print(f"{energy.stats['steps']} steps over {len(groups)} groups, "
+          f"{energy.stats['seconds'] / max(1, energy.stats['steps']) * 1e3:.1f} ms per step")
+    return result
+
+def main(synchronous=False, method='cobyla', chunk_size=None, hamiltonian_path=None):
+    r = get_redis(decode_responses=False)
     print("Orchestrator started")
     
-    hamiltonian = SparsePauliOp.from_list([("YZ", 0.3980), ("ZI", -0.3980), ("ZZ", -0.0113), ("XX", 0.1810)])
-    print("Hamiltonian type", hamiltonian)
-    print("Hamiltonian Pauli operator data", hamiltonian.paulis)
-    print("Hamiltonian Pauli operator coefficients", hamiltonian.coeffs)
+    if hamiltonian_path is None:
+        hamiltonian = SparsePauliOp.from_list([("YZ", 0.3980), ("ZI", -0.3980), ("ZZ", -0.0113), ("XX", 0.1810)])
+        print("Hamiltonian type", hamiltonian)
+        print("Hamiltonian Pauli operator data", hamiltonian.paulis)
+        print("Hamiltonian Pauli operator coefficients", hamiltonian.coeffs)
+    else:
+        hamiltonian = open_hamiltonian_store(hamiltonian_path)
+        print(f"Hamiltonian store {hamiltonian.path}: {len(hamiltonian)} terms on {hamiltonian.num_qubits} qubits")
     
     ansatz = EfficientSU2(hamiltonian.num_qubits)
     ansatz.decompose().draw("mpl", style="iqp")
@@ -143,16 +231,24 @@ def main():
     print(f"Number of parameters: {num_params}")
     
     backend_passed = AerSimulator()
-    pm = generate_preset_pass_manager(backend=backend_passed, optimization_level=3)
-    ansatz_isa = pm.run(ansatz)
-    hamiltonian_isa = hamiltonian.apply_layout(layout=ansatz_isa.layout)
-    print("hamiltonian_isa type", hamiltonian_isa)
+    ansatz_isa = transpile_ansatz(ansatz, backend_passed, optimization_level=3, cache=TranspileCache(redis_client=r))
     
-    # Distribute tasks
-    distribute_tasks(r, hamiltonian, number_of_workers)
-
-    # Wait for results
-    results = collect_results(r, hamiltonian, number_of_workers)
+    if synchronous:
+        if isinstance(hamiltonian, HamiltonianStore):
+            hamiltonian = hamiltonian.to_operator()
+        hamiltonian_isa = hamiltonian.apply_layout(layout=ansatz_isa.layout)
+        print("hamiltonian_isa type", hamiltonian_isa)
+        result = minimize_synchronous(r, ansatz_isa, hamiltonian_isa, grouping='greedy', method=method)
+        with open('final_results.txt', 'w') as f:
+            f.write(f"Ground state energy = {result.fun}\nParameters = {result.x.tolist()}\n")
+        print(f"Ground state energy: {result.fun}")
+        return
+    
+    # Distribute tasks and wait for results
+    if chunk_size is None:
+        results = asyncio.run(run_distributed(hamiltonian, grouping='greedy'))
+    else:
+        results = asyncio.run(run_distributed(hamiltonian, chunk_size=chunk_size))
     print("All results received")
     
     # Print results
@@ -164,4 +260,21 @@ def main():
 
     
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="VHD orchestrator")
+    parser.add_argument("--synchronous", action="store_true",
+                        help="run one optimizer over shared parameters, evaluating the Hamiltonian "
+                             "groups on workers started with --evaluate at every step")
+    parser.add_argument("--method", default="cobyla", help="SciPy method used with --synchronous")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="send slices of this many terms as tasks instead of qubit-wise-commuting "
+                             "groups, for Hamiltonians with very many terms")
+    parser.add_argument("--hamiltonian", metavar="FILE", default=None,
+                        help="Hamiltonian store directory, or text/OpenFermion file converted into FILE.store "
+                             "(see VQECommon/hamiltonian_store.py); with --chunk-size workers read their "
+                             "terms from the store, which must be on a filesystem they share")
+    parser.add_argument("--trace", metavar="DIR", default=None,
+                        help="write tracing spans of the orchestrator to DIR (see VQECommon/tracing.py)")
+    args = parser.parse_args()
+    if args.trace:
+        enable_tracing(args.trace, "VHD orchestrator")
+    main(args.synchronous, args.method, args.chunk_size, args.hamiltonian)
@@ -1,5 +1,8 @@
 # General imports
 import numpy as np
+import os
+import sys
+import argparse
 
 # SciPy minimizer routine
 from scipy.optimize import minimize
@@ -11,7 +14,12 @@ from qiskit.quantum_info import SparsePauliOp
 # runtime imports
 from qiskit_aer import AerSimulator
 from qiskit_ibm_runtime import Session, EstimatorV2 as Estimator
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.transpile_cache import transpile_ansatz
+from VQECommon.exact_estimator import ExactEstimator
+from VQECommon.executors import EXECUTORS, make_executor
+from VQECommon.strategies import run_hamiltonian_distribution
 
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="qiskit_ibm_runtime")
@@ -35,7 +43,7 @@ def parallel_cost_function_VM(x0, ansatz_isa, hamiltonian_isa, backend_passed):
     print("Initial ansatz in minimization: ", ansatz_isa)
         
     with Session(backend=backend_passed) as session:
-        estimator = Estimator(session=session)
+        estimator = ExactEstimator(Estimator(session=session))
         estimator.options.default_shots = 10000
         
         result = minimize(
@@ -109,8 +117,7 @@ def process_hamiltonian_term(hamiltonian_term):
     print(f"Number of parameters for given Hamiltonian: {num_params}")
     
     backend_passed = AerSimulator()
-    pm = generate_preset_pass_manager(backend=backend_passed, optimization_level=3)
-    ansatz_isa = pm.run(ansatz)
+    ansatz_isa = transpile_ansatz(ansatz, backend_passed, optimization_level=3)
     hamiltonian_isa = hamiltonian_term.apply_layout(layout=ansatz_isa.layout)
     print("hamiltonian_isa type", hamiltonian_isa)
     
@@ -138,10 +145,36 @@ def process_hamiltonian(hamiltonian, number_of_workers):
     
     return results
 
-def main():
+def process_hamiltonian_with_executor(hamiltonian, executor_name, grouping=None):
+    """
+    Minimize all terms (or groups) of the Hamiltonian in parallel on the named execution backend.
+
+    Parameters:
+    - hamiltonian (SparsePauliOp): The Hamiltonian operator.
+    - executor_name (str): 'serial', 'thread', 'process', 'dask' or 'redis'.
+    - grouping (str): None for one task per term, or 'greedy'/'coloring' for one task per
+      qubit-wise-commuting group.
+
+    Returns:
+    - dict: Dictionary of results, one list per task, in the format of ``process_hamiltonian``.
+    """
+    ansatz = EfficientSU2(hamiltonian.num_qubits)
+    backend_passed = AerSimulator()
+    ansatz_isa = transpile_ansatz(ansatz, backend_passed, optimization_level=3)
+    hamiltonian_isa = hamiltonian.apply_layout(layout=ansatz_isa.layout)
+    x0 = 2 * np.pi * np.random.random(ansatz.num_parameters)
+
+    with make_executor(executor_name) as executor:
+        task_results, _ = run_hamiltonian_distribution(executor, ansatz_isa, hamiltonian_isa, x0, grouping)
+    return {i + 1: [dict(result, fun=result['energy'])] for i, result in enumerate(task_results)}
+
+def main(executor_name=None):
     """
     Main function to execute the VQE algorithm, including defining Hamiltonian,
     processing each term, and calculating total energy.
+
+    Parameters:
+    - executor_name (str): Execution backend for the terms; a serial loop if omitted.
     """
     number_of_workers = 4
     
@@ -149,7 +182,10 @@ def main():
     
     print_hamiltonian_details(hamiltonian)
     
-    results = process_hamiltonian(hamiltonian, number_of_workers)
+    if executor_name is not None:
+        results = process_hamiltonian_with_executor(hamiltonian, executor_name)
+    else:
+        results = process_hamiltonian(hamiltonian, number_of_workers)
     
     print("All results received", results)
     
@@ -157,4 +193,8 @@ def main():
     calculate_total_energy(results)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="VHD on a single machine or any execution backend")
+    parser.add_argument("--executor", choices=sorted(EXECUTORS), default=None,
+                        help="execution backend for the Hamiltonian terms; a serial loop if omitted")
+    args = parser.parse_args()
+    main(args.executor)
\ No newline at end of file
@@ -1,11 +1,11 @@
 # General imports
 import numpy as np
-import redis
-import json
 import sys
-# Pre-defined ansatz circuit and operator class for Hamiltonian
+import os
+import argparse
+from contextlib import nullcontext
+# Pre-defined ansatz circuit
 from qiskit.circuit.library import EfficientSU2
-from qiskit.quantum_info import SparsePauliOp
 
 # SciPy minimizer routine
 from scipy.optimize import minimize
@@ -15,28 +15,48 @@ import matplotlib.pyplot as plt
 
 # runtime imports
 from qiskit_aer import AerSimulator
-from qiskit_ibm_runtime import Session, EstimatorV2 as Estimator
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.transpile_cache import transpile_ansatz, TranspileCache
+from VQECommon.worker_daemon import run_daemon, DEFAULT_HEARTBEAT_INTERVAL
+from VQECommon.lease_queue import LeaseQueue
+from VQECommon.redis_transport import get_redis
+from VQECommon.wire_format import encode_optimize_result
+from VQECommon.hamiltonian_store import decode_hamiltonian_task
+from VQECommon.tracing import enable_tracing, span, flow_start, flow_end, queue_wait, task_key
+from VQECommon.checkpoint import Checkpointer, open_checkpoint_store, DEFAULT_CHECKPOINT_EVERY
+from VQECommon.cost_history import CostHistory
+from VQECommon.expectation_cache import open_expectation_cache, DEFAULT_TOLERANCE
+from VQECommon.runtime_estimator import open_estimator
+from VQECommon.host_resources import open_host_resources, WORKERS_PER_HOST_ENV
+from VQECommon.evaluation_service import (serve_evaluations,
+                                          DEFAULT_RECLAIM_AFTER as DEFAULT_EVALUATION_RECLAIM_AFTER)
 
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="qiskit_ibm_runtime")
 
-cost_history_dict = {
-    "prev_vector": None,
-    "iters": 0,
-    "cost_history": [],
-}
+TASK_QUEUE = 'vhd:tasks'        # Shared by all workers, see VHDOrchestrator.distribute_tasks
+RESULT_STREAM = 'vhd:result-stream'
+DEFAULT_FIRST_TASK_TIMEOUT = 180.0  # seconds a worker waits for the orchestrator to push tasks
+DEFAULT_POLL_INTERVAL = 5.0         # seconds between polls while other workers hold leases
 
 def cost_func(params, ansatz, hamiltonian, estimator):
     """Evaluate a single Hamiltonian term in a separate IBM Runtime session"""
-    pub = (ansatz, [hamiltonian], [params])
-    result = estimator.run(pubs=[pub]).result()
-    energy = result[0].data.evs[0]
+    with span('cost_func'):
+        pub = (ansatz, [hamiltonian], [params])
+        result = estimator.run(pubs=[pub]).result()
+        energy = result[0].data.evs[0]
     return energy
 
-def parallel_cost_function_VM(x0, ansatz_isa, hamiltonian_isa, backend_passed):
+def parallel_cost_function_VM(x0, ansatz_isa, hamiltonian_isa, backend_passed, estimator=None, checkpointer=None):
     """
     Evaluate the cost function in parallel for each Hamiltonian term
+
+    A daemon worker passes its long-lived estimator; otherwise a session is opened
+    for this minimization only. With a ``Checkpointer`` the minimization is
+    checkpointed, and resumed if the task already has a checkpoint. The energies of
+    the latest evaluations are returned as the result's ``cost_iterations`` and
+    ``cost_history`` arrays (see ``CostHistory``).
     """
     
     print("----------------- Starting parallel minimization -----------------")
@@ -44,109 +64,251 @@ def parallel_cost_function_VM(x0, ansatz_isa, hamiltonian_isa, backend_passed):
     print("Initial parameters in minimization: ", x0)
     print("Initial ansatz in minimization: ", ansatz_isa)
         
-    with Session(backend=backend_passed) as session:
-        estimator = Estimator(session=session)
-        estimator.options.default_shots = 10000
-        
-        result = minimize(
-            cost_func,
+    minimize_function = checkpointer.minimize if checkpointer is not None else minimize
+    history = CostHistory()
+
+    def recorded_cost_func(params, *args):
+        energy = cost_func(params, *args)
+        # A resumed minimization numbers its evaluations after the checkpointed ones.
+        resumed_from = checkpointer.resumed_from if checkpointer is not None else None
+        history.record(energy, (resumed_from or 0) + len(history))
+        return energy
+
+    with (nullcontext(estimator) if estimator is not None else open_estimator(backend_passed)) as estimator:
+        result = minimize_function(
+            recorded_cost_func,
             x0,
             args=(ansatz_isa, hamiltonian_isa, estimator),
             method="cobyla",
         )
     
     print("----------------- Ending parallel minimization -----------------")
+    result.cost_iterations, result.cost_history = history.retained()
     return result
 
-def process_received_data(data):
-    """Process the received data and convert it to a SparsePauliOp."""
-    print(f"Processing received data: {data}")
-    
-    if isinstance(data, dict) and 'paulis' in data and 'coeffs' in data:
-        paulis = data['paulis']
-        coeffs = [complex(c['real'], c['imag']) for c in data['coeffs']]
-        return SparsePauliOp(paulis, coeffs)
-    elif isinstance(data, list):
-        if all(isinstance(item, (int, float)) for item in data):
-            return data
-        else:
-            return SparsePauliOp.from_list(data)
-    else:
-        raise ValueError(f"Unexpected data format: {type(data)}")
-    
-def numpy_to_python(obj):
-    """Convert numpy types to Python native types."""
-    if isinstance(obj, (np.integer, np.floating, np.bool_)):
-        return obj.item()
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    return obj
-
-def serialize_optimize_result(result):
+class WorkerState:
     """
-    Serialize an OptimizeResult object to a JSON string.
+    Simulator, transpiled circuits and estimator kept warm between tasks.
+
+    Minimizations are checkpointed every ``checkpoint_every`` evaluations (0 disables
+    checkpoints) to Redis, or to ``checkpoint_dir`` if given. Hamiltonian stores named
+    by ``term_range`` tasks stay mapped in ``stores``. The simulator is sized by
+    ``resources`` (``HostResources``) for this worker's share of the host.
     """
-    result_dict = {
-        'x': numpy_to_python(result.x),
-        'fun': numpy_to_python(result.fun),
-        'success': numpy_to_python(result.success),
-        'message': result.message,
-        'nfev': numpy_to_python(result.nfev),
-    }
-
-    optional_attrs = ['nit', 'status', 'jac']
-    for attr in optional_attrs:
-        if hasattr(result, attr):
-            result_dict[attr] = numpy_to_python(getattr(result, attr))
-
-    return json.dumps(result_dict)
-
-def main(worker_id):
-    r = redis.Redis(host='localhost', port=6379, decode_responses=True)
-    print(f"Worker {worker_id} started")
-    
-    print(f"Worker {worker_id} waiting for task...")
-    
-    # Wait for start signal
-    start_signal = r.blpop(f'worker:{worker_id}:control', timeout=180)
-    
-    if not start_signal:
-        print(f"Worker {worker_id} timed out waiting for start signal")
-        return
-    
-    print(f"Worker {worker_id} received start signal")
-    task = r.blpop(f'worker:{worker_id}:tasks_queue', timeout=180)
 
-    if task:
-        print(f"Worker {worker_id} received task")
-        task_data = json.loads(task[1])
-        hamiltonian_term_data = task_data['data']
-        
-        # Process the received data
-        hamiltonian_processed_data = process_received_data(hamiltonian_term_data)
-        
-        ansatz = EfficientSU2(hamiltonian_processed_data.num_qubits)
-        num_params = ansatz.num_parameters
+    def __init__(self, r, estimator=None, checkpoint_every=DEFAULT_CHECKPOINT_EVERY, checkpoint_dir=None,
+                 resources=None):
+        self.resources = resources
+        self.backend_passed = resources.simulator() if resources is not None else AerSimulator()
+        self.transpile_cache = TranspileCache(redis_client=r)
+        self.ansatz_isa = {}
+        self.estimator = estimator
+        self.checkpoint_every = checkpoint_every
+        self.checkpoints = open_checkpoint_store(r, checkpoint_dir) if checkpoint_every else None
+        self.stores = {}
+
+    def get_ansatz_isa(self, num_qubits):
+        if num_qubits not in self.ansatz_isa:
+            if self.resources is not None:
+                self.resources.configure(self.backend_passed, num_qubits)
+            ansatz = EfficientSU2(num_qubits)
+            self.ansatz_isa[num_qubits] = transpile_ansatz(
+                ansatz, self.backend_passed, optimization_level=3, cache=self.transpile_cache
+            )
+        return self.ansatz_isa[num_qubits]
+
+def process_task(r, worker_id, message, state, queue):
+    """
+    Run the minimization for one leased task and acknowledge it together with its result.
+
+    If the task fails it is released at once, so it is retried by the next free worker
+    or dead-lettered once it failed ``queue.max_deliveries`` times, and the error is raised.
+    """
+    try:
+        run_task(r, worker_id, message, state, queue)
+    except Exception:
+        if queue.release(worker_id, message):
+            print(f"Worker {worker_id} released a task it failed on")
+        raise
+
+def run_task(r, worker_id, message, state, queue):
+    if state.resources is not None:
+        state.resources.refresh()
+    with span('task') as task_span:
+        with span('decode', bytes=len(message)):
+            hamiltonian_processed_data, task_data = decode_hamiltonian_task(message, state.stores)
+        key = task_key(task_data.get('job'), task_data['id'])
+        task_span.set(task=key)
+        flow_end('task', key)
+        queue_wait(task_data, key)
+        print(f"Worker {worker_id} received task {task_data['id']}: {len(hamiltonian_processed_data)} terms "
+              f"on {hamiltonian_processed_data.num_qubits} qubits")
         
-        backend_passed = AerSimulator()
-        pm = generate_preset_pass_manager(backend=backend_passed, optimization_level=3)
-        ansatz_isa = pm.run(ansatz)
+        ansatz_isa = state.get_ansatz_isa(hamiltonian_processed_data.num_qubits)
+        num_params = ansatz_isa.num_parameters
         hamiltonian_isa = hamiltonian_processed_data.apply_layout(layout=ansatz_isa.layout)
         
         x0 = 2 * np.pi * np.random.random(num_params)
-        result = parallel_cost_function_VM(x0, ansatz_isa, hamiltonian_isa, backend_passed)
+        checkpointer = None
+        if state.checkpoints is not None:
+            checkpointer = Checkpointer(state.checkpoints, f'vhd:{key}', state.checkpoint_every)
+        with queue.keep_leased(worker_id, message), span('minimize', task=key):
+            result = parallel_cost_function_VM(x0, ansatz_isa, hamiltonian_isa, state.backend_passed, state.estimator,
+                                               checkpointer)
+        if checkpointer is not None and checkpointer.resumed_from is not None:
+            print(f"Worker {worker_id} resumed task {task_data['id']} from a checkpoint after "
+                  f"{checkpointer.resumed_from} evaluations")
         
-        json_result = serialize_optimize_result(result)
-        r.rpush(f'worker:{worker_id}:results', json_result)
-        print(f"Worker {worker_id} pushed result to queue")
-
-        with open(f'worker_output_{worker_id}.txt', 'a') as f:
-            f.write(f"Processed task {task_data['id']}, Result {result}\n")
+        with span('encode', task=key):
+            encoded_result = encode_optimize_result(result, id=task_data['id'], job=task_data.get('job'),
+                                                    worker_id=worker_id)
+        flow_start('result', key)
+        with span('ack', task=key):
+            acknowledged = queue.ack(worker_id, message, RESULT_STREAM, encoded_result)
+    if acknowledged:
+        if checkpointer is not None:
+            checkpointer.clear()
+        print(f"Worker {worker_id} pushed result to stream")
     else:
+        print(f"Worker {worker_id} lost the lease on task {task_data['id']}, result discarded")
+
+    with open(f'worker_output_{worker_id}.txt', 'a') as f:
+        f.write(f"Processed task {task_data['id']}, Result {result}\n")
+
+def main(worker_id, checkpoint_every=DEFAULT_CHECKPOINT_EVERY, checkpoint_dir=None, memo=None,
+         memo_tolerance=DEFAULT_TOLERANCE, adaptive_shots=None, shared_counts=False, workers_per_host=None,
+         first_task_timeout=DEFAULT_FIRST_TASK_TIMEOUT):
+    """
+    Take tasks from the shared queue until no task is pending or leased to any worker.
+
+    The worker waits up to ``first_task_timeout`` seconds for the orchestrator to push
+    tasks. Afterwards it keeps polling while other workers hold leases, so it takes over
+    the task of a worker that crashed once its lease expires.
+
+    One runtime session is kept open for all tasks. ``memo`` ('local' or 'redis')
+    memoizes expectation values across the tasks, see ``VQECommon.expectation_cache``,
+    and ``adaptive_shots`` samples energies with adaptively allocated shots;
+    ``shared_counts`` is passed to ``open_estimator``. The simulators are sized for one
+    of ``workers_per_host`` workers, see ``VQECommon.host_resources``.
+    """
+    r = get_redis(decode_responses=False)
+    queue = LeaseQueue(r, TASK_QUEUE)
+    print(f"Worker {worker_id} started")
+    
+    print(f"Worker {worker_id} waiting for task...")
+    
+    resources = open_host_resources(workers_per_host, r)
+    state = WorkerState(r, checkpoint_every=checkpoint_every, checkpoint_dir=checkpoint_dir, resources=resources)
+    with resources, open_estimator(state.backend_passed, open_expectation_cache(memo, r), memo_tolerance,
+                                   adaptive_shots, shared_counts, resources) as estimator:
+        state.estimator = estimator
+        processed = 0
+        timeout = first_task_timeout
+        while True:
+            with span('wait for task'):
+                message = queue.reserve(worker_id, timeout=timeout)
+            if message is None:
+                if queue.pending_count() or queue.leased_count():
+                    continue
+                break
+            timeout = DEFAULT_POLL_INTERVAL
+            try:
+                process_task(r, worker_id, message, state, queue)
+            except Exception as exc:
+                print(f"Worker {worker_id} failed to process task: {exc!r}")
+                continue
+            processed += 1
+
+    if not processed:
         print(f"Worker {worker_id} timed out waiting for task")
 
-    print(f"Worker {worker_id} finished")
+    print(f"Worker {worker_id} finished after {processed} tasks")
+
+def main_daemon(worker_id, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL, checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+                checkpoint_dir=None, memo=None, memo_tolerance=DEFAULT_TOLERANCE, adaptive_shots=None,
+                shared_counts=False, workers_per_host=None):
+    """
+    Keep the worker running and process tasks until a stop message arrives.
+
+    The simulator, runtime session and transpiled ansatz circuits are created once
+    and reused for every task.
+    """
+    r = get_redis(decode_responses=False)
+    queue = LeaseQueue(r, TASK_QUEUE)
+    print(f"Worker {worker_id} started in daemon mode")
+    
+    resources = open_host_resources(workers_per_host, r)
+    state = WorkerState(r, checkpoint_every=checkpoint_every, checkpoint_dir=checkpoint_dir, resources=resources)
+    with resources, open_estimator(state.backend_passed, open_expectation_cache(memo, r), memo_tolerance,
+                                   adaptive_shots, shared_counts, resources) as estimator:
+        state.estimator = estimator
+        processed = run_daemon(
+            r, worker_id,
+            lambda timeout: queue.reserve(worker_id, timeout=timeout),
+            lambda message: process_task(r, worker_id, message, state, queue),
+            heartbeat_interval=heartbeat_interval,
+        )
+
+    print(f"Worker {worker_id} finished after {processed} tasks")
+
+def main_evaluation_daemon(worker_id, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL,
+                           reclaim_after=DEFAULT_EVALUATION_RECLAIM_AFTER, memo=None, memo_tolerance=DEFAULT_TOLERANCE,
+                           adaptive_shots=None, shared_counts=False, workers_per_host=None):
+    """
+    Evaluate Hamiltonian groups at the parameters broadcast by a synchronous orchestrator
+    (``VHDOrchestrator.py --synchronous``) until a stop message arrives.
+    """
+    r = get_redis(decode_responses=False)
+    print(f"Worker {worker_id} started serving evaluations")
+    
+    resources = open_host_resources(workers_per_host, r)
+    with resources, open_estimator(resources.simulator(), open_expectation_cache(memo, r), memo_tolerance,
+                                   adaptive_shots, shared_counts, resources) as estimator:
+        processed = serve_evaluations(r, worker_id, estimator, heartbeat_interval, reclaim_after)
+
+    print(f"Worker {worker_id} finished after {processed} evaluation chunks")
 
 if __name__ == "__main__":
-    worker_id = sys.argv[1]
-    main(worker_id)
+    parser = argparse.ArgumentParser(description="VHD worker")
+    parser.add_argument("worker_id")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and process tasks until a stop message is received")
+    parser.add_argument("--evaluate", action="store_true",
+                        help="run as a daemon evaluating Hamiltonian groups for a synchronous orchestrator")
+    parser.add_argument("--heartbeat-interval", type=float, default=DEFAULT_HEARTBEAT_INTERVAL)
+    parser.add_argument("--reclaim-after", type=float, default=DEFAULT_EVALUATION_RECLAIM_AFTER,
+                        help="with --evaluate, seconds after which a chunk left unacknowledged by a dead worker "
+                             "is taken over; running chunks are re-claimed every third of it")
+    parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help="evaluations between checkpoints of a running minimization, which a worker "
+                             "taking over the task resumes from (0 disables checkpoints)")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="keep checkpoints in this local directory instead of Redis")
+    parser.add_argument("--memo", choices=["local", "redis"], default=None,
+                        help="memoize expectation values in this worker, or in Redis shared by all workers")
+    parser.add_argument("--memo-tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="parameter vectors equal up to this step share a memoized expectation value")
+    parser.add_argument("--adaptive-shots", metavar="STDERR", type=float, default=None,
+                        help="sample energies instead of computing them exactly, allocating shots across "
+                             "Hamiltonian groups and iterations to reach this standard error")
+    parser.add_argument("--shared-counts", action="store_true",
+                        help="estimate sampled energies from one sampler run per measurement basis, "
+                             "evaluating all terms of the basis from the same counts")
+    parser.add_argument("--workers-per-host", type=int, default=None,
+                        help="workers sharing this machine, whose cores and memory the simulator splits; "
+                             f"${WORKERS_PER_HOST_ENV} or the workers registered in Redis by default")
+    parser.add_argument("--trace", metavar="DIR", default=None,
+                        help="write tracing spans of this worker to DIR (see VQECommon/tracing.py)")
+    args = parser.parse_args()
+    if args.trace:
+        enable_tracing(args.trace, f"VHD worker {args.worker_id}")
+    if args.evaluate:
+        main_evaluation_daemon(args.worker_id, args.heartbeat_interval, args.reclaim_after, memo=args.memo,
+                               memo_tolerance=args.memo_tolerance, adaptive_shots=args.adaptive_shots,
+                               shared_counts=args.shared_counts, workers_per_host=args.workers_per_host)
+    elif args.daemon:
+        main_daemon(args.worker_id, args.heartbeat_interval, args.checkpoint_every, args.checkpoint_dir, args.memo,
+                    args.memo_tolerance, args.adaptive_shots, args.shared_counts, args.workers_per_host)
+    else:
+        main(args.worker_id, args.checkpoint_every, args.checkpoint_dir, args.memo, args.memo_tolerance,
+             args.adaptive_shots, args.shared_counts, args.workers_per_host)
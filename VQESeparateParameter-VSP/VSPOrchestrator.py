@@ -1,14 +1,151 @@
 import numpy as np
-import redis
-import json
 import time
+import os
+import sys
+import argparse
+import asyncio
+import uuid
+from scipy.optimize import minimize
 from qiskit.circuit.library import EfficientSU2
 from qiskit.quantum_info import SparsePauliOp
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
 from qiskit_aer import AerSimulator
 
-def main():
-    r = redis.Redis(host='localhost', port=6379, decode_responses=True)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.transpile_cache import transpile_ansatz, TranspileCache
+from VQECommon.redis_transport import get_redis, get_async_redis, open_async_transport
+from VQECommon.async_orchestrator import AsyncResultRouter
+from VQECommon.wire_format import encode_parameters
+from VQECommon.parameter_shift import GradientService, RedisEvaluator, adam
+from VQECommon.successive_halving import SuccessiveHalving, DEFAULT_MIN_BUDGET, DEFAULT_MAX_BUDGET, DEFAULT_ETA
+from VQECommon.island_model import EliteBoard, DEFAULT_ISLAND_BUDGET, DEFAULT_MIGRATE_EVERY
+
+TASK_STREAM = 'vsp:tasks'
+RESULT_STREAM = 'vsp:results'
+WORKER_GROUP = 'vsp-workers'
+ORCHESTRATOR_GROUP = 'vsp-orchestrator'
+
+def minimize_with_distributed_gradient(r, ansatz_isa, hamiltonian_isa, x0, method):
+    """
+    Run one gradient-based minimization here, with the 2·P parameter-shift circuits of
+    every gradient evaluated by the workers started with ``--evaluate``.
+    """
+    evaluator = RedisEvaluator(r, ansatz_isa, hamiltonian_isa)
+    service = GradientService(ansatz_isa, evaluator)
+    try:
+        result = minimize(service.value_and_gradient, x0, jac=True, method=adam if method == 'adam' else method)
+    finally:
+        evaluator.close()
+    print(f"{method} finished: {service.stats['gradients']} gradients, {service.stats['circuits']} circuits, "
+          f"{service.stats['seconds']:.2f} s waiting for workers")
+    return result
+
+async def run_population(initial_population, timeout=300, **task_fields):
+    """
+    Publish one task per starting point and await their results as they arrive.
+
+    Results are routed by job id, so several populations can run concurrently in one
+    event loop; a task reclaimed from a dead worker may be answered twice, and only the
+    first answer is kept. ``task_fields`` are sent with every task.
+
+    Returns:
+    - dict: Result of every task that finished within ``timeout`` seconds, by task id.
+    """
+    r = get_async_redis()
+    try:
+        tasks = await open_async_transport(TASK_STREAM, WORKER_GROUP, r)
+        async with AsyncResultRouter(r, RESULT_STREAM, ORCHESTRATOR_GROUP) as router:
+            job = router.expect(range(len(initial_population)))
+            await tasks.publish(encode_parameters(initial_param, id=i, job=job.id, **task_fields)
+                                for i, initial_param in enumerate(initial_population))
+            print(f"Pushed {len(initial_population)} tasks to stream. Waiting for results...")
+            
+            start_time = time.perf_counter()
+            async for result in job.as_completed(timeout=timeout):
+                print(f"Received result for task {result['id']} after {time.perf_counter() - start_time:.3f} s")
+            if job.missing():
+                print(f"Timeout reached without results for tasks {job.missing()}")
+            return job.results
+    finally:
+        await r.aclose()
+
+async def run_race(initial_population, number_of_workers, min_budget=DEFAULT_MIN_BUDGET,
+                   max_budget=DEFAULT_MAX_BUDGET, eta=DEFAULT_ETA, timeout=600):
+    """
+    Race the starting points with successive halving instead of running each to completion.
+
+    Every task runs one start for the evaluation budget of one rung (the task's
+    ``maxiter``); as each result arrives the freed worker is given a surviving start to
+    continue or a new start, see ``VQECommon.successive_halving``. ``number_of_workers``
+    tasks are kept running at a time.
+
+    Returns:
+    - dict: Summary from ``SuccessiveHalving.finish``; after a timeout, 'running' lists the
+      starts still running and 'start' is None if no task reported within ``timeout``.
+    """
+    r = get_async_redis()
+    try:
+        tasks = await open_async_transport(TASK_STREAM, WORKER_GROUP, r)
+        async with AsyncResultRouter(r, RESULT_STREAM, ORCHESTRATOR_GROUP) as router:
+            race = SuccessiveHalving(initial_population, min_budget, max_budget, eta)
+            job = router.expect(range(race.num_tasks()))
+            running = {}  # task id -> (start, rung, budget)
+            
+            async def dispatch():
+                payloads = []
+                while len(running) < number_of_workers:
+                    task = race.next_task(len(running))
+                    if task is None:
+                        break
+                    start, rung, initial_param, budget = task
+                    task_id = race.task_id(start, rung)
+                    running[task_id] = (start, rung, budget)
+                    payloads.append(encode_parameters(initial_param, id=task_id, job=job.id, maxiter=budget))
+                    print(f"Start {start}: rung {rung}, {budget} evaluations")
+                if payloads:
+                    await tasks.publish(payloads)
+            
+            deadline = time.perf_counter() + timeout
+            await dispatch()
+            while running:
+                done, _ = await asyncio.wait([job.futures[task_id] for task_id in running],
+                                             timeout=max(0.0, deadline - time.perf_counter()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    print(f"Timeout reached with {len(running)} task(s) still running")
+                    break
+                for future in done:
+                    result = future.result()
+                    start, rung, budget = running.pop(result['id'])
+                    race.report(start, rung, result['energy'], result['params'], result.get('nfev', budget), budget)
+                    print(f"Start {start} finished rung {rung}: energy {result['energy']:.6f}")
+                await dispatch()
+            return race.finish(start for start, _, _ in running.values())
+    finally:
+        await r.aclose()
+
+def run_islands(r, num_params, islands, budget=DEFAULT_ISLAND_BUDGET, migrate_every=DEFAULT_MIGRATE_EVERY,
+                timeout=3600):
+    """
+    Evolve ``islands`` populations on the workers, exchanging elites through one board in Redis.
+
+    Each island is a task with its own random starting mean; the worker that takes it runs
+    a separable CMA-ES (``VQECommon.island_model``) and publishes its best point on the
+    board every ``migrate_every`` generations. Islands never wait for each other.
+
+    Returns:
+    - dict: Result of every island that finished within ``timeout`` seconds, by task id.
+    """
+    board_id = uuid.uuid4().hex
+    initial_population = [2 * np.pi * np.random.random(num_params) for _ in range(islands)]
+    try:
+        return asyncio.run(run_population(initial_population, timeout, island=True, board=board_id,
+                                          maxiter=budget, migrate_every=migrate_every))
+    finally:
+        EliteBoard(r, board_id).clear()
+
+def main(method=None, race=False, starts=None, min_budget=DEFAULT_MIN_BUDGET, max_budget=DEFAULT_MAX_BUDGET,
+         eta=DEFAULT_ETA, islands=None, island_budget=DEFAULT_ISLAND_BUDGET, migrate_every=DEFAULT_MIGRATE_EVERY):
+    r = get_redis(decode_responses=False)
 
     print("Orchestrator started")
     
@@ -22,44 +159,86 @@ def main():
     print(f"Number of parameters: {num_params}")
     
     backend_passed = AerSimulator()
-    pm = generate_preset_pass_manager(backend=backend_passed, optimization_level=3)
-    ansatz_isa = pm.run(ansatz)
+    ansatz_isa = transpile_ansatz(ansatz, backend_passed, optimization_level=3, cache=TranspileCache(redis_client=r))
     hamiltonian_isa = hamiltonian.apply_layout(layout=ansatz_isa.layout)
     
     x0 = 2 * np.pi * np.random.random(num_params)
-    initial_population = [x0 + 0.1 * np.random.randn(len(x0)) for _ in range(number_of_workers)]
+    if method is not None:
+        result = minimize_with_distributed_gradient(r, ansatz_isa, hamiltonian_isa, x0, method)
+        with open('final_results.txt', 'w') as f:
+            f.write(f"{method}: Final energy = {result.fun}, Parameters = {result.x.tolist()}\n")
+        print(f"Final energy {result.fun}. Results saved in 'final_results.txt'")
+        return
     
-    # Push tasks to queue
-    for i, initial_param in enumerate(initial_population):
-        task = {"id": i, "data": initial_param.tolist()}
-        r.lpush('task_queue', json.dumps(task))
-        print(f"Pushed task {i} to queue")
+    if islands:
+        results = run_islands(r, num_params, islands, island_budget, migrate_every)
+        missing = sorted(set(range(islands)) - set(results))
+        if not results:
+            print(f"No island finished before the timeout; islands {missing} are missing")
+            return
+        if missing:
+            print(f"Islands {missing} did not finish before the timeout and are left out")
+        best = min(results.values(), key=lambda result: result['energy'])
+        with open('final_results.txt', 'w') as f:
+            for result in results.values():
+                f.write(f"Island {result['id']}: Final energy = {result['energy']}, "
+                        f"Parameters = {result['params'].tolist()}\n")
+        print(f"Best of {len(results)} islands: energy {best['energy']}, "
+              f"{sum(result['nfev'] for result in results.values())} evaluations in total")
+        return
     
-    print(f"All tasks pushed. Waiting for results...")
+    if race:
+        initial_population = [x0 + 0.1 * np.random.randn(len(x0)) for _ in range(starts or 4 * number_of_workers)]
+        summary = asyncio.run(run_race(initial_population, number_of_workers, min_budget, max_budget, eta))
+        if summary['start'] is None:
+            print(f"No start finished a rung before the timeout; starts {summary['running']} were still running")
+            return
+        with open('final_results.txt', 'w') as f:
+            f.write(f"Start {summary['start']}: Final energy = {summary['energy']}, "
+                    f"Parameters = {summary['params'].tolist()}\n")
+        print(f"Best of {len(initial_population)} starts: energy {summary['energy']} after {summary['tasks']} tasks, "
+              f"{summary['evaluations']} evaluations (at most {summary['full_budget']} without racing); "
+              f"starts per rung {summary['rungs']}, {summary['stopped']} stopped early")
+        return
     
-    # Wait for results
-    results = []
-    start_time = time.time()
-    while len(results) < len(initial_population):
-        result = r.brpop('result_queue', timeout=1)
-        if result:
-            results.append(json.loads(result[1]))
-            print(f"Received result for task {results[-1]['id']}")
-        else:
-            print("Waiting for results...")
-        
-        # Add a timeout condition
-        if time.time() - start_time > 300:  # 5 minutes timeout
-            print("Timeout reached. Exiting.")
-            break
+    initial_population = [x0 + 0.1 * np.random.randn(len(x0)) for _ in range(number_of_workers)]
+    results = asyncio.run(run_population(initial_population))
+    if not results:
+        print("No task finished before the timeout")
+        return
     
     # Process and save final results
     with open('final_results.txt', 'w') as f:
-        for result in results:
+        for result in results.values():
             f.write(f"Task {result['id']}: Final energy = {result['energy']}, "
                     f"Parameters = {result['params']}\n")
     
     print(f"All tasks completed. Results saved in 'final_results.txt'")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="VSP orchestrator")
+    parser.add_argument("--method", default=None,
+                        help="gradient-based optimizer (e.g. L-BFGS-B, BFGS or adam) run here with "
+                             "parameter-shift gradients from the workers; by default independent "
+                             "COBYLA starts are distributed to the workers")
+    parser.add_argument("--race", action="store_true",
+                        help="race the starting points with successive halving, stopping the worst "
+                             "ones after each evaluation-budget rung")
+    parser.add_argument("--starts", type=int, default=None,
+                        help="starting points raced with --race (default 4 per worker)")
+    parser.add_argument("--min-budget", type=int, default=DEFAULT_MIN_BUDGET,
+                        help="evaluations of every start in the first rung")
+    parser.add_argument("--max-budget", type=int, default=DEFAULT_MAX_BUDGET,
+                        help="evaluations of a start that survives every rung")
+    parser.add_argument("--eta", type=int, default=DEFAULT_ETA,
+                        help="keep the best 1/eta of the starts after each rung")
+    parser.add_argument("--islands", type=int, default=None,
+                        help="evolve this many CMA-ES islands on the workers, sharing their best "
+                             "parameters through Redis")
+    parser.add_argument("--island-budget", type=int, default=DEFAULT_ISLAND_BUDGET,
+                        help="energy evaluations of every island")
+    parser.add_argument("--migrate-every", type=int, default=DEFAULT_MIGRATE_EVERY,
+                        help="generations between the exchanges of an island with the others")
+    args = parser.parse_args()
+    main(args.method, args.race, args.starts, args.min_budget, args.max_budget, args.eta, args.islands,
+         args.island_budget, args.migrate_every)
\ No newline at end of file
@@ -1,14 +1,18 @@
 import numpy as np
-import redis
-import json
 import time
+import os
+import sys
 from qiskit.circuit.library import EfficientSU2
 from qiskit.quantum_info import SparsePauliOp
 from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
 from qiskit_aer import AerSimulator
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.redis_transport import open_transport
+from VQECommon.wire_format import decode_optimize_result
+
 def main():
-    r = redis.Redis(host='localhost', port=6379, decode_responses=True)
+    results_stream = open_transport('vsp:results', 'vsp-orchestrator')
     
     print("Orchestrator started")
     hamiltonian = SparsePauliOp.from_list(
@@ -22,14 +26,16 @@ def main():
     initial_population = [x0 + 0.1 * np.random.randn(len(x0)) for _ in range(4)]
         
     # Wait for results
-    results = []
+    results = {}
     start_time = time.time()
     while len(results) < len(initial_population):
-        result = r.brpop('result_queue', timeout=1)
-        if result:
-            results.append(json.loads(result[1]))
-            print(f"Received result for task {results[-1]['id']}")
-        else:
+        entries = results_stream.read('results', count=len(initial_population), timeout=1)
+        for _, payload in entries:
+            result = decode_optimize_result(payload)
+            results.setdefault(result['id'], result)
+            print(f"Received result for task {result['id']}")
+        results_stream.ack(entry_id for entry_id, _ in entries)
+        if not entries:
             print("Waiting for results...")
         
         # Add a timeout condition
@@ -39,7 +45,7 @@ def main():
     
     # Process and save final results
     with open('final_results.txt', 'w') as f:
-        for result in results:
+        for result in results.values():
             f.write(f"Task {result['id']}: Final energy = {result['energy']}, "
                     f"Parameters = {result['params']}\n")
     
@@ -1,10 +1,11 @@
+import os
 import numpy as np
 import redis
 import json
 import time
+import argparse
 from qiskit.circuit.library import EfficientSU2
 from qiskit.quantum_info import SparsePauliOp
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
 from qiskit_aer import AerSimulator
 import sys
 from scipy.optimize import minimize
@@ -13,6 +14,14 @@ from qiskit_ibm_runtime import EstimatorV2 as Estimator
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="qiskit_ibm_runtime")
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.lockstep_population import minimize_population_lockstep
+from VQECommon.transpile_cache import transpile_ansatz
+from VQECommon.exact_estimator import ExactEstimator
+from VQECommon.parameter_shift import GradientService, LocalEvaluator, adam
+from VQECommon.executors import EXECUTORS, make_executor
+from VQECommon.strategies import run_separate_parameters
+
 def define_hamiltonian_and_ansatz():
     """
     Define the Hamiltonian and Ansatz for the VQE algorithm.
@@ -41,25 +50,25 @@ def choose_backend_and_optimize_ansatz(ansatz, hamiltonian):
     - hamiltonian_isa (SparsePauliOp): Optimized Hamiltonian.
     """
     backend_passed = AerSimulator()
-    pm = generate_preset_pass_manager(backend=backend_passed, optimization_level=3)
-    ansatz_isa = pm.run(ansatz)
+    ansatz_isa = transpile_ansatz(ansatz, backend_passed, optimization_level=3)
     hamiltonian_isa = hamiltonian.apply_layout(layout=ansatz_isa.layout)
     return backend_passed, ansatz_isa, hamiltonian_isa
 
-def generate_initial_population(num_params):
+def generate_initial_population(num_params, population_size=4):
     """
     Generate initial population for the parallel minimization.
 
     Parameters:
     - num_params (int): Number of parameters in the ansatz.
+    - population_size (int): Number of starting points to generate.
 
     Returns:
     - initial_population (list of numpy.ndarray): List of initial parameter sets.
     """
     x0 = 2 * np.pi * np.random.random(num_params)
-    return [x0 + 0.1 * np.random.randn(len(x0)) for _ in range(4)]
+    return [x0 + 0.1 * np.random.randn(len(x0)) for _ in range(population_size)]
 
-def perform_minimization_for_population(ansatz_isa, hamiltonian_isa, backend_passed, initial_population):
+def perform_minimization_for_population(ansatz_isa, hamiltonian_isa, backend_passed, initial_population, lockstep=False):
     """
     Perform parallel minimization for each initial parameter set.
 
@@ -68,10 +77,15 @@ def perform_minimization_for_population(ansatz_isa, hamiltonian_isa, backend_pas
     - hamiltonian_isa (SparsePauliOp): Optimized Hamiltonian.
     - backend_passed (AerSimulator): The backend simulator.
     - initial_population (list of numpy.ndarray): List of initial parameter sets.
+    - lockstep (bool): Advance all starts together, with one estimator job per round
+      instead of one job per objective call.
 
     Returns:
     - results (dict): Dictionary of results indexed by iteration.
     """
+    if lockstep:
+        return perform_lockstep_minimization_for_population(ansatz_isa, hamiltonian_isa, backend_passed, initial_population)
+
     results = {}
     for i, initial_param in enumerate(initial_population):
         print(f"Pushed task {i+1}, with initial param {initial_param} to queue")
@@ -80,16 +94,105 @@ def perform_minimization_for_population(ansatz_isa, hamiltonian_isa, backend_pas
         results[f'iteration_{i+1}'] = result
     return results
 
+def perform_lockstep_minimization_for_population(ansatz_isa, hamiltonian_isa, backend_passed, initial_population):
+    """
+    Minimize all initial parameter sets in lockstep over a single session.
+
+    Parameters:
+    - ansatz_isa (QuantumCircuit): Optimized ansatz circuit.
+    - hamiltonian_isa (SparsePauliOp): Optimized Hamiltonian.
+    - backend_passed (AerSimulator): The backend simulator.
+    - initial_population (list of numpy.ndarray): List of initial parameter sets.
+
+    Returns:
+    - results (dict): Dictionary of results indexed by iteration.
+    """
+    print(f"Starting lockstep minimization of {len(initial_population)} starting points")
+
+    with Session(backend=backend_passed) as session:
+        estimator = ExactEstimator(Estimator(session=session))
+        population_results, stats = minimize_population_lockstep(
+            ansatz_isa, hamiltonian_isa, estimator, initial_population
+        )
+
+    print(f"Lockstep minimization finished: {stats['evaluations']} evaluations "
+          f"in {stats['rounds']} estimator jobs")
+
+    results = {}
+    for i, result in enumerate(population_results):
+        print(f"Result {i+1}:  energy = {result['energy']}, evaluations = {result['nfev']}\n")
+        results[f'iteration_{i+1}'] = result
+    return results
+
+def perform_minimization_with_executor(ansatz_isa, hamiltonian_isa, initial_population, executor_name):
+    """
+    Minimize every initial parameter set in parallel on the named execution backend.
+
+    Parameters:
+    - ansatz_isa (QuantumCircuit): Optimized ansatz circuit.
+    - hamiltonian_isa (SparsePauliOp): Optimized Hamiltonian.
+    - initial_population (list of numpy.ndarray): List of initial parameter sets.
+    - executor_name (str): 'serial', 'thread', 'process', 'dask' or 'redis'.
+
+    Returns:
+    - results (dict): Dictionary of results indexed by iteration.
+    """
+    print(f"Minimizing {len(initial_population)} starting points on the {executor_name} executor")
+    with make_executor(executor_name) as executor:
+        population_results = run_separate_parameters(executor, ansatz_isa, hamiltonian_isa, initial_population)
+
+    results = {}
+    for i, result in enumerate(population_results):
+        print(f"Result {i+1}:  energy = {result['energy']}, evaluations = {result['nfev']}\n")
+        results[f'iteration_{i+1}'] = result
+    return results
+
+def perform_gradient_minimization(ansatz_isa, hamiltonian_isa, backend_passed, initial_param, method='L-BFGS-B',
+                                  max_workers=None):
+    """
+    Minimize with a gradient-based optimizer, using parameter-shift gradients whose
+    2·P shifted circuits are evaluated in parallel on a local thread pool.
+
+    Parameters:
+    - ansatz_isa (QuantumCircuit): Optimized ansatz circuit.
+    - hamiltonian_isa (SparsePauliOp): Optimized Hamiltonian.
+    - backend_passed (AerSimulator): The backend simulator.
+    - initial_param (numpy.ndarray): Initial parameters for minimization.
+    - method (str): SciPy method that uses gradients (e.g. 'L-BFGS-B', 'BFGS'), or 'adam'.
+    - max_workers (int): Threads evaluating shifted circuits.
+
+    Returns:
+    - dict: Dictionary containing 'energy', 'params', 'success', 'message' of the minimization result.
+    """
+    with Session(backend=backend_passed) as session:
+        estimator = ExactEstimator(Estimator(session=session))
+        evaluator = LocalEvaluator(ansatz_isa, hamiltonian_isa, estimator, max_workers=max_workers)
+        service = GradientService(ansatz_isa, evaluator)
+        try:
+            result = minimize(service.value_and_gradient, initial_param, jac=True,
+                              method=adam if method == 'adam' else method)
+        finally:
+            evaluator.close()
+
+    print(f"{method} minimization finished: {service.stats['gradients']} gradients, "
+          f"{service.stats['circuits']} circuits, {service.stats['seconds']:.2f} s")
+    return {
+        'energy': float(result.fun),
+        'params': result.x.tolist(),
+        'success': bool(result.success),
+        'message': str(result.message)
+    }
+
 def save_results_to_file(results, filename='vqe_on_single_machine.json'):
     """
-    Save the results to a JSON file.
+    Save the results to a JSON file; cost history arrays are written as lists.
 
     Parameters:
     - results (dict): Dictionary of results to be saved.
     - filename (str): The name of the file where results will be saved.
     """
     with open(filename, 'w') as f:
-        json.dump(results, f, indent=4)
+        json.dump(results, f, indent=4, default=lambda value: value.tolist())
     print(f"All tasks completed. Results saved to '{filename}'")
 
 def cost_func(params, ansatz, hamiltonian, estimator):
@@ -128,7 +231,7 @@ def parallel_minimize_VM(ansatz, hamiltonian, backend_passed, initial_param):
     print("Initial parameters in minimization: ", initial_param)
     
     with Session(backend=backend_passed) as session:
-        estimator = Estimator(session=session)
+        estimator = ExactEstimator(Estimator(session=session))
         
         def objective_function(params):
             return cost_func(params, ansatz, hamiltonian, estimator)
@@ -143,10 +246,14 @@ def parallel_minimize_VM(ansatz, hamiltonian, backend_passed, initial_param):
         'message': str(result.message)  # Ensure message is a string
     }
 
-def main():
+def main(executor_name=None):
     """
     Main function to execute the VQE algorithm, including defining Hamiltonian and Ansatz,
     optimizing Ansatz, performing minimization, and saving results.
+
+    Parameters:
+    - executor_name (str): Execution backend for the population; lockstep minimization
+      in this process if omitted.
     """
     # Define Hamiltonian and Ansatz
     hamiltonian, ansatz = define_hamiltonian_and_ansatz()
@@ -159,10 +266,18 @@ def main():
     initial_population = generate_initial_population(num_params)
     
     # Perform minimization for each initial parameter set
-    results = perform_minimization_for_population(ansatz_isa, hamiltonian_isa, backend_passed, initial_population)
+    if executor_name is not None:
+        results = perform_minimization_with_executor(ansatz_isa, hamiltonian_isa, initial_population, executor_name)
+    else:
+        results = perform_minimization_for_population(ansatz_isa, hamiltonian_isa, backend_passed, initial_population, lockstep=True)
     
     # Write results to file
     save_results_to_file(results)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="VSP on a single machine or any execution backend")
+    parser.add_argument("--executor", choices=sorted(EXECUTORS), default=None,
+                        help="execution backend for the starting points; lockstep minimization in "
+                             "this process if omitted")
+    args = parser.parse_args()
+    main(args.executor)
\ No newline at end of file
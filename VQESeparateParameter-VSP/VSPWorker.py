@@ -1,78 +1,310 @@
-import redis
-import json
+import os
 import sys
+import argparse
+from contextlib import nullcontext
 import numpy as np
 from qiskit.circuit.library import EfficientSU2
 from qiskit.quantum_info import SparsePauliOp
 from scipy.optimize import minimize
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
 from qiskit_aer import AerSimulator
-from qiskit_ibm_runtime import Session
-from qiskit_ibm_runtime import EstimatorV2 as Estimator
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="qiskit_ibm_runtime")
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.lockstep_population import minimize_population_lockstep
+from VQECommon.island_model import EliteBoard, run_island
+from VQECommon.transpile_cache import transpile_ansatz, TranspileCache
+from VQECommon.worker_daemon import run_daemon, DEFAULT_HEARTBEAT_INTERVAL
+from VQECommon.redis_transport import get_redis, open_transport
+from VQECommon.wire_format import decode_parameters, encode_optimize_result
+from VQECommon.checkpoint import Checkpointer, open_checkpoint_store, DEFAULT_CHECKPOINT_EVERY
+from VQECommon.cost_history import CostHistory
+from VQECommon.expectation_cache import open_expectation_cache, DEFAULT_TOLERANCE
+from VQECommon.runtime_estimator import open_estimator
+from VQECommon.host_resources import open_host_resources, WORKERS_PER_HOST_ENV
+from VQECommon.evaluation_service import (serve_evaluations,
+                                          DEFAULT_RECLAIM_AFTER as DEFAULT_EVALUATION_RECLAIM_AFTER)
+
+TASK_STREAM = 'vsp:tasks'
+RESULT_STREAM = 'vsp:results'
+WORKER_GROUP = 'vsp-workers'
+ORCHESTRATOR_GROUP = 'vsp-orchestrator'
+# Workers re-claim the tasks they are running every third of this, so only the tasks
+# of a worker that died go idle this long.
+DEFAULT_RECLAIM_AFTER = 60.0
+
 def cost_func(params, ansatz, hamiltonian, estimator):
     pub = (ansatz, [hamiltonian], [params])
     result = estimator.run(pubs=[pub]).result()
     energy = result[0].data.evs[0]
     return energy
 
-def parallel_minimize_VM(ansatz, hamiltonian, backend_passed, initial_param):
+def parallel_minimize_VM(ansatz, hamiltonian, backend_passed, initial_param, estimator=None, checkpointer=None,
+                         options=None):
     print("----------------- Starting parallel minimization -----------------")
     print("Initial parameters in minimization: ", initial_param)
     
-    with Session(backend=backend_passed) as session:
-        estimator = Estimator(session=session)
+    minimize_function = checkpointer.minimize if checkpointer is not None else minimize
+    history = CostHistory()
+    with (nullcontext(estimator) if estimator is not None else open_estimator(backend_passed)) as estimator:
         
         def objective_function(params):
-            return cost_func(params, ansatz, hamiltonian, estimator)
+            energy = cost_func(params, ansatz, hamiltonian, estimator)
+            # A resumed minimization numbers its evaluations after the checkpointed ones.
+            resumed_from = checkpointer.resumed_from if checkpointer is not None else None
+            history.record(energy, (resumed_from or 0) + len(history))
+            return energy
         
-        result = minimize(objective_function, initial_param, method='cobyla')
+        result = minimize_function(objective_function, initial_param, method='cobyla', options=options)
+        if checkpointer is not None and checkpointer.resumed_from is not None:
+            print(f"Resumed from a checkpoint after {checkpointer.resumed_from} evaluations")
     
     print("----------------- Ending parallel minimization -----------------")
+    cost_iterations, cost_history = history.retained()
     return {
         'energy': float(result.fun),  # Convert to native Python float
         'params': result.x.tolist(),  # Convert NumPy array to list
         'success': bool(result.success),  # Convert NumPy bool to Python bool
-        'message': str(result.message)  # Ensure message is a string
+        'message': str(result.message),  # Ensure message is a string
+        'nfev': int(result.nfev),
+        'cost_iterations': cost_iterations,
+        'cost_history': cost_history,
     }
 
-def main(worker_id):
-    r = redis.Redis(host='localhost', port=6379)
-    print(f"Worker {worker_id} started")
+def parallel_minimize_population_VM(ansatz, hamiltonian, backend_passed, initial_population, estimator=None,
+                                    options=None):
+    print(f"----------------- Starting lockstep minimization of {len(initial_population)} starts -----------------")
     
+    with (nullcontext(estimator) if estimator is not None else open_estimator(backend_passed)) as estimator:
+        results, stats = minimize_population_lockstep(ansatz, hamiltonian, estimator, initial_population,
+                                                      options=options)
+    
+    print(f"Lockstep minimization used {stats['rounds']} estimator jobs for {stats['evaluations']} evaluations")
+    print("----------------- Ending lockstep minimization -----------------")
+    return results
+
+def parallel_island_VM(ansatz, hamiltonian, backend_passed, task_data, r, estimator=None):
+    """
+    Evolve the island described by an island task, exchanging elites through its board in Redis.
+
+    The island is named after its task id, so a worker reclaiming it publishes under the same name.
+    """
+    island = str(task_data['id'])
+    print(f"----------------- Starting island {island} -----------------")
+    
+    options = {key: task_data[key] for key in ('maxiter', 'sigma0', 'popsize', 'migrate_every', 'migrants')
+               if key in task_data}
+    with (nullcontext(estimator) if estimator is not None else open_estimator(backend_passed)) as estimator:
+        result = run_island(ansatz, hamiltonian, estimator, np.array(task_data['data']),
+                            EliteBoard(r, task_data['board']), island, **options)
+    
+    print(f"Island {island} finished after {result['generations']} generations, "
+          f"{result['nfev']} evaluations and {result['immigrants']} immigrants: energy {result['energy']}")
+    return result
+
+def take_tasks(task_stream, consumer, batch_size, timeout=10, reclaim_after=DEFAULT_RECLAIM_AFTER):
+    """
+    Take up to batch_size tasks, preferring ones abandoned by workers that died.
+
+    Returns:
+    - list of (str, dict): (stream entry id, task) pairs; empty if none arrived in time.
+    """
+    entries = task_stream.reclaim(consumer, reclaim_after, count=batch_size)
+    if entries:
+        print(f"Worker {consumer} reclaimed {len(entries)} abandoned task(s)")
+    else:
+        entries = task_stream.read(consumer, count=batch_size, timeout=timeout)
+    tasks = []
+    for entry_id, payload in entries:
+        params, fields = decode_parameters(payload)
+        tasks.append((entry_id, dict(fields, data=params)))
+    return tasks
+
+def prepare_ansatz_and_hamiltonian(r, resources=None):
     hamiltonian = SparsePauliOp.from_list(
         [("YZ", 0.3980), ("ZI", -0.3980), ("ZZ", -0.0113), ("XX", 0.1810)]
     )
     ansatz = EfficientSU2(hamiltonian.num_qubits)
-    backend_passed = AerSimulator()
-    pm = generate_preset_pass_manager(backend=backend_passed, optimization_level=3)
-    ansatz_isa = pm.run(ansatz)
+    backend_passed = resources.simulator(hamiltonian.num_qubits) if resources is not None else AerSimulator()
+    ansatz_isa = transpile_ansatz(ansatz, backend_passed, optimization_level=3, cache=TranspileCache(redis_client=r))
     hamiltonian_isa = hamiltonian.apply_layout(layout=ansatz_isa.layout)
+    return backend_passed, ansatz_isa, hamiltonian_isa
+
+def process_tasks(task_stream, result_stream, worker_id, entries, backend_passed, ansatz_isa, hamiltonian_isa,
+                  estimator=None, checkpoints=None, checkpoint_every=DEFAULT_CHECKPOINT_EVERY, r=None,
+                  reclaim_after=DEFAULT_RECLAIM_AFTER):
+    """
+    Minimize from the starting point of every task and publish the results.
+
+    The tasks' stream entries are re-claimed every ``reclaim_after / 3`` seconds while
+    they run, so however long they take no other worker reclaims them.
+
+    A single task is checkpointed to ``checkpoints`` (a checkpoint store) every
+    ``checkpoint_every`` evaluations if given, so a worker reclaiming it after a crash
+    resumes it; lockstep batches are not checkpointed. A task with a ``maxiter`` field
+    (a rung of ``VSPOrchestrator.py --race``) stops after that many evaluations. Island
+    tasks (``VSPOrchestrator.py --islands``) are evolved one after the other, sharing
+    elites through Redis client ``r``.
+    """
+    tasks = [task_data for _, task_data in entries]
+    print(f"Worker {worker_id} received {len(tasks)} task(s)")
+    initial_population = [np.array(task_data['data']) for task_data in tasks]  # writable copies
+    options = [{'maxiter': int(task_data['maxiter'])} if 'maxiter' in task_data else None for task_data in tasks]
+    checkpointer = None
+    with task_stream.keep_claimed(worker_id, [entry_id for entry_id, _ in entries], reclaim_after / 3):
+        if 'island' in tasks[0]:
+            results = [parallel_island_VM(ansatz_isa, hamiltonian_isa, backend_passed, task_data, r, estimator)
+                       for task_data in tasks]
+        elif len(tasks) == 1:
+            if checkpoints is not None:
+                checkpointer = Checkpointer(checkpoints, f"vsp:{tasks[0].get('job')}:{tasks[0]['id']}",
+                                            checkpoint_every)
+            results = [parallel_minimize_VM(ansatz_isa, hamiltonian_isa, backend_passed, initial_population[0],
+                                            estimator, checkpointer, options[0])]
+        else:
+            results = parallel_minimize_population_VM(ansatz_isa, hamiltonian_isa, backend_passed,
+                                                      initial_population, estimator, options)
     
-    print(f"Worker {worker_id} waiting for a single task...")
-    task = r.brpop('task_queue', timeout=10)
-    if task:
-        print(f"Worker {worker_id} received task")
-        task_data = json.loads(task[1])
-        initial_param = np.array(task_data['data'])
-        result = parallel_minimize_VM(ansatz_isa, hamiltonian_isa, backend_passed, initial_param)
+    payloads = []
+    for task_data, result in zip(tasks, results):
         result['id'] = task_data['id']
+        result['job'] = task_data.get('job')
         
-        # Ensure all numpy types are converted to native Python types
-        result = {k: v.item() if isinstance(v, np.generic) else v for k, v in result.items()}
-        
-        r.lpush('result_queue', json.dumps(result))
-        print(f"Worker {worker_id} pushed result to queue")
+        payloads.append(encode_optimize_result(result))
         
         with open(f'worker_output_{worker_id}.txt', 'a') as f:
             f.write(f"Processed task {task_data['id'], result}\\n")
+    
+    # Results are published before the tasks are acknowledged, so a crash in between
+    # leads to a duplicate result rather than a lost one.
+    result_stream.publish(payloads)
+    task_stream.ack(entry_id for entry_id, _ in entries)
+    if checkpointer is not None:
+        checkpointer.clear()
+    print(f"Worker {worker_id} pushed results for tasks {[task_data['id'] for task_data in tasks]}")
+
+def open_streams(r):
+    return open_transport(TASK_STREAM, WORKER_GROUP, r), open_transport(RESULT_STREAM, ORCHESTRATOR_GROUP, r)
+
+def main(worker_id, batch_size=1, reclaim_after=DEFAULT_RECLAIM_AFTER, checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+         checkpoint_dir=None, memo=None, memo_tolerance=DEFAULT_TOLERANCE, adaptive_shots=None,
+         shared_counts=False, workers_per_host=None):
+    r = get_redis(decode_responses=False)
+    task_stream, result_stream = open_streams(r)
+    print(f"Worker {worker_id} started")
+    
+    resources = open_host_resources(workers_per_host, r)
+    backend_passed, ansatz_isa, hamiltonian_isa = prepare_ansatz_and_hamiltonian(r, resources)
+    
+    print(f"Worker {worker_id} waiting for up to {batch_size} task(s)...")
+    entries = take_tasks(task_stream, worker_id, batch_size, reclaim_after=reclaim_after)
+    if entries:
+        checkpoints = open_checkpoint_store(r, checkpoint_dir) if checkpoint_every else None
+        with resources, open_estimator(backend_passed, open_expectation_cache(memo, r), memo_tolerance,
+                                       adaptive_shots, shared_counts, resources) as estimator:
+            process_tasks(task_stream, result_stream, worker_id, entries, backend_passed, ansatz_isa, hamiltonian_isa,
+                          estimator, checkpoints, checkpoint_every, r, reclaim_after)
     else:
+        resources.close()
         print(f"Worker {worker_id} timed out waiting for task")
 
     print(f"Worker {worker_id} finished")
 
+def main_daemon(worker_id, batch_size=1, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL,
+                reclaim_after=DEFAULT_RECLAIM_AFTER, checkpoint_every=DEFAULT_CHECKPOINT_EVERY, checkpoint_dir=None,
+                memo=None, memo_tolerance=DEFAULT_TOLERANCE, adaptive_shots=None, shared_counts=False,
+                workers_per_host=None):
+    """
+    Keep the worker running and process tasks until a stop message arrives.
+
+    The simulator, runtime session and transpiled ansatz are created once and reused
+    for every task. The simulators are resized before every task if the number of
+    workers on the host has changed.
+    """
+    r = get_redis(decode_responses=False)
+    checkpoints = open_checkpoint_store(r, checkpoint_dir) if checkpoint_every else None
+    task_stream, result_stream = open_streams(r)
+    print(f"Worker {worker_id} started in daemon mode")
+    
+    resources = open_host_resources(workers_per_host, r)
+    backend_passed, ansatz_isa, hamiltonian_isa = prepare_ansatz_and_hamiltonian(r, resources)
+    
+    with resources, open_estimator(backend_passed, open_expectation_cache(memo, r), memo_tolerance,
+                                   adaptive_shots, shared_counts, resources) as estimator:
+        def next_task(timeout):
+            return take_tasks(task_stream, worker_id, batch_size, timeout, reclaim_after) or None
+        
+        def handle_task(entries):
+            resources.refresh()
+            process_tasks(task_stream, result_stream, worker_id, entries, backend_passed, ansatz_isa,
+                          hamiltonian_isa, estimator, checkpoints, checkpoint_every, r, reclaim_after)
+        
+        processed = run_daemon(r, worker_id, next_task, handle_task, heartbeat_interval=heartbeat_interval)
+
+    print(f"Worker {worker_id} finished after {processed} task batches")
+
+def main_evaluation_daemon(worker_id, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL,
+                           reclaim_after=DEFAULT_EVALUATION_RECLAIM_AFTER, memo=None, memo_tolerance=DEFAULT_TOLERANCE,
+                           adaptive_shots=None, shared_counts=False, workers_per_host=None):
+    """
+    Evaluate energy chunks (e.g. parameter-shift gradients) for orchestrators until a stop message arrives.
+
+    The circuit and Hamiltonian of each problem are loaded from Redis the first time one
+    of its chunks arrives and kept for later chunks.
+    """
+    r = get_redis(decode_responses=False)
+    print(f"Worker {worker_id} started serving evaluations")
+    
+    resources = open_host_resources(workers_per_host, r)
+    with resources, open_estimator(resources.simulator(), open_expectation_cache(memo, r), memo_tolerance,
+                                   adaptive_shots, shared_counts, resources) as estimator:
+        processed = serve_evaluations(r, worker_id, estimator, heartbeat_interval, reclaim_after)
+
+    print(f"Worker {worker_id} finished after {processed} evaluation chunks")
+
 if __name__ == "__main__":
-    worker_id = sys.argv[1]
-    main(worker_id)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="VSP worker")
+    parser.add_argument("worker_id")
+    parser.add_argument("batch_size", nargs="?", type=int, default=1,
+                        help="starts minimized together in lockstep")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and process tasks until a stop message is received")
+    parser.add_argument("--evaluate", action="store_true",
+                        help="run as a daemon evaluating energy chunks (gradients, Hamiltonian groups)")
+    parser.add_argument("--heartbeat-interval", type=float, default=DEFAULT_HEARTBEAT_INTERVAL)
+    parser.add_argument("--reclaim-after", type=float, default=None,
+                        help="seconds after which an unacknowledged task of a dead worker is taken over; "
+                             "running tasks are re-claimed every third of it "
+                             f"(default {DEFAULT_RECLAIM_AFTER:g}, or {DEFAULT_EVALUATION_RECLAIM_AFTER:g} "
+                             "with --evaluate)")
+    parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help="evaluations between checkpoints of a running minimization, which a worker "
+                             "reclaiming the task resumes from (0 disables checkpoints)")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="keep checkpoints in this local directory instead of Redis")
+    parser.add_argument("--memo", choices=["local", "redis"], default=None,
+                        help="memoize expectation values in this worker, or in Redis shared by all workers")
+    parser.add_argument("--memo-tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="parameter vectors equal up to this step share a memoized expectation value")
+    parser.add_argument("--adaptive-shots", metavar="STDERR", type=float, default=None,
+                        help="sample energies instead of computing them exactly, allocating shots across "
+                             "Hamiltonian groups and iterations to reach this standard error")
+    parser.add_argument("--shared-counts", action="store_true",
+                        help="estimate sampled energies from one sampler run per measurement basis, "
+                             "evaluating all terms of the basis from the same counts")
+    parser.add_argument("--workers-per-host", type=int, default=None,
+                        help="workers sharing this machine, whose cores and memory the simulator splits; "
+                             f"${WORKERS_PER_HOST_ENV} or the workers registered in Redis by default")
+    args = parser.parse_args()
+    if args.evaluate:
+        main_evaluation_daemon(args.worker_id, args.heartbeat_interval,
+                               args.reclaim_after or DEFAULT_EVALUATION_RECLAIM_AFTER, args.memo, args.memo_tolerance,
+                               args.adaptive_shots, args.shared_counts, args.workers_per_host)
+    elif args.daemon:
+        main_daemon(args.worker_id, args.batch_size, args.heartbeat_interval,
+                    args.reclaim_after or DEFAULT_RECLAIM_AFTER, args.checkpoint_every, args.checkpoint_dir,
+                    args.memo, args.memo_tolerance, args.adaptive_shots, args.shared_counts, args.workers_per_host)
+    else:
+        main(args.worker_id, args.batch_size, args.reclaim_after or DEFAULT_RECLAIM_AFTER, args.checkpoint_every,
+             args.checkpoint_dir, args.memo, args.memo_tolerance, args.adaptive_shots, args.shared_counts,
+             args.workers_per_host)
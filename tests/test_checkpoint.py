@@ -0,0 +1,54 @@
+"""
+Tests of resuming a minimization from the checkpoint of a worker that died.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.checkpoint import Checkpointer, DiskCheckpointStore
+
+
+class WorkerDied(Exception):
+    pass
+
+
+def quadratic(params):
+    return float(np.sum((params - 1.0) ** 2))
+
+
+def test_resume_from_checkpoint(tmp_path):
+    store = DiskCheckpointStore(str(tmp_path))
+    options = {'maxiter': 200}
+    evaluations = []
+
+    def dying_objective(params):
+        if len(evaluations) == 25:
+            raise WorkerDied()
+        evaluations.append(quadratic(params))
+        return evaluations[-1]
+
+    with pytest.raises(WorkerDied):
+        Checkpointer(store, 'task', every=10, interval=3600).minimize(dying_objective, np.zeros(3), options=options)
+
+    resumed = Checkpointer(store, 'task', every=10, interval=3600)
+    first_points = []
+
+    def objective(params):
+        first_points.append(np.array(params))
+        return quadratic(params)
+
+    result = resumed.minimize(objective, np.zeros(3), options=options)
+    assert resumed.resumed_from == 20
+    # The optimizer restarts from the best of the 20 checkpointed evaluations ...
+    assert quadratic(first_points[0]) == min(evaluations[:20])
+    # ... with the remaining budget, and the result counts every evaluation.
+    assert len(first_points) <= options['maxiter'] - 20
+    assert result.nfev == len(first_points) + 20 and result.resumed_from == 20
+    assert result.fun <= min(evaluations[:20])
+
+    resumed.clear()
+    assert resumed.load() is None
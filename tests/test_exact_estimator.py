@@ -0,0 +1,37 @@
+"""
+Tests of the exact statevector engine against Qiskit's reference estimator.
+"""
+
+import os
+import sys
+
+import numpy as np
+from qiskit.circuit.library import EfficientSU2
+from qiskit.primitives import StatevectorEstimator
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.exact_estimator import ExactEstimator
+from VQECommon.wire_format import random_pauli_op
+
+
+def test_matches_statevector_estimator_with_broadcasting():
+    ansatz = EfficientSU2(4, reps=2).decompose()
+    hamiltonians = [random_pauli_op(4, 30, seed=3), random_pauli_op(4, 5, seed=4)]
+    params = np.random.default_rng(5).uniform(0, 2 * np.pi, (3, 1, ansatz.num_parameters))
+    pub = (ansatz, hamiltonians, params)
+
+    exact = ExactEstimator(fallback=None).run([pub]).result()[0].data.evs
+    reference = StatevectorEstimator().run([pub]).result()[0].data.evs
+    assert exact.shape == reference.shape == (3, 2)
+    assert np.allclose(exact, reference, atol=1e-10)
+
+
+def test_wide_circuits_go_to_the_fallback():
+    ansatz = EfficientSU2(3, reps=1)
+    hamiltonian = random_pauli_op(3, 4, seed=6)
+    params = np.full(ansatz.num_parameters, 0.3)
+    estimator = ExactEstimator(StatevectorEstimator(), max_qubits=2)
+    assert not estimator.use_exact(ansatz)
+    evs = estimator.run([(ansatz, [hamiltonian], [params])]).result()[0].data.evs
+    reference = StatevectorEstimator().run([(ansatz, [hamiltonian], [params])]).result()[0].data.evs
+    assert np.allclose(evs, reference)
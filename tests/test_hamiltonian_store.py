@@ -0,0 +1,63 @@
+"""
+Tests of parsing Hamiltonian files into a store and of the term ranges read from it.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from qiskit.quantum_info import SparsePauliOp
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.hamiltonian_store import (write_hamiltonian_store, open_hamiltonian_store, term_range_messages,
+                                         decode_hamiltonian_task, detect_format)
+from VQECommon.wire_format import random_pauli_op
+
+EXPECTED = SparsePauliOp.from_list([("YZI", 0.398), ("IZI", -0.398), ("XXZ", 0.181 + 0.5j)])
+
+
+def _equal(a, b):
+    return (a.paulis == b.paulis).all() and np.array_equal(a.coeffs, b.coeffs)
+
+
+def test_text_file(tmp_path):
+    path = tmp_path / 'h.txt'
+    path.write_text("# label coeff\nYZI 0.398\n\nIZI -0.398\nXXZ 0.181+0.5j\n")
+    assert detect_format(str(path)) == 'text'
+    store = open_hamiltonian_store(str(path))
+    assert store.path.endswith('h.txt.store')
+    assert store.num_qubits == 3 and _equal(store.to_operator(), EXPECTED)
+
+
+def test_openfermion_file(tmp_path):
+    path = tmp_path / 'h.of'
+    # Qiskit labels put qubit 0 last: "YZI" is Z1 Y2.
+    path.write_text("0.398 [Z1 Y2] +\n-0.398 [Z1] +\n(0.181+0.5j) [Z0 X1 X2]\n")
+    assert detect_format(str(path)) == 'openfermion'
+    store = write_hamiltonian_store(str(path), str(tmp_path / 'of.store'), chunk_terms=2)
+    assert store.num_qubits == 3 and _equal(store.to_operator(), EXPECTED)
+
+
+def test_malformed_lines_name_their_line(tmp_path):
+    path = tmp_path / 'bad.txt'
+    path.write_text("YZ 0.1\nYQ 0.2\n")
+    with pytest.raises(ValueError, match='Line 2'):
+        write_hamiltonian_store(str(path), str(tmp_path / 'bad.store'))
+
+
+def test_term_range_slicing(tmp_path):
+    # 11 qubits do not fill the last packed byte.
+    operator = random_pauli_op(11, 23, seed=7)
+    store = write_hamiltonian_store(operator, str(tmp_path / 'random.store'), chunk_terms=5)
+    assert _equal(store.slice(4, 13), operator[4:13])
+
+    stores = {}
+    chunks = []
+    for message in term_range_messages(store, 10, job='j'):
+        terms, fields = decode_hamiltonian_task(message, stores)
+        chunks.append((fields['id'], terms))
+    assert [task_id for task_id, _ in chunks] == [0, 1, 2]
+    assert [len(terms) for _, terms in chunks] == [10, 10, 3]
+    assert all(_equal(terms, operator[10 * task_id:10 * task_id + 10]) for task_id, terms in chunks)
+    assert list(stores) == [store.path]
@@ -0,0 +1,58 @@
+"""
+Tests of lease redelivery and dead-lettering in the shared VHD task queue, on the
+in-memory server (REDIS_URL=memory://).
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')     # the lease queue is a set of Lua scripts
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon import redis_transport
+from VQECommon.redis_transport import get_redis
+from VQECommon.lease_queue import LeaseQueue
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    """A lease queue with short leases on a fresh in-memory server."""
+    monkeypatch.setenv('REDIS_URL', 'memory://')
+    monkeypatch.setattr(redis_transport, '_memory_server', None)
+    return LeaseQueue(get_redis(decode_responses=False), 'test:queue', visibility_timeout=0.05, max_deliveries=3)
+
+
+def test_expired_lease_is_redelivered_to_another_worker(queue):
+    queue.push([b'task'])
+    assert queue.reserve('worker-1') == b'task'
+    time.sleep(0.1)
+    # reserve requeues expired leases before taking a task.
+    assert queue.reserve('worker-2') == b'task'
+    assert not queue.ack('worker-1', b'task')
+    assert queue.ack('worker-2', b'task', 'test:results', b'result')
+    assert queue.pending_count() == queue.leased_count() == queue.dead_count() == 0
+    assert queue.r.xlen('test:results') == 1
+
+
+def test_renewed_lease_is_not_requeued(queue):
+    queue.push([b'task'])
+    message = queue.reserve('worker-1')
+    with queue.keep_leased('worker-1', message):
+        time.sleep(0.15)
+        assert queue.requeue_expired() == 0
+    assert queue.ack('worker-1', message)
+
+
+def test_dead_letter_after_max_deliveries(queue):
+    queue.push([b'poison', b'good'])
+    for delivery in range(queue.max_deliveries):
+        assert queue.reserve(f'worker-{delivery}') == b'poison'
+        time.sleep(0.1)
+        queue.requeue_expired()
+    assert queue.dead_count() == 1 and queue.r.lrange(queue.dead_key, 0, -1) == [b'poison']
+    assert queue.reserve('worker-x') == b'good'
+    assert queue.ack('worker-x', b'good')
+    assert queue.r.hlen(queue.attempts_key) == 0
@@ -0,0 +1,38 @@
+"""
+Tests of the qubit-wise-commuting grouping of Hamiltonian terms.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.pauli_grouping import group_qubit_wise_commuting, grouping_statistics, measurement_basis
+from VQECommon.wire_format import random_pauli_op
+
+
+def _qubit_wise_commute(a, b):
+    both = (a.x | a.z) & (b.x | b.z)
+    return not (both & ((a.x != b.x) | (a.z != b.z))).any()
+
+
+@pytest.mark.parametrize('method', ['greedy', 'coloring'])
+def test_groups_are_qubit_wise_commuting_partitions(method):
+    hamiltonian = random_pauli_op(6, 60, seed=1)
+    groups = group_qubit_wise_commuting(hamiltonian, method)
+    assert sum(len(group) for group in groups) == len(hamiltonian)
+    for group in groups:
+        for i, a in enumerate(group.paulis):
+            assert all(_qubit_wise_commute(a, b) for b in group.paulis[i + 1:])
+    regrouped = sum(groups[1:], groups[0]).simplify()
+    assert np.allclose((regrouped - hamiltonian).simplify().coeffs, 0)
+    assert grouping_statistics(hamiltonian, groups)['num_groups'] == len(groups) < len(hamiltonian)
+
+
+def test_measurement_basis_covers_every_term():
+    group = group_qubit_wise_commuting(random_pauli_op(5, 40, seed=2))[0]
+    basis = measurement_basis(group)
+    for label in group.paulis.to_labels():
+        assert all(p == 'I' or p == q for p, q in zip(label, basis))
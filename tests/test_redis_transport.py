@@ -0,0 +1,89 @@
+"""
+Tests of the Redis transport and the lease queue on the in-memory server (REDIS_URL=memory://).
+
+Run with ``pytest tests`` (not ``python -m pytest`` from the repository root, where the
+top-level random.py would shadow the standard library module).
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')     # the lease queue and claim renewal are Lua scripts
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon import redis_transport
+from VQECommon.redis_transport import get_redis, get_async_redis, open_transport, open_async_transport
+from VQECommon.lease_queue import LeaseQueue
+
+
+@pytest.fixture(autouse=True)
+def memory_redis(monkeypatch):
+    """A fresh in-memory server for every test."""
+    monkeypatch.setenv('REDIS_URL', 'memory://')
+    monkeypatch.setattr(redis_transport, '_memory_server', None)
+
+
+def test_clients_share_the_in_memory_server():
+    get_redis().set('key', 'value')
+    assert get_redis(decode_responses=False).get('key') == b'value'
+
+
+def test_stream_round_trip_and_reclaim():
+    tasks = open_transport('test:tasks', 'workers')
+    tasks.publish([b'a', b'b'])
+    first = tasks.read('worker-1', count=1)
+    assert [payload for _, payload in first] == [b'a']
+    # worker-1 never acknowledges its entry, so worker-2 takes it over.
+    assert tasks.reclaim('worker-2', min_idle=0) == first
+    tasks.ack(entry_id for entry_id, _ in first)
+    assert tasks.pending_count() == 0
+    assert [payload for _, payload in tasks.read('worker-2', count=10)] == [b'b']
+
+
+def test_running_entries_are_kept_claimed():
+    tasks = open_transport('test:tasks', 'workers')
+    tasks.publish([b'long task'])
+    ids = [entry_id for entry_id, _ in tasks.read('worker-1')]
+    with tasks.keep_claimed('worker-1', ids, interval=0.02):
+        time.sleep(0.2)
+        assert tasks.reclaim('worker-2', min_idle=0.1) == []
+    # Only the consumer holding an entry can renew it.
+    assert tasks.renew_claims('worker-2', ids) == 0
+    time.sleep(0.1)
+    assert [entry_id for entry_id, _ in tasks.reclaim('worker-2', min_idle=0.1)] == ids
+
+
+def test_async_transport_sees_sync_results():
+    open_transport('test:results', 'orchestrator').ensure_group()
+    LeaseQueue(get_redis(decode_responses=False), 'test:queue').push([b'task'])
+    queue = LeaseQueue(get_redis(decode_responses=False), 'test:queue')
+    message = queue.reserve('worker-1')
+    assert queue.ack('worker-1', message, 'test:results', b'result')
+
+    async def read_results():
+        r = get_async_redis()
+        transport = await open_async_transport('test:results', 'orchestrator', r)
+        entries = await transport.read('orchestrator', count=10, timeout=1)
+        await r.aclose()
+        return [payload for _, payload in entries]
+
+    assert asyncio.run(read_results()) == [b'result']
+
+
+def test_lease_queue_requeues_expired_and_dead_letters():
+    queue = LeaseQueue(get_redis(decode_responses=False), 'test:queue', visibility_timeout=0.05, max_deliveries=2)
+    queue.push([b'task'])
+    message = queue.reserve('worker-1')
+    assert queue.requeue_expired() == 0
+    time.sleep(0.1)
+    assert queue.requeue_expired() == 1
+    assert queue.pending_count() == 1 and queue.leased_count() == 0
+
+    message = queue.reserve('worker-2')
+    assert queue.release('worker-2', message)
+    assert queue.pending_count() == 0 and queue.dead_count() == 1
+    assert not queue.ack('worker-2', message)
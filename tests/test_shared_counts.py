@@ -0,0 +1,45 @@
+"""
+Tests of shared-count expectation values against the exact statevector engine.
+"""
+
+import os
+import sys
+
+import numpy as np
+from qiskit import QuantumCircuit
+from qiskit.circuit.library import EfficientSU2
+from qiskit.primitives import StatevectorSampler
+from qiskit.quantum_info import SparsePauliOp
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.exact_estimator import ExactEstimator
+from VQECommon.shared_counts import SharedCountsEstimator
+from VQECommon.wire_format import random_pauli_op
+
+
+def test_matches_exact_estimator_within_its_standard_error():
+    ansatz = EfficientSU2(4, reps=1).decompose()
+    hamiltonians = [random_pauli_op(4, 40, seed=8), random_pauli_op(4, 6, seed=9)]
+    params = np.random.default_rng(10).uniform(0, 2 * np.pi, (2, 1, ansatz.num_parameters))
+    pub = (ansatz, hamiltonians, params)
+
+    estimator = SharedCountsEstimator(StatevectorSampler(seed=11))
+    data = estimator.run([pub], precision=0.01).result()[0].data
+    exact = ExactEstimator(fallback=None).run([pub]).result()[0].data.evs
+    assert data.evs.shape == exact.shape == (2, 2)
+    assert (np.abs(data.evs - exact) < 5 * data.stds).all()
+    # Every basis is sampled once per parameter vector for all the terms measured in it.
+    assert estimator.stats['shots'] == estimator.stats['bases'] * 2 * 10000
+    assert estimator.stats['terms'] == 46
+
+
+def test_basis_states_are_estimated_exactly():
+    circuit = QuantumCircuit(3)
+    circuit.x(0)
+    circuit.h(2)
+    # |q2 q1 q0> = |+ 0 1>, an eigenstate of every term; the terms share the basis XZZ.
+    observable = SparsePauliOp.from_list([("XIZ", 1.0), ("IZZ", 0.5), ("XZI", -2.0)])
+    estimator = SharedCountsEstimator(StatevectorSampler(seed=0))
+    data = estimator.run([(circuit, observable)], precision=0.1).result()[0].data
+    assert np.isclose(data.evs, -1.0 - 0.5 - 2.0) and np.isclose(data.stds, 0.0)
+    assert estimator.stats['bases'] == 1
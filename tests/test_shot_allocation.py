@@ -0,0 +1,48 @@
+"""
+Tests of the Neyman shot allocation across Hamiltonian groups.
+"""
+
+import os
+import sys
+
+import numpy as np
+from qiskit.quantum_info import SparsePauliOp
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.shot_allocation import ShotAllocator
+
+
+def _groups():
+    return [SparsePauliOp(['ZZ', 'ZI'], [0.3, -0.1]), SparsePauliOp(['XX'], [0.1])]
+
+
+def test_shots_are_proportional_to_sigma_and_reach_the_stderr():
+    allocator = ShotAllocator(_groups(), initial_stderr=1e-2, min_shots=1)
+    shots, stderr = allocator.allocate()
+    assert stderr == 1e-2
+    assert np.isclose(shots[0] / shots[1], 4.0, rtol=1e-3)
+    sigmas = allocator.sigmas()
+    assert np.sum(sigmas ** 2 / shots) <= stderr ** 2 * (1 + 1e-9)
+    # Splitting the same total evenly would give a larger variance.
+    even = np.full(2, shots.sum() / 2)
+    assert np.sum(sigmas ** 2 / even) > np.sum(sigmas ** 2 / shots)
+
+
+def test_reported_variances_shift_the_shares():
+    allocator = ShotAllocator(_groups(), initial_stderr=1e-2, min_shots=1)
+    shots, _ = allocator.allocate()
+    # The first group turns out to have almost no variance, the second a lot.
+    for _ in range(30):
+        allocator.update(np.array([-0.5]), np.array([[1e-4], [0.1]]) / np.sqrt(shots)[:, None], shots)
+    new_shots, _ = allocator.allocate()
+    assert new_shots[1] > new_shots[0]
+
+
+def test_stderr_tightens_as_the_energies_converge():
+    allocator = ShotAllocator(_groups(), target_stderr=1e-3, initial_stderr=3e-2, window=5)
+    shots, _ = allocator.allocate()
+    for energy in [-0.5, -0.5001, -0.5002, -0.5, -0.5001]:
+        allocator.update(np.array([energy]), np.zeros((2, 1)), shots)
+    tight_shots, stderr = allocator.allocate()
+    assert stderr == 1e-3
+    assert tight_shots.sum() > shots.sum()
@@ -0,0 +1,30 @@
+"""
+Tests of the successive-halving schedule used by ``VSPOrchestrator.py --race``.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.successive_halving import SuccessiveHalving
+
+
+def test_finish_without_results_after_a_timeout():
+    race = SuccessiveHalving([np.zeros(2), np.ones(2)], min_budget=10, max_budget=90)
+    running = [race.next_task()[0], race.next_task()[0]]
+    summary = race.finish(running)
+    assert summary['start'] is None and summary['energy'] is None and summary['params'] is None
+    assert summary['running'] == [0, 1]
+    assert summary['stopped'] == 0
+
+
+def test_finish_reports_the_best_start():
+    race = SuccessiveHalving([np.zeros(2), np.ones(2)], min_budget=10, max_budget=90)
+    for energy in (-1.0, -2.0):
+        start, rung, params, budget = race.next_task()
+        race.report(start, rung, energy, params, budget, budget)
+    summary = race.finish()
+    assert summary['start'] == 1 and summary['energy'] == -2.0
+    assert summary['running'] == [] and summary['stopped'] == 2
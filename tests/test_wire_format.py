@@ -0,0 +1,45 @@
+"""
+Round trips of the binary task and result messages.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy.optimize import OptimizeResult
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from VQECommon.wire_format import (encode_pauli_op, decode_pauli_op, encode_parameters, decode_parameters,
+                                   encode_optimize_result, decode_optimize_result, random_pauli_op)
+
+
+@pytest.mark.parametrize('num_qubits', [1, 8, 13])
+def test_pauli_op_round_trip(num_qubits):
+    # 13 qubits do not fill the last packed byte.
+    operator = random_pauli_op(num_qubits, 50, seed=num_qubits)
+    operator.coeffs[0] = 0.5 - 0.25j
+    decoded, fields = decode_pauli_op(encode_pauli_op(operator, id=7, job='j'))
+    assert fields == {'id': 7, 'job': 'j'}
+    assert decoded.num_qubits == num_qubits
+    assert np.array_equal(decoded.paulis.x, operator.paulis.x)
+    assert np.array_equal(decoded.paulis.z, operator.paulis.z)
+    assert np.array_equal(decoded.coeffs, operator.coeffs)
+
+
+def test_parameters_round_trip():
+    params, fields = decode_parameters(encode_parameters([0.1, 0.2, 0.3], id=1, maxiter=30))
+    assert params.tolist() == [0.1, 0.2, 0.3] and fields == {'id': 1, 'maxiter': 30}
+
+
+def test_optimize_result_round_trip():
+    result = OptimizeResult(x=np.array([1.0, 2.0]), fun=np.float64(-1.5), nfev=12, success=np.bool_(True),
+                            message='done', cost_iterations=np.arange(3), cost_history=[-1.0, -1.2, -1.5],
+                            extra={'dropped': True})
+    decoded = decode_optimize_result(encode_optimize_result(result, id=3, worker_id='w1'))
+    assert decoded['x'].tolist() == [1.0, 2.0] and decoded['fun'] == -1.5
+    assert decoded['nfev'] == 12 and decoded['success'] is True and decoded['message'] == 'done'
+    assert decoded['cost_iterations'].dtype == np.arange(3).dtype
+    assert decoded['cost_history'].tolist() == [-1.0, -1.2, -1.5]
+    assert decoded['id'] == 3 and decoded['worker_id'] == 'w1'
+    assert 'extra' not in decoded